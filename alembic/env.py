@@ -7,14 +7,43 @@ from alembic import context
 # Add project root (parent of alembic/) to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from database import Base  # now resolves correctly
+from database import Base, DATABASE_URL  # now resolves correctly
+import models  # noqa: F401  registers the tables on Base.metadata for autogenerate
 
 config = context.config
 if config.config_file_name:
-    fileConfig(config.config_file_name)
+    # keep uvicorn's loggers alive when migrations run from the app's startup hook
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Same URL as the app (MYSQL_* / DATABASE_URL env), not the one hard-coded in alembic.ini
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 target_metadata = Base.metadata
 
+# Tables managed with raw DDL in their migrations, invisible to autogenerate
+UNMANAGED_TABLES = {"search_documents"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and (name in UNMANAGED_TABLES or name.startswith(tuple(f"{t}_" for t in UNMANAGED_TABLES))):
+        return False
+    return True
+
+
+def foreign_key_violations(connection) -> set:
+    if connection.dialect.name != "sqlite":
+        return set()
+    return set(connection.exec_driver_sql("PRAGMA foreign_key_check").all())
+
+
+def run_checked_migrations(connection) -> None:
+    # Table rebuilds must not orphan child rows; rows that were already dangling do not block the upgrade
+    before = foreign_key_violations(connection)
+    context.run_migrations()
+    orphaned = foreign_key_violations(connection) - before
+    if orphaned:
+        raise RuntimeError(f"migration left {len(orphaned)} rows with dangling foreign keys: {sorted(orphaned)[:10]}")
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
@@ -22,6 +51,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -32,6 +62,17 @@ def run_migrations_offline() -> None:
 
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
+    # main.run_migrations() hands over an open connection (see database.migration_connection)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite", include_object=include_object,
+        )
+        with context.begin_transaction():
+            run_checked_migrations(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -40,11 +81,12 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite", include_object=include_object,
         )
 
         with context.begin_transaction():
-            context.run_migrations()
+            run_checked_migrations(connection)
 
 
 if context.is_offline_mode():
@@ -0,0 +1,159 @@
+"""baseline schema
+
+Matches the tables that Base.metadata.create_all() produced before migrations
+were introduced. Databases created that way are stamped at this revision by
+main.run_migrations() instead of running it.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_baseline"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "customers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("phone", sa.String(20)),
+        sa.Column("email", sa.String(255)),
+        sa.Column("gst", sa.String(50)),
+        sa.Column("latitude", sa.String(500)),
+        sa.Column("longitude", sa.String(500)),
+        sa.Column("address", sa.Text()),
+        sa.Column("private_key", sa.Text()),
+        sa.Column("public_key", sa.Text()),
+        sa.Column("key_name", sa.String(500)),
+    )
+    op.create_index("ix_customers_id", "customers", ["id"])
+
+    op.create_table(
+        "management",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(500), nullable=False),
+        sa.Column("phone", sa.String(20)),
+        sa.Column("email", sa.String(100)),
+        sa.Column("gst", sa.String(500)),
+        sa.Column("latitude", sa.String(500)),
+        sa.Column("longitude", sa.String(500)),
+        sa.Column("address", sa.Text()),
+        sa.Column("private_key", sa.Text()),
+        sa.Column("public_key", sa.Text()),
+        sa.Column("key_name", sa.String(500)),
+    )
+    op.create_index("ix_management_id", "management", ["id"])
+
+    op.create_table(
+        "management_user_model",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(500), nullable=False),
+        sa.Column("username", sa.String(500), nullable=False, unique=True),
+        sa.Column("password", sa.String(500), nullable=False, unique=True),
+        sa.Column("designation", sa.String(800), nullable=False),
+        sa.Column("privilege", sa.String(500), nullable=False),
+        sa.Column("management_id", sa.Integer(), sa.ForeignKey("management.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_management_user_model_id", "management_user_model", ["id"])
+
+    op.create_table(
+        "customer_user_model",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(500), nullable=False),
+        sa.Column("username", sa.String(500), nullable=False, unique=True),
+        sa.Column("password", sa.String(500), nullable=False, unique=True),
+        sa.Column("designation", sa.String(800), nullable=False),
+        sa.Column("privilege", sa.String(500), nullable=False),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_customer_user_model_id", "customer_user_model", ["id"])
+
+    op.create_table(
+        "machine_model",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("machineName", sa.String(500), nullable=False),
+        sa.Column("model_number", sa.String(500), nullable=False, unique=True),
+        sa.Column("description", sa.String(800), nullable=False),
+        sa.Column("default_warranty_months", sa.Integer(), nullable=False),
+        sa.Column("phase", sa.String(20), nullable=False),
+        sa.Column("volts", sa.String(500), nullable=False),
+        sa.Column("amps", sa.String(500), nullable=False),
+        sa.Column("frequency", sa.String(500), nullable=False),
+        sa.Column("image", sa.String(800), nullable=False),
+        sa.Column("sw_version", sa.String(500), nullable=False),
+        sa.Column("pcb_version", sa.String(500), nullable=False),
+        sa.Column("fw_version", sa.String(500), nullable=False),
+        sa.Column("design_version", sa.String(500), nullable=False),
+        sa.Column("make", sa.Integer(), sa.ForeignKey("management.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_machine_model_id", "machine_model", ["id"])
+
+    op.create_table(
+        "serial_numbers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("serial_number", sa.String(500), nullable=False, unique=True),
+        sa.Column("date_of_manufacturing", sa.String(500), nullable=False),
+        sa.Column("additional_warranty_months", sa.String(500), nullable=False),
+        sa.Column("warranty_end_date", sa.String(500), nullable=False),
+        sa.Column("product_warranty", sa.String(500), nullable=False),
+        sa.Column("sw_version", sa.String(500), nullable=False),
+        sa.Column("pcb_version", sa.String(500), nullable=False),
+        sa.Column("fw_version", sa.String(500), nullable=False),
+        sa.Column("design_version", sa.String(500), nullable=False),
+        sa.Column("model_number", sa.Integer(), sa.ForeignKey("machine_model.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_serial_numbers_id", "serial_numbers", ["id"])
+
+    op.create_table(
+        "data_entries",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("functionCode", sa.String(500)),
+        sa.Column("machine_name", sa.String(500)),
+        sa.Column("batch_id", sa.String(500)),
+        sa.Column("batch_name", sa.String(500)),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("machine_id", sa.Integer(), sa.ForeignKey("machine_model.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_data_entries_id", "data_entries", ["id"])
+
+    op.create_table(
+        "machine_details",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("batch_id", sa.Integer()),
+        sa.Column("batch_name", sa.String(500)),
+        sa.Column("machine_name", sa.String(500)),
+        sa.Column("tank_id", sa.Integer()),
+        sa.Column("tank_name", sa.String(500)),
+        sa.Column("request_from", sa.String(500)),
+        sa.Column("request_date_time", sa.String(500)),
+        sa.Column("selected_flow_meter_id", sa.Integer()),
+        sa.Column("selected_out_number", sa.Integer()),
+        sa.Column("ChemRecords", sa.JSON()),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_machine_details_id", "machine_details", ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("machine_details")
+    op.drop_table("data_entries")
+    op.drop_table("serial_numbers")
+    op.drop_table("machine_model")
+    op.drop_table("customer_user_model")
+    op.drop_table("management_user_model")
+    op.drop_table("management")
+    op.drop_table("customers")
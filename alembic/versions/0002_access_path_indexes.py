@@ -0,0 +1,43 @@
+"""indexes for foreign keys and hot access paths
+
+Revision ID: 0002_access_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_access_path_indexes"
+down_revision: Union[str, Sequence[str], None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # customer_id leads so the composite also backs the customers FK on MySQL
+    op.create_index("ix_serial_numbers_customer_id_model_number", "serial_numbers", ["customer_id", "model_number"])
+    op.create_index("ix_serial_numbers_model_number", "serial_numbers", ["model_number"])
+    op.create_index("ix_customer_user_model_customer_id", "customer_user_model", ["customer_id"])
+    op.create_index("ix_management_user_model_management_id", "management_user_model", ["management_id"])
+    op.create_index("ix_machine_details_customer_id", "machine_details", ["customer_id"])
+    op.create_index("ix_data_entries_customer_id", "data_entries", ["customer_id"])
+    op.create_index("ix_data_entries_machine_id", "data_entries", ["machine_id"])
+    op.create_index("ix_machine_model_make", "machine_model", ["make"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_machine_model_make", table_name="machine_model")
+    op.drop_index("ix_data_entries_machine_id", table_name="data_entries")
+    op.drop_index("ix_data_entries_customer_id", table_name="data_entries")
+    op.drop_index("ix_machine_details_customer_id", table_name="machine_details")
+    op.drop_index("ix_management_user_model_management_id", table_name="management_user_model")
+    op.drop_index("ix_customer_user_model_customer_id", table_name="customer_user_model")
+    op.drop_index("ix_serial_numbers_model_number", table_name="serial_numbers")
+    op.drop_index("ix_serial_numbers_customer_id_model_number", table_name="serial_numbers")
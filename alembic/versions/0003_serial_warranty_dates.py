@@ -0,0 +1,115 @@
+"""serial number warranty columns as DATE/INTEGER
+
+The text columns are copied into typed shadow columns, then swapped in.
+warranty_end_date is recomputed from MachineModel.default_warranty_months
+instead of trusting the client-supplied string.
+
+Revision ID: 0003_serial_warranty_dates
+Revises: 0002_access_path_indexes
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from warranty import parse_legacy_date, parse_legacy_int, warranty_end_date
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_serial_warranty_dates"
+down_revision: Union[str, Sequence[str], None] = "0002_access_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 1000
+
+serial_numbers = sa.table(
+    "serial_numbers",
+    sa.column("id", sa.Integer),
+    sa.column("model_number", sa.Integer),
+    sa.column("date_of_manufacturing", sa.String),
+    sa.column("additional_warranty_months", sa.String),
+    sa.column("date_of_manufacturing_new", sa.Date),
+    sa.column("additional_warranty_months_new", sa.Integer),
+    sa.column("warranty_end_date_new", sa.Date),
+)
+machine_model = sa.table(
+    "machine_model",
+    sa.column("id", sa.Integer),
+    sa.column("default_warranty_months", sa.Integer),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("serial_numbers", sa.Column("date_of_manufacturing_new", sa.Date()))
+    op.add_column("serial_numbers", sa.Column("additional_warranty_months_new", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("serial_numbers", sa.Column("warranty_end_date_new", sa.Date()))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                serial_numbers.c.id,
+                serial_numbers.c.date_of_manufacturing,
+                serial_numbers.c.additional_warranty_months,
+                machine_model.c.default_warranty_months,
+            )
+            .select_from(serial_numbers.join(machine_model, machine_model.c.id == serial_numbers.c.model_number))
+            .where(serial_numbers.c.id > last_id)
+            .order_by(serial_numbers.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            manufactured = parse_legacy_date(row.date_of_manufacturing)
+            additional = parse_legacy_int(row.additional_warranty_months)
+            updates.append({
+                "b_id": row.id,
+                "date_of_manufacturing_new": manufactured,
+                "additional_warranty_months_new": additional,
+                "warranty_end_date_new": warranty_end_date(manufactured, row.default_warranty_months, additional),
+            })
+        bind.execute(
+            serial_numbers.update()
+            .where(serial_numbers.c.id == sa.bindparam("b_id"))
+            .values(
+                date_of_manufacturing_new=sa.bindparam("date_of_manufacturing_new"),
+                additional_warranty_months_new=sa.bindparam("additional_warranty_months_new"),
+                warranty_end_date_new=sa.bindparam("warranty_end_date_new"),
+            ),
+            updates,
+        )
+        last_id = rows[-1].id
+
+    with op.batch_alter_table("serial_numbers") as batch_op:
+        batch_op.drop_column("date_of_manufacturing")
+        batch_op.drop_column("additional_warranty_months")
+        batch_op.drop_column("warranty_end_date")
+    with op.batch_alter_table("serial_numbers") as batch_op:
+        batch_op.alter_column("date_of_manufacturing_new", new_column_name="date_of_manufacturing",
+                              existing_type=sa.Date())
+        batch_op.alter_column("additional_warranty_months_new", new_column_name="additional_warranty_months",
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default="0")
+        batch_op.alter_column("warranty_end_date_new", new_column_name="warranty_end_date",
+                              existing_type=sa.Date())
+
+    op.create_index("ix_serial_numbers_warranty_end_date", "serial_numbers", ["warranty_end_date"])
+    op.create_index("ix_serial_numbers_customer_id_warranty_end_date", "serial_numbers",
+                    ["customer_id", "warranty_end_date"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_serial_numbers_customer_id_warranty_end_date", table_name="serial_numbers")
+    op.drop_index("ix_serial_numbers_warranty_end_date", table_name="serial_numbers")
+    with op.batch_alter_table("serial_numbers") as batch_op:
+        batch_op.alter_column("date_of_manufacturing", type_=sa.String(500), existing_type=sa.Date())
+        batch_op.alter_column("additional_warranty_months", type_=sa.String(500), existing_type=sa.Integer(),
+                              server_default=None, existing_server_default="0")
+        batch_op.alter_column("warranty_end_date", type_=sa.String(500), existing_type=sa.Date())
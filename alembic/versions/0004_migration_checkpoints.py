@@ -0,0 +1,36 @@
+"""checkpoint table for chunked online backfills
+
+Revision ID: 0004_migration_checkpoints
+Revises: 0003_serial_warranty_dates
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_migration_checkpoints"
+down_revision: Union[str, Sequence[str], None] = "0003_serial_warranty_dates"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "migration_checkpoints",
+        sa.Column("name", sa.String(191), primary_key=True),
+        sa.Column("table_name", sa.String(191), nullable=False),
+        sa.Column("last_pk", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rows_done", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("finished", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("migration_checkpoints")
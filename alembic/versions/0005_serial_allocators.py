@@ -0,0 +1,36 @@
+"""per-model serial number allocators
+
+Revision ID: 0005_serial_allocators
+Revises: 0004_migration_checkpoints
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_serial_allocators"
+down_revision: Union[str, Sequence[str], None] = "0004_migration_checkpoints"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "serial_allocators",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("machine_model_id", sa.Integer(), sa.ForeignKey("machine_model.id", ondelete="CASCADE"),
+                  nullable=False, unique=True),
+        sa.Column("pattern", sa.String(200), nullable=False),
+        sa.Column("next_seq", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.create_index("ix_serial_allocators_id", "serial_allocators", ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("serial_allocators")
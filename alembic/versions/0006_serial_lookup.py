@@ -0,0 +1,59 @@
+"""denormalized serial_lookup read model
+
+Revision ID: 0006_serial_lookup
+Revises: 0005_serial_allocators
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_serial_lookup"
+down_revision: Union[str, Sequence[str], None] = "0005_serial_allocators"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "serial_lookup",
+        sa.Column("serial_id", sa.Integer(), sa.ForeignKey("serial_numbers.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("serial_number", sa.String(500), nullable=False, unique=True),
+        sa.Column("date_of_manufacturing", sa.Date()),
+        sa.Column("additional_warranty_months", sa.Integer()),
+        sa.Column("warranty_end_date", sa.Date()),
+        sa.Column("product_warranty", sa.String(500)),
+        sa.Column("sw_version", sa.String(500)),
+        sa.Column("pcb_version", sa.String(500)),
+        sa.Column("fw_version", sa.String(500)),
+        sa.Column("design_version", sa.String(500)),
+        sa.Column("machine_model_id", sa.Integer(), nullable=False),
+        sa.Column("model_number", sa.String(500)),
+        sa.Column("machineName", sa.String(500)),
+        sa.Column("image", sa.String(800)),
+        sa.Column("customer_id", sa.Integer(), nullable=False),
+        sa.Column("customer_name", sa.String(255)),
+    )
+    op.create_index("ix_serial_lookup_machine_model_id", "serial_lookup", ["machine_model_id"])
+    op.create_index("ix_serial_lookup_customer_id", "serial_lookup", ["customer_id"])
+    op.execute(
+        "INSERT INTO serial_lookup (serial_id, serial_number, date_of_manufacturing, additional_warranty_months, "
+        "warranty_end_date, product_warranty, sw_version, pcb_version, fw_version, design_version, "
+        "machine_model_id, model_number, machineName, image, customer_id, customer_name) "
+        "SELECT s.id, s.serial_number, s.date_of_manufacturing, s.additional_warranty_months, "
+        "s.warranty_end_date, s.product_warranty, s.sw_version, s.pcb_version, s.fw_version, s.design_version, "
+        "m.id, m.model_number, m.machineName, m.image, c.id, c.name "
+        "FROM serial_numbers s "
+        "JOIN machine_model m ON m.id = s.model_number "
+        "JOIN customers c ON c.id = s.customer_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("serial_lookup")
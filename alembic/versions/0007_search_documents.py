@@ -0,0 +1,32 @@
+"""full-text search_documents index (FTS5 on SQLite, FULLTEXT on MySQL)
+
+Revision ID: 0007_search_documents
+Revises: 0006_serial_lookup
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from search import get_backend, rebuild_documents
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_search_documents"
+down_revision: Union[str, Sequence[str], None] = "0006_serial_lookup"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    get_backend(bind.dialect.name).create(bind)
+    rebuild_documents(bind)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    get_backend(bind.dialect.name).drop(bind)
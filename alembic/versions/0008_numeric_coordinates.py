@@ -0,0 +1,91 @@
+"""numeric coordinates and geohash index for customers and management
+
+Revision ID: 0008_numeric_coordinates
+Revises: 0007_search_documents
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from geo import encode, parse_coordinate
+from online_migrations import backfill_in_chunks, reset_checkpoint
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_numeric_coordinates"
+down_revision: Union[str, Sequence[str], None] = "0007_search_documents"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(f"alembic.{revision}")
+
+TABLES = ("customers", "management")
+LIMITS = {"latitude": 90, "longitude": 180}
+
+
+def numeric_transform(table_name):
+    # Parsed (or blank) text is cleared; text that does not parse stays in <column>_raw
+    def to_numeric(row):
+        values = {}
+        for name, limit in LIMITS.items():
+            raw = getattr(row, name)
+            try:
+                number = parse_coordinate(raw)
+                if number is not None and not -limit <= number <= limit:
+                    raise ValueError(f"{number} is outside -{limit}..{limit}")
+            except ValueError as e:
+                logger.warning("%s id=%s: %s %r not converted, kept in %s_raw (%s)",
+                               table_name, row.id, name, raw, name, e)
+                values[f"{name}_new"] = None
+                continue
+            values[f"{name}_new"] = number
+            values[name] = None
+        latitude, longitude = values["latitude_new"], values["longitude_new"]
+        values["geohash"] = encode(latitude, longitude) if latitude is not None and longitude is not None else None
+        return values
+    return to_numeric
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table_name in TABLES:
+        op.add_column(table_name, sa.Column("latitude_new", sa.Float()))
+        op.add_column(table_name, sa.Column("longitude_new", sa.Float()))
+        op.add_column(table_name, sa.Column("geohash", sa.String(12)))
+
+        # Small tables: the chunks run inside this migration's transaction
+        backfill_in_chunks(op.get_bind(), f"0008_numeric_coordinates.{table_name}", table_name,
+                           columns=["latitude", "longitude"], transform=numeric_transform(table_name), pause=0)
+
+        # The old text columns are kept as *_raw, NULL except where a value could not be converted
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.alter_column("latitude", new_column_name="latitude_raw", existing_type=sa.String(500))
+            batch_op.alter_column("longitude", new_column_name="longitude_raw", existing_type=sa.String(500))
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.alter_column("latitude_new", new_column_name="latitude", existing_type=sa.Float())
+            batch_op.alter_column("longitude_new", new_column_name="longitude", existing_type=sa.Float())
+        op.create_index(f"ix_{table_name}_geohash", table_name, ["geohash"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name in TABLES:
+        op.drop_index(f"ix_{table_name}_geohash", table_name=table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column("geohash")
+            batch_op.alter_column("latitude", type_=sa.String(500), existing_type=sa.Float())
+            batch_op.alter_column("longitude", type_=sa.String(500), existing_type=sa.Float())
+        table = sa.table(table_name, *[sa.column(name) for name in
+                                       ("latitude", "longitude", "latitude_raw", "longitude_raw")])
+        for name in LIMITS:
+            op.execute(table.update().where(table.c[f"{name}_raw"].isnot(None))
+                       .values({name: table.c[f"{name}_raw"]}))
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column("latitude_raw")
+            batch_op.drop_column("longitude_raw")
+        # A later upgrade has to convert the text again
+        reset_checkpoint(op.get_bind(), f"0008_numeric_coordinates.{table_name}")
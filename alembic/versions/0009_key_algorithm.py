@@ -0,0 +1,36 @@
+"""key algorithm per tenant key pair
+
+Revision ID: 0009_key_algorithm
+Revises: 0008_numeric_coordinates
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_key_algorithm"
+down_revision: Union[str, Sequence[str], None] = "0008_numeric_coordinates"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("customers", "management")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Every existing key pair is RSA-2048. A constant default is an instant ADD COLUMN
+    # on MySQL 8, so no backfill is needed.
+    for table_name in TABLES:
+        op.add_column(table_name, sa.Column("key_algorithm", sa.String(32), nullable=False,
+                                            server_default="rsa-2048"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name in TABLES:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column("key_algorithm")
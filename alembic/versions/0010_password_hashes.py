@@ -0,0 +1,50 @@
+"""scrypt password hashes for users, no unique index on password
+
+Revision ID: 0010_password_hashes
+Revises: 0009_key_algorithm
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import backfill_in_chunks
+from passwords import PREFIX, hash_password
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_password_hashes"
+down_revision: Union[str, Sequence[str], None] = "0009_key_algorithm"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("customer_user_model", "management_user_model")
+# Names the baseline's unnamed UNIQUE (password) so batch mode on SQLite can drop it
+NAMING_CONVENTION = {"uq": "uq_%(table_name)s_%(column_0_name)s"}
+
+
+def drop_password_unique(table_name):
+    for constraint in sa.inspect(op.get_bind()).get_unique_constraints(table_name):
+        if constraint["column_names"] == ["password"]:
+            with op.batch_alter_table(table_name, naming_convention=NAMING_CONVENTION) as batch_op:
+                batch_op.drop_constraint(constraint["name"] or f"uq_{table_name}_password", type_="unique")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table_name in TABLES:
+        drop_password_unique(table_name)
+        # Small tables: the chunks run inside this migration's transaction
+        backfill_in_chunks(op.get_bind(), f"0010_password_hashes.{table_name}", table_name,
+                           columns=["password"], where=~sa.column("password").startswith(PREFIX),
+                           transform=lambda row: {"password": hash_password(row.password)}, pause=0)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Hashes stay hashes; only the index comes back
+    for table_name in TABLES:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.create_unique_constraint(f"uq_{table_name}_password", ["password"])
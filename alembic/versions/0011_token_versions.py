@@ -0,0 +1,34 @@
+"""token version per user, so issued access tokens can be revoked
+
+Revision ID: 0011_token_versions
+Revises: 0010_password_hashes
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_token_versions"
+down_revision: Union[str, Sequence[str], None] = "0010_password_hashes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("customer_user_model", "management_user_model")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Constant default, so an instant ADD COLUMN on MySQL 8 and no backfill
+    for table_name in TABLES:
+        op.add_column(table_name, sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name in TABLES:
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column("token_version")
@@ -0,0 +1,165 @@
+"""Signed access tokens for customer and management users.
+
+A token has three base64url parts: header, claims and signature. The
+signature is an HMAC-SHA256 over header and claims with a server-side secret
+(AUTH_TOKEN_SECRET) that no endpoint ever returns; tenant keys are readable
+by tenant admins, so they cannot vouch for a token. Every process of a
+deployment must share the secret. Without one, each process generates its
+own and its tokens die with it.
+
+Every user row carries a token_version, copied into the "ver" claim. Bumping
+it (password, privilege, username or tenant change) revokes every token
+issued before; deleting the user does the same. verify_token reads the
+current version from the database.
+
+validated_tokens holds tokens that already passed verification, so a
+repeated token costs one dict lookup and an expiry check. forget_user
+evicts a revoked user's tokens from this process at once; other processes
+keep accepting them for at most VALIDATED_TOKEN_SECONDS, which is why that
+window is short.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+from sqlalchemy.orm import Session
+
+from lru import LRUCache
+from models import Customer, CustomerUserModel, Management, ManagementUserModel
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "3600"))
+VALIDATED_TOKEN_SECONDS = int(os.getenv("VALIDATED_TOKEN_SECONDS", "10"))
+TOKEN_CACHE_SIZE = 4096
+TOKEN_ALGORITHM = "HS256"
+
+# user kind -> (user model, tenant model, tenant foreign key)
+USER_KINDS = {
+    "customer": (CustomerUserModel, Customer, "customer_id"),
+    "management": (ManagementUserModel, Management, "management_id"),
+}
+
+validated_tokens = LRUCache(TOKEN_CACHE_SIZE)  # token -> (claims, cached until)
+
+
+def _token_secret() -> bytes:
+    secret = os.getenv("AUTH_TOKEN_SECRET")
+    if secret:
+        return secret.encode()
+    logger.warning("AUTH_TOKEN_SECRET is not set; using a per-process secret, tokens will not survive a restart")
+    return secrets.token_bytes(32)
+
+
+TOKEN_SECRET = _token_secret()
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _signature(signing_input: str) -> bytes:
+    return hmac.new(TOKEN_SECRET, signing_input.encode(), hashlib.sha256).digest()
+
+
+def find_user(session_factory, kind: str, username: str):
+    user_model, _, tenant_column = USER_KINDS[kind]
+    db: Session = session_factory()
+    try:
+        return db.query(
+            user_model.id, user_model.username, user_model.password, user_model.privilege,
+            user_model.token_version, getattr(user_model, tenant_column).label("tenant_id"),
+        ).filter(user_model.username == username).first()
+    finally:
+        db.close()
+
+
+def store_password_hash(session_factory, kind: str, user_id: int, password_hash: str):
+    user_model = USER_KINDS[kind][0]
+    db: Session = session_factory()
+    try:
+        db.query(user_model).filter(user_model.id == user_id).update({"password": password_hash},
+                                                                     synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def issue_token(kind: str, user, ttl: int = ACCESS_TOKEN_TTL_SECONDS) -> dict:
+    now = int(time.time())
+    header = {"alg": TOKEN_ALGORITHM, "typ": "JWT"}
+    claims = {"sub": user.id, "kind": kind, "tenant": user.tenant_id, "username": user.username,
+              "privilege": user.privilege, "ver": user.token_version, "iat": now, "exp": now + ttl}
+    signing_input = f"{_b64encode(json.dumps(header).encode())}.{_b64encode(json.dumps(claims).encode())}"
+    return {"access_token": f"{signing_input}.{_b64encode(_signature(signing_input))}", "token_type": "bearer",
+            "expires_in": ttl}
+
+
+def _check_not_revoked(session_factory, claims: dict):
+    user_model, _, tenant_column = USER_KINDS[claims["kind"]]
+    db: Session = session_factory()
+    try:
+        user = db.query(user_model.username, user_model.token_version,
+                        getattr(user_model, tenant_column).label("tenant_id")) \
+            .filter(user_model.id == claims.get("sub")).first()
+    finally:
+        db.close()
+    # Username and tenant also guard against a deleted user's id being reused
+    if user is None or user.token_version != claims.get("ver") or user.username != claims.get("username") \
+            or user.tenant_id != claims.get("tenant"):
+        raise TokenError("token revoked")
+
+
+def verify_token(session_factory, token: str) -> dict:
+    now = time.time()
+    cached = validated_tokens.get(token)
+    if cached is not None:
+        claims, cached_until = cached
+        if now < cached_until:
+            return claims
+        validated_tokens.pop(token)
+    try:
+        header_part, claims_part, signature_part = token.split(".")
+        header = json.loads(_b64decode(header_part))
+        signature = _b64decode(signature_part)
+    except (ValueError, binascii.Error):
+        raise TokenError("malformed token")
+    # Only HS256 is ever issued, so the header cannot choose how the token is checked
+    if not isinstance(header, dict) or header.get("alg") != TOKEN_ALGORITHM or \
+            not hmac.compare_digest(signature, _signature(f"{header_part}.{claims_part}")):
+        raise TokenError("invalid signature")
+    try:
+        claims = json.loads(_b64decode(claims_part))
+    except (ValueError, binascii.Error):
+        raise TokenError("malformed token")
+    if not isinstance(claims, dict) or claims.get("kind") not in USER_KINDS:
+        raise TokenError("malformed token")
+    if not isinstance(claims.get("exp"), int) or claims["exp"] <= now:
+        raise TokenError("token expired")
+    _check_not_revoked(session_factory, claims)
+    validated_tokens.put(token, (claims, min(claims["exp"], now + VALIDATED_TOKEN_SECONDS)))
+    return claims
+
+
+def forget_tenant(kind: str, tenant_id: int):
+    # After a tenant delete: drop every token its users had validated
+    validated_tokens.pop_where(lambda token, cached: cached[0]["kind"] == kind and cached[0]["tenant"] == tenant_id)
+
+
+def forget_user(kind: str, user_id: int):
+    # After the user's token_version was bumped or the user deleted
+    validated_tokens.pop_where(lambda token, cached: cached[0]["kind"] == kind and cached[0]["sub"] == user_id)
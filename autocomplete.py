@@ -0,0 +1,163 @@
+import threading
+from bisect import bisect_left, insort
+
+from models import Customer, MachineModel, SerialNumbers
+
+LOAD_CHUNK_SIZE = 10000
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class PrefixIndex:
+    # Sorted list of (normalized key, item id); a prefix query is one bisect plus
+    # a short forward walk. With word_prefixes every word of the label is a key
+    # too, so "ltd" finds "Textiles Ltd". Per process, like serial_filter.
+
+    def __init__(self, word_prefixes: bool = False):
+        self.word_prefixes = word_prefixes
+        self._entries = []
+        self._items = {}  # item id -> (label, keys)
+        self._lock = threading.Lock()
+        self._loading = False
+        self._pending = {}  # item id -> label, or None when removed, while a rebuild runs
+
+    def __len__(self):
+        return len(self._items)
+
+    def _keys(self, label: str):
+        key = normalize(label)
+        if not self.word_prefixes:
+            return [key]
+        words = key.split(" ")
+        return list(dict.fromkeys(" ".join(words[i:]) for i in range(len(words))))
+
+    def _remove_locked(self, item_id):
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return
+        for key in item[1]:
+            index = bisect_left(self._entries, (key, item_id))
+            if index < len(self._entries) and self._entries[index] == (key, item_id):
+                del self._entries[index]
+
+    def add(self, item_id, label):
+        if not label:
+            return
+        with self._lock:
+            if self._loading:
+                self._pending[item_id] = label
+            self._remove_locked(item_id)
+            keys = self._keys(label)
+            self._items[item_id] = (label, keys)
+            for key in keys:
+                insort(self._entries, (key, item_id))
+
+    def add_many(self, items):
+        # Bulk imports: one merge of the sorted new entries instead of an insort per item
+        labels = {item_id: label for item_id, label in items if label}
+        if not labels:
+            return
+        with self._lock:
+            if self._loading:
+                self._pending.update(labels)
+            new_entries = []
+            for item_id, label in labels.items():
+                self._remove_locked(item_id)
+                keys = self._keys(label)
+                self._items[item_id] = (label, keys)
+                new_entries.extend((key, item_id) for key in keys)
+            new_entries.sort()
+            merged = []
+            start = 0
+            for entry in new_entries:
+                index = bisect_left(self._entries, entry, start)
+                merged += self._entries[start:index]
+                merged.append(entry)
+                start = index
+            merged += self._entries[start:]
+            self._entries = merged
+
+    def remove(self, item_id):
+        with self._lock:
+            if self._loading:
+                self._pending[item_id] = None
+            self._remove_locked(item_id)
+
+    def start_loading(self):
+        with self._lock:
+            self._loading = True
+            self._pending = {}
+
+    def load(self, items):
+        # Bulk (re)build: one sort instead of an insort per item; writes made since
+        # start_loading() win over the snapshot that was read from the DB
+        labels = dict(items)
+        with self._lock:
+            labels.update(self._pending)
+            entries = []
+            index = {}
+            for item_id, label in labels.items():
+                if not label:
+                    continue
+                keys = self._keys(label)
+                index[item_id] = (label, keys)
+                entries.extend((key, item_id) for key in keys)
+            entries.sort()
+            self._entries = entries
+            self._items = index
+            self._pending = {}
+            self._loading = False
+
+    def search(self, prefix: str, limit: int = 10):
+        prefix = normalize(prefix)
+        results = []
+        seen = set()
+        with self._lock:
+            index = bisect_left(self._entries, (prefix,))
+            while index < len(self._entries) and len(results) < limit:
+                key, item_id = self._entries[index]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append({"id": item_id, "label": self._items[item_id][0]})
+                index += 1
+        return results
+
+
+class AutocompleteIndexes:
+    def __init__(self):
+        # serial suggestions are keyed by the serial number itself (see /serial/by_number)
+        self.serial = PrefixIndex()
+        self.model = PrefixIndex()
+        self.customer = PrefixIndex(word_prefixes=True)
+        self.ready = False
+
+    def kinds(self):
+        return {"serial": self.serial, "model": self.model, "customer": self.customer}
+
+    def rebuild(self, session_factory, chunk_size: int = LOAD_CHUNK_SIZE):
+        for index in self.kinds().values():
+            index.start_loading()
+        db = session_factory()
+        try:
+            self.model.load(db.query(MachineModel.id, MachineModel.model_number).all())
+            self.customer.load(db.query(Customer.id, Customer.name).all())
+            serials = []
+            last_id = 0
+            while True:
+                rows = db.query(SerialNumbers.id, SerialNumbers.serial_number) \
+                    .filter(SerialNumbers.id > last_id).order_by(SerialNumbers.id).limit(chunk_size).all()
+                if not rows:
+                    break
+                serials.extend((serial_number, serial_number) for _, serial_number in rows)
+                last_id = rows[-1][0]
+            self.serial.load(serials)
+        finally:
+            db.close()
+        self.ready = True
+
+
+autocomplete_indexes = AutocompleteIndexes()
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -8,8 +10,49 @@ MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "password")
 MYSQL_DB = os.getenv("MYSQL_DB", "fastapi_db")
 MYSQL_HOST = os.getenv("MYSQL_HOST", "db")  # db is service name in docker-compose
 
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+# DATABASE_URL overrides the MySQL settings (e.g. sqlite:///./test.db for local runs)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}",
+)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only honours ON DELETE CASCADE when foreign keys are switched on per connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", enable_sqlite_foreign_keys)
+
+
+@contextmanager
+def migration_connection(bind=None):
+    # Batch migrations rebuild a SQLite table as copy, DROP, rename. With foreign keys on,
+    # the DROP runs every ON DELETE CASCADE and empties the child tables, so migrations
+    # run with them off (the pragma is ignored inside a transaction, hence the commit)
+    # and alembic/env.py checks for orphaned rows instead.
+    with (bind or engine).connect() as connection:
+        if connection.dialect.name != "sqlite":
+            yield connection
+            return
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.commit()
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+            connection.commit()
+
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: write endpoints answer from the objects they just wrote
+# instead of reloading every row with a second SELECT after commit()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
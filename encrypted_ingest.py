@@ -0,0 +1,179 @@
+"""Hybrid public-key/AES decryption for /submit/encrypted.
+
+Controllers send three base64 fields:
+- encrypted_key: for RSA tenants, a fresh AES key wrapped with the tenant's
+  public key (OAEP). For P-256 and x25519 tenants, an ephemeral public key
+  the AES key is derived from (see tenant_keys.unwrap_key).
+- iv: its length picks the mode. A 16-byte IV means AES-CBC with PKCS7
+  padding; a 12-byte nonce means AES-GCM with the tag appended to the
+  ciphertext.
+- encrypted_data: the JSON submission, encrypted with the AES key.
+
+The unwrap costs up to a millisecond of CPU per request, so it runs in a
+process pool. Requests that arrive within BATCH_WINDOW_SECONDS of each other
+go to a worker as one batch. Each worker keeps an LRU of parsed private keys,
+so a tenant's PEM is parsed once per worker, not once per request. The API
+process only caches the PEMs (tenant_pems), so it does not query the
+database on every request.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cryptography.hazmat.primitives import hashes, padding as sym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from lru import LRUCache
+from tenant_keys import load_private_key, unwrap_key
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+BATCH_WINDOW_SECONDS = 0.002
+MAX_BATCH_SIZE = 64
+KEY_CACHE_SIZE = 256
+OAEP_HASHES = {"sha256": hashes.SHA256, "sha1": hashes.SHA1}
+
+
+class DecryptionError(Exception):
+    pass
+
+
+# --- worker processes -------------------------------------------------------
+
+_parsed_keys = LRUCache(KEY_CACHE_SIZE)
+
+
+def _private_key(key_id: str, private_pem: str):
+    key = _parsed_keys.get(key_id)
+    if key is None:
+        key = load_private_key(private_pem)
+        _parsed_keys.put(key_id, key)
+    return key
+
+
+def _b64(value: str) -> bytes:
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("fields must be base64")
+
+
+def decrypt(key_id: str, key_algorithm: str, private_pem: str, encrypted_key: str, iv: str, encrypted_data: str,
+            oaep_hash: str = "sha256") -> bytes:
+    aes_key = unwrap_key(_private_key(key_id, private_pem), key_algorithm, _b64(encrypted_key), OAEP_HASHES[oaep_hash])
+    nonce = _b64(iv)
+    ciphertext = _b64(encrypted_data)
+    if len(nonce) == 12:
+        return AESGCM(aes_key).decrypt(nonce, ciphertext, None)
+    if len(nonce) == 16:
+        decryptor = Cipher(algorithms.AES(aes_key), modes.CBC(nonce)).decryptor()
+        padded = decryptor.update(ciphertext) + decryptor.finalize()
+        unpadder = sym_padding.PKCS7(128).unpadder()
+        return unpadder.update(padded) + unpadder.finalize()
+    raise ValueError("iv must be 12 (AES-GCM) or 16 (AES-CBC) bytes")
+
+
+def decrypt_batch(items: list) -> list:
+    # One task per batch; a bad payload fails only its own slot
+    results = []
+    for item in items:
+        try:
+            results.append((True, decrypt(*item)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}" if str(e) else type(e).__name__))
+    return results
+
+
+# --- API process ------------------------------------------------------------
+
+# customer id -> (key id, key algorithm, private PEM); dropped when the tenant's keys change
+tenant_pems = LRUCache(KEY_CACHE_SIZE)
+
+
+def key_id(customer_id: int, private_pem: str) -> str:
+    # Changes with the PEM, so workers never use a parsed key from before a rotation
+    return f"{customer_id}:{hashlib.sha256(private_pem.encode()).hexdigest()[:16]}"
+
+
+class DecryptBatcher:
+    # Lives on the event loop thread; only start()/shutdown() run elsewhere
+
+    def __init__(self, workers: int = INGEST_WORKERS, window: float = BATCH_WINDOW_SECONDS,
+                 max_batch: int = MAX_BATCH_SIZE):
+        self.workers = workers
+        self.window = window
+        self.max_batch = max_batch
+        self._executor = None
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def decrypt(self, item: tuple) -> bytes:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        ok, result = await future
+        if not ok:
+            raise DecryptionError(result)
+        return result
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        # Without a started pool (tests, scripts) the batch runs on the default thread pool
+        executor = self._executor
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                executor, decrypt_batch, [item for item, _ in batch])
+        except BrokenProcessPool as e:
+            # A worker died; replace the pool so later batches do not fail too
+            if self._executor is executor:
+                self._executor = None
+                self.start()
+            results = [(False, str(e))] * len(batch)
+        except Exception as e:
+            results = [(False, str(e))] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._executor is not None,
+            "workers": self.workers,
+            "batches": self.batches,
+            "decrypted": self.items,
+            "average_batch": round(self.items / self.batches, 2) if self.batches else 0,
+            "cached_tenant_keys": len(tenant_pems),
+        }
+
+
+decrypt_batcher = DecryptBatcher()
@@ -0,0 +1,159 @@
+"""Geohash grid index for customer/management coordinates.
+
+Rows carry a geohash of their coordinates in an indexed column. A radius query
+becomes a handful of geohash prefix range scans covering the bounding box,
+refined by exact haversine distance in Python.
+"""
+import math
+import re
+from typing import Optional
+
+from sqlalchemy import and_, event, or_
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5 m cells
+EARTH_RADIUS_KM = 6371.0088
+# Same sphere as haversine_km(), so the prefilter box never cuts into the exact circle
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+MAX_COVER_CELLS = 16
+COORDINATE_RE = re.compile(r"([NSEW])?\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*°?\s*([NSEW])?", re.IGNORECASE)
+
+
+def parse_coordinate(value) -> Optional[float]:
+    # Decimal degrees as older clients stored them: "12.97", "-12.97", "12.97 S", "S 12.97",
+    # "77.59°E". S and W are negative. None for blank input, ValueError for anything else;
+    # the range check is the caller's, it differs for latitude and longitude.
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if not text:
+        return None
+    match = COORDINATE_RE.fullmatch(text)
+    if match is None or (match.group(1) and match.group(3)):
+        raise ValueError(f"not a decimal-degree coordinate: {value!r}")
+    number = float(match.group(2))
+    hemisphere = (match.group(1) or match.group(3) or "").upper()
+    if hemisphere in ("S", "W"):
+        if number < 0:
+            raise ValueError(f"negative coordinate with a {hemisphere} suffix: {value!r}")
+        number = -number
+    return number
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if coordinate >= mid:
+            value = value << 1 | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    # (height, width) of a geohash cell in degrees
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float):
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    if latitude - d_lat <= -90.0 or latitude + d_lat >= 90.0:
+        # The circle covers a pole: every longitude is in range
+        return max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat), longitude - 180.0, longitude + 180.0
+    # Widest longitude reached on the circle (it lies poleward of the centre, so wider than
+    # radius / (km per degree * cos(latitude)) suggests)
+    angular = radius_km / EARTH_RADIUS_KM
+    d_lon = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(math.radians(latitude)))))
+    return latitude - d_lat, latitude + d_lat, longitude - d_lon, longitude + d_lon
+
+
+def covering_prefixes(latitude: float, longitude: float, radius_km: float) -> list[str]:
+    # Finest precision whose cells cover the bounding box in at most MAX_COVER_CELLS cells
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        lat_cells = range(math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height) + 1)
+        lon_cells = range(math.floor((min_lon + 180) / width), math.floor((max_lon + 180) / width) + 1)
+        if len(lat_cells) * len(lon_cells) <= MAX_COVER_CELLS or precision == 1:
+            break
+    lon_count = round(360.0 / width)
+    lat_count = round(180.0 / height)
+    prefixes = set()
+    for lat_index in lat_cells:
+        lat_index = min(lat_index, lat_count - 1)
+        for lon_index in lon_cells:
+            lon_index %= lon_count  # wraps across the antimeridian
+            prefixes.add(encode(-90 + (lat_index + 0.5) * height, -180 + (lon_index + 0.5) * width, precision))
+    return sorted(prefixes)
+
+
+def prefix_filter(geohash_column, prefixes):
+    # "prefix <= geohash < prefix + '{'" is an index range scan on both MySQL and SQLite
+    return or_(*[and_(geohash_column >= prefix, geohash_column < prefix + "{") for prefix in prefixes])
+
+
+def nearby(query, model, latitude: float, longitude: float, radius_km: float, limit: int = None):
+    candidates = query.filter(prefix_filter(model.geohash, covering_prefixes(latitude, longitude, radius_km))).all()
+    hits = []
+    for row in candidates:
+        distance = haversine_km(latitude, longitude, row.latitude, row.longitude)
+        if distance <= radius_km:
+            hits.append((distance, row))
+    hits.sort(key=lambda hit: hit[0])
+    return hits[:limit] if limit else hits
+
+
+def nearest(query, model, latitude: float, longitude: float, k: int, start_radius_km: float = 5.0):
+    # Grow the search circle until it holds k rows; everything inside the circle was
+    # scanned, so its k closest rows are the global k nearest
+    radius = start_radius_km
+    while True:
+        hits = nearby(query, model, latitude, longitude, radius, k)
+        if len(hits) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+            return hits
+        radius *= 4
+
+
+def geohash_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return encode(latitude, longitude)
+
+
+def _set_geohash(mapper, connection, target):
+    # Statement-level UPDATEs skip these listeners and set geohash_for() themselves
+    target.geohash = geohash_for(target.latitude, target.longitude)
+
+
+def register(*models):
+    for model in models:
+        event.listen(model, "before_insert", _set_geohash)
+        event.listen(model, "before_update", _set_geohash)
@@ -0,0 +1,99 @@
+"""Idempotency-Key handling for create endpoints.
+
+A client that retries a POST with the same Idempotency-Key gets the first
+response replayed instead of the write running again. A retry that arrives
+while the first attempt is still running waits for it rather than racing it.
+Reusing a key with a different payload is refused.
+
+Entries are keyed by endpoint, caller tenant and Idempotency-Key, so tenants
+cannot replay each other's responses.
+
+The cache is per process, like dashboard_store. Across workers, retries are
+still safe: machine models upsert on model_number (upserts.py), and a serial
+create that finds an identical row returns it instead of failing.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+MAX_IDEMPOTENCY_ENTRIES = 10000
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Entry:
+    def __init__(self, payload_hash: str):
+        self.payload_hash = payload_hash
+        self.done = threading.Event()
+        self.succeeded = False
+        self.result = None
+        self.expires_at = None  # set once the result is stored
+
+
+class IdempotencyCache:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = MAX_IDEMPOTENCY_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict_locked(self, now: float):
+        for key in [key for key, entry in self._entries.items()
+                    if entry.expires_at is not None and entry.expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            oldest = next((key for key, entry in self._entries.items() if entry.expires_at is not None), None)
+            if oldest is None:
+                break
+            del self._entries[oldest]
+
+    def run(self, key, payload, produce):
+        """Return (result, replayed). `produce` runs at most once per key while its result is cached;
+        if it raises, nothing is cached and the next attempt runs it again."""
+        payload_hash = fingerprint(payload)
+        while True:
+            with self._lock:
+                self._evict_locked(time.monotonic())
+                entry = self._entries.get(key)
+                owner = entry is None
+                if owner:
+                    entry = _Entry(payload_hash)
+                    self._entries[key] = entry
+            if entry.payload_hash != payload_hash:
+                raise IdempotencyConflict(key)
+            if owner:
+                break
+            entry.done.wait()
+            if entry.succeeded:
+                return entry.result, True
+            # the first attempt failed and was dropped; try again as the owner
+
+        try:
+            result = produce()
+        except BaseException:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.done.set()
+            raise
+        entry.result = result
+        entry.succeeded = True
+        with self._lock:
+            entry.expires_at = time.monotonic() + self.ttl
+        entry.done.set()
+        return result, False
+
+
+idempotency_cache = IdempotencyCache()
@@ -0,0 +1,129 @@
+"""Size-bounded disk cache for on-demand image renders (/images/{machine_id}).
+
+A render is keyed by its source file (path, mtime, size) and the requested
+box and format. A new upload changes the key, so cached renders never need
+invalidating. The key also serves as the strong ETag.
+
+Entries are evicted least recently used once the cache grows past
+IMAGE_CACHE_BYTES. The LRU order is rebuilt from file mtimes at startup,
+and hits touch their file. Concurrent requests for the same render share
+one job (single-flight). Renders run in images.image_processor, so a busy
+pool answers 429 rather than queueing without bound.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "cache/images")
+IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+
+def render_key(source: str, width, height, image_format: str) -> str:
+    stat = os.stat(source)
+    raw = f"{os.path.abspath(source)}:{stat.st_mtime_ns}:{stat.st_size}:{width or 0}x{height or 0}:{image_format}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class DiskCache:
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}  # file name -> asyncio.Future of the running render
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # requests that waited on another request's render
+        self.evictions = 0
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+            self._bytes = sum(self._entries.values())
+            self._loaded = True
+        self._evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _hit(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._entries:
+                return False
+            self._entries.move_to_end(name)
+            self.hits += 1
+        try:
+            os.utime(self.path(name))  # keeps the LRU order across restarts
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._entries.pop(name, 0)
+            return False
+        return True
+
+    def _add(self, name: str):
+        size = os.path.getsize(self.path(name))
+        with self._lock:
+            self._bytes += size - self._entries.get(name, 0)
+            self._entries[name] = size
+            self._entries.move_to_end(name)
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                name, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    async def get_or_render(self, name: str, render) -> str:
+        # render(dest_path) -> awaitable; runs once per name however many requests wait on it
+        if not self._loaded:
+            self.load()
+        if self._hit(name):
+            return self.path(name)
+        in_flight = self._in_flight.get(name)
+        if in_flight is None:
+            self.misses += 1
+            in_flight = asyncio.ensure_future(self._render(name, render))
+            self._in_flight[name] = in_flight
+            in_flight.add_done_callback(lambda _: self._in_flight.pop(name, None))
+        else:
+            self.coalesced += 1
+        await asyncio.shield(in_flight)
+        return self.path(name)
+
+    async def _render(self, name: str, render):
+        await render(self.path(name))
+        self._add(name)
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight),
+        }
+
+
+image_cache = DiskCache()
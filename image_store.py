@@ -0,0 +1,163 @@
+"""Content-addressed storage for machine model images.
+
+Uploads are stored as ``static/images/cas/<aa>/<sha256 of the bytes>.jpg`` (plus
+their variants and kept original), so identical uploads share one file and are
+processed once. The bytes behind a cas URL never change, which lets it be served
+as immutable. The MachineModel rows pointing at a path are its reference count:
+release() removes the files only once no row references them and they were not
+written or claimed within RELEASE_GRACE_SECONDS.
+
+    python image_store.py migrate   # move legacy /static/images/<name>.jpg rows into cas/
+    python image_store.py gc        # delete cas files no row references
+"""
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import time
+
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from images import ENABLED_FORMATS, IMAGE_DIR, VARIANT_WIDTHS, original_path, variant_path
+from models import MachineModel
+from read_models import sync_machine_model_lookup
+
+logger = logging.getLogger(__name__)
+
+CAS_DIR = os.path.join(IMAGE_DIR, "cas")
+CAS_URL_PREFIX = "/static/images/cas/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RELEASE_GRACE_SECONDS = 300
+
+
+def content_digest(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def content_path(digest: str) -> str:
+    return os.path.join(CAS_DIR, digest[:2], f"{digest}.jpg")
+
+
+def web_path(path: str) -> str:
+    return f"/{path.replace(os.sep, '/')}"
+
+
+def disk_path(image: str) -> str:
+    # Stored web path -> the JPEG on disk (legacy rows may carry the upload's extension)
+    return os.path.splitext(image.lstrip("/"))[0] + ".jpg"
+
+
+def derived_files(path: str) -> list:
+    return [path, original_path(path)] + [variant_path(path, width, name)
+                                          for width in VARIANT_WIDTHS for name in ENABLED_FORMATS]
+
+
+def is_complete(path: str) -> bool:
+    # Every output of a finished job is on disk
+    return all(os.path.isfile(variant_path(path, width, name)) for width in VARIANT_WIDTHS for name in ENABLED_FORMATS) \
+        and os.path.isfile(path)
+
+
+def claim(path: str) -> bool:
+    # Refreshes the mtime so a concurrent release() keeps the files; True when the
+    # upload is a duplicate whose job already finished and can be skipped
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return is_complete(path)
+
+
+def references(db: Session, image: str) -> int:
+    return db.query(func.count(MachineModel.id)).filter(MachineModel.image == image).scalar()
+
+
+def release(db: Session, image: str) -> bool:
+    # Call after the commit that dropped a reference to `image`
+    if not image or references(db, image):
+        return False
+    path = disk_path(image)
+    try:
+        if time.time() - os.path.getmtime(path) < RELEASE_GRACE_SECONDS:
+            return False
+    except FileNotFoundError:
+        pass
+    for file_path in derived_files(path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+    return True
+
+
+class ImmutableStaticFiles(StaticFiles):
+    # For content-addressed paths only: the bytes behind a URL never change
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def migrate(session_factory):
+    # Copies every legacy image into cas/, repoints its rows and releases the old files; re-runnable
+    db = session_factory()
+    moved = 0
+    try:
+        images = [image for (image,) in db.query(MachineModel.image).distinct()
+                  if image and not image.startswith(CAS_URL_PREFIX)]
+        for image in images:
+            source = disk_path(image)
+            if not os.path.isfile(source):
+                logger.warning("skipping %s: %s is missing", image, source)
+                continue
+            original = original_path(source)
+            with open(original if os.path.isfile(original) else source, "rb") as f:
+                target = content_path(content_digest(f.read()))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for old, new in zip(derived_files(source), derived_files(target)):
+                if os.path.isfile(old) and not os.path.isfile(new):
+                    os.makedirs(os.path.dirname(new), exist_ok=True)
+                    shutil.copy2(old, new)
+            new_image = web_path(target)
+            for (machine_id,) in db.query(MachineModel.id).filter(MachineModel.image == image).all():
+                db.query(MachineModel).filter(MachineModel.id == machine_id) \
+                    .update({"image": new_image}, synchronize_session=False)
+                sync_machine_model_lookup(db, machine_id, {"image": new_image})
+            db.commit()
+            release(db, image)
+            moved += 1
+    finally:
+        db.close()
+    return moved
+
+
+def collect_garbage(session_factory) -> int:
+    db = session_factory()
+    removed = 0
+    try:
+        for path in glob.glob(os.path.join(CAS_DIR, "*", "*.jpg")):
+            if "_" in os.path.basename(path):
+                continue  # a variant; removed with its image
+            if release(db, web_path(path)):
+                removed += 1
+    finally:
+        db.close()
+    return removed
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    action = sys.argv[1] if len(sys.argv) > 1 else None
+    if action == "migrate":
+        logger.info("moved %s images into %s", migrate(SessionLocal), CAS_DIR)
+    elif action == "gc":
+        logger.info("removed %s unreferenced images", collect_garbage(SessionLocal))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,343 @@
+"""Machine model image processing, off the event loop.
+
+Decoding a phone photo, thumbnailing it and writing an optimized JPEG takes
+hundreds of milliseconds of CPU. Done inline in an async endpoint, that froze
+every request and WebSocket on the worker. Jobs now run in a small process
+pool. At most IMAGE_QUEUE_LIMIT jobs may be queued or running. Beyond that
+submit() raises ImageQueueFull, the endpoint answers 429, and clients back
+off instead of piling uploads up in memory.
+
+The output path is fixed before the job runs, so the endpoint stores the row
+and answers without waiting for the file.
+
+Each job also writes responsive variants next to the JPEG:
+``<name>_<width>w.<ext>`` for every VARIANT_WIDTHS entry, in every format in
+ENABLED_FORMATS. WebP is always written. AVIF is written when this Pillow
+build can encode it. The names follow from the image path alone, so
+image_srcset() needs no extra column. pick_variant() serves the best format
+the client's Accept header allows. For images uploaded before variants
+existed, run:
+
+    python images.py backfill
+
+Uploads never sit in memory whole: spool_upload() copies them in chunks to a
+temp file (at most IMAGE_UPLOAD_MAX_BYTES), the job receives that path, and
+JPEGs are decoded in draft mode at a reduced scale just above MAX_SIZE.
+Images over IMAGE_MAX_PIXELS are refused before decoding, which also bounds
+Pillow's own decompression-bomb check (Image.MAX_IMAGE_PIXELS) in every process.
+
+The upload itself is kept, untouched, under ORIGINALS_DIR. That directory
+is not served. It is what /images/{machine_id} renders arbitrary sizes
+from (see image_cache).
+"""
+import asyncio
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = "static/images"
+ORIGINALS_DIR = os.getenv("IMAGE_ORIGINALS_DIR", "media/originals")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", "16"))
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(64_000_000)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+INCOMING_DIR = os.path.join(ORIGINALS_DIR, ".incoming")  # same filesystem, so keeping an upload is a rename
+RETRY_AFTER_SECONDS = 2
+MAX_SIZE = (800, 800)
+QUALITY = 75
+VARIANT_WIDTHS = (160, 320, 640, 800)
+# Best first: negotiation takes the first format the client accepts
+VARIANT_FORMATS = {
+    "avif": ("AVIF", ".avif", "image/avif", {"quality": 50}),
+    "webp": ("WEBP", ".webp", "image/webp", {"quality": QUALITY, "method": 4}),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg", {"quality": QUALITY, "optimize": True, "progressive": True}),
+}
+ENABLED_FORMATS = tuple(name for name in VARIANT_FORMATS if name == "jpeg" or features.check(name))
+VARIANT_RE = re.compile(r"_\d+w$")
+
+# Pillow warns above this and raises DecompressionBombError above twice this
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+
+class ImageQueueFull(Exception):
+    pass
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(InvalidImage):
+    pass
+
+
+def spool_upload(fileobj, max_bytes: int = IMAGE_UPLOAD_MAX_BYTES):
+    # Copies the upload to a temp file chunk by chunk, hashing on the way;
+    # returns (temp path, sha256 hex digest). Blocking: run it in a thread.
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=INCOMING_DIR, suffix=".upload")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := fileobj.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLarge(f"image is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        discard(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def probe(path: str):
+    # Reads the header only; refuses decompression bombs before any pixel is decoded
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            image_format = image.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImage(f"not a supported image ({e})")
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(f"image is {width}x{height} pixels, at most {IMAGE_MAX_PIXELS} are allowed")
+    return image_format, (width, height)
+
+
+def output_path(name: str, output_dir: str = IMAGE_DIR) -> str:
+    # Every upload is stored as JPEG, whatever extension it came with
+    return os.path.join(output_dir, f"{os.path.splitext(name)[0]}.jpg")
+
+
+def compress_image(source: str, path: str, max_size=MAX_SIZE, quality=QUALITY) -> str:
+    # `source` is the spooled upload; the job owns it and keeps it as the original
+    try:
+        with Image.open(source) as image:
+            # JPEG: decode at the 1/2, 1/4 or 1/8 scale that still leaves thumbnail() 2x to resample from
+            image.draft("RGB", (max_size[0] * 2, max_size[1] * 2))
+
+            # Convert to RGB (JPEG doesn't support alpha channels)
+            if image.mode in ("RGBA", "P"):
+                image = image.convert("RGB")
+
+            # Resize
+            image.thumbnail(max_size)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _save(image, path, "JPEG", optimize=True, quality=quality)
+            write_variants(image, path)
+        _keep_original(source, original_path(path))
+    finally:
+        discard(source)
+    return path
+
+
+def original_path(path: str) -> str:
+    return os.path.join(ORIGINALS_DIR, os.path.splitext(os.path.basename(path))[0])
+
+
+def _keep_original(source: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(source, path)
+
+
+def render_source(path: str) -> str:
+    # The kept upload when there is one; images from before that fall back to the stored JPEG
+    original = original_path(path)
+    return original if os.path.isfile(original) else path
+
+
+def render_image(source: str, dest: str, width, height, image_format: str) -> str:
+    # Fits the picture inside width x height (either may be None), never upscaling
+    with Image.open(source) as image:
+        image.draft("RGB", (width or image.width, height or image.height))
+        image = image.convert("RGB")
+        image.thumbnail((width or image.width, height or image.height))
+        pil_format, _, _, options = VARIANT_FORMATS[image_format]
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _save(image, dest, pil_format, **options)
+    return dest
+
+
+def _save(image, path: str, image_format: str, **options):
+    # Write next to the target and rename, so the static route never serves half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format=image_format, **options)
+    os.replace(tmp_path, path)
+
+
+def variant_path(path: str, width: int, image_format: str) -> str:
+    return f"{os.path.splitext(path)[0]}_{width}w{VARIANT_FORMATS[image_format][1]}"
+
+
+def write_variants(image, path: str):
+    # `image` is the decoded, already thumbnailed RGB picture stored at `path`
+    for width in VARIANT_WIDTHS:
+        variant = image.copy()
+        variant.thumbnail((width, width * 100))  # width-bound, never upscaled
+        for name in ENABLED_FORMATS:
+            pil_format, _, _, options = VARIANT_FORMATS[name]
+            _save(variant, variant_path(path, width, name), pil_format, **options)
+
+
+def image_srcset(image_path: str) -> dict:
+    # {"webp": "/static/images/x_160w.webp 160w, ...", ...} for <picture>/<source srcset>
+    return {
+        name: ", ".join(f"{variant_path(image_path, width, name)} {width}w" for width in VARIANT_WIDTHS)
+        for name in ENABLED_FORMATS
+    }
+
+
+def accepted_formats(accept: str) -> list:
+    # JPEG is always acceptable; the others only when named with q > 0 (wildcards do not count)
+    accepted = set()
+    for part in (accept or "").split(","):
+        mime, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(mime.strip().lower())
+    return [name for name in ENABLED_FORMATS if name == "jpeg" or VARIANT_FORMATS[name][2] in accepted]
+
+
+def pick_variant(path: str, width, accept: str):
+    # -> (file path, media type): smallest variant at least `width` wide, in the best accepted
+    # format that exists on disk; the stored JPEG when no variant has been written yet
+    widths = [w for w in VARIANT_WIDTHS if width is not None and w >= width] or [VARIANT_WIDTHS[-1]]
+    for name in accepted_formats(accept):
+        candidate = variant_path(path, widths[0], name)
+        if os.path.isfile(candidate):
+            return candidate, VARIANT_FORMATS[name][2]
+    return path, "image/jpeg"
+
+
+def backfill_variants(path: str) -> bool:
+    # Writes the variants of one stored JPEG if any are missing
+    wanted = [variant_path(path, width, name) for width in VARIANT_WIDTHS for name in ENABLED_FORMATS]
+    if all(os.path.isfile(variant) for variant in wanted):
+        return False
+    with Image.open(path) as image:
+        write_variants(image.convert("RGB"), path)
+    return True
+
+
+def stored_images(output_dir: str = IMAGE_DIR) -> list:
+    # Legacy <model>_<name>.jpg files and the content-addressed cas/<aa>/<digest>.jpg ones
+    return sorted(path for path in glob.glob(os.path.join(output_dir, "**", "*.jpg"), recursive=True)
+                  if not VARIANT_RE.search(os.path.splitext(path)[0]))
+
+
+class ImageProcessor:
+    # Without a started pool (scripts, tests) jobs run on the default thread pool
+
+    def __init__(self, workers: int = IMAGE_WORKERS, queue_limit: int = IMAGE_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._jobs = set()  # keeps the asyncio futures alive until they finish
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def reserve(self):
+        # Takes a queue slot before the upload is spooled, so uploads in flight count
+        # against queue_limit too; pass reserved=True to submit() or call unreserve()
+        with self._lock:
+            self._check_capacity_locked()
+            self._pending += 1
+
+    def unreserve(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _check_capacity_locked(self):
+        if self._pending >= self.queue_limit:
+            self.rejected += 1
+            raise ImageQueueFull()
+
+    def submit(self, fn, *args, reserved: bool = False) -> asyncio.Future:
+        # Call from the event loop; the caller may await the result or not
+        if not reserved:
+            with self._lock:
+                self._check_capacity_locked()
+                self._pending += 1
+        job = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        self._jobs.add(job)
+        job.add_done_callback(self._finished)
+        return job
+
+    def _finished(self, job):
+        self._jobs.discard(job)
+        with self._lock:
+            self._pending -= 1
+        if job.cancelled() or job.exception() is not None:
+            self.failed += 1
+            if not job.cancelled():
+                logger.error("image job failed: %s", job.exception())
+        else:
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self._executor is not None,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+image_processor = ImageProcessor()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    if sys.argv[1:2] != ["backfill"]:
+        print(__doc__)
+        sys.exit(2)
+    paths = stored_images()
+    with ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        written = sum(pool.map(backfill_variants, paths))
+    logger.info("variants written for %s of %s images (formats: %s)", written, len(paths), ", ".join(ENABLED_FORMATS))
@@ -0,0 +1,133 @@
+"""Pool of pre-generated tenant key pairs.
+
+Generating an RSA-2048 pair costs tens to hundreds of milliseconds of CPU.
+Done inside create_customer, that time holds the GIL and a threadpool slot.
+Instead, a process-pool worker keeps a small stock of ready pairs. When the
+stock drops to the low watermark it is refilled up to the high watermark, and
+create calls just pop one.
+
+If the pool is empty (cold start, a burst of creates, or the pool never
+started) a create falls back to generating inline, so it is never blocked.
+The pool is per process, like serial_filter.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from tenant_keys import RSA_2048, generate_key_pair, generate_rsa_key_pair
+
+logger = logging.getLogger(__name__)
+
+KEY_POOL_LOW_WATERMARK = int(os.getenv("KEY_POOL_LOW_WATERMARK", "8"))
+KEY_POOL_HIGH_WATERMARK = int(os.getenv("KEY_POOL_HIGH_WATERMARK", "32"))
+KEY_POOL_WORKERS = int(os.getenv("KEY_POOL_WORKERS", "1"))
+RATE_WINDOW_SECONDS = 60
+
+
+class KeyPool:
+    def __init__(self, generate, low: int = KEY_POOL_LOW_WATERMARK, high: int = KEY_POOL_HIGH_WATERMARK,
+                 workers: int = KEY_POOL_WORKERS):
+        # `generate` runs in worker processes, so it must be a module-level function
+        self.generate = generate
+        self.low = low
+        self.high = max(high, low + 1)
+        self.workers = workers
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = 0
+        self._generated_at = deque()  # completion times inside the rate window
+        self.generated = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the server process already runs threads
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        self._refill()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def take(self) -> dict:
+        with self._lock:
+            key_pair = self._keys.popleft() if self._keys else None
+            if key_pair is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._refill()
+        return key_pair if key_pair is not None else self.generate()
+
+    def _refill(self):
+        with self._lock:
+            if self._executor is None or len(self._keys) + self._in_flight > self.low:
+                return
+            wanted = self.high - len(self._keys) - self._in_flight
+            self._in_flight += wanted
+            executor = self._executor
+        for _ in range(wanted):
+            try:
+                executor.submit(self.generate).add_done_callback(self._on_generated)
+            except RuntimeError:  # shut down meanwhile
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _on_generated(self, future):
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                self.errors += 1
+            else:
+                self._keys.append(future.result())
+                self.generated += 1
+                self._generated_at.append(now)
+        if error is not None:
+            logger.error("key generation failed: %s", error)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            while self._generated_at and self._generated_at[0] < now - RATE_WINDOW_SECONDS:
+                self._generated_at.popleft()
+            return {
+                "running": self._executor is not None,
+                "depth": len(self._keys),
+                "in_flight": self._in_flight,
+                "low_watermark": self.low,
+                "high_watermark": self.high,
+                "generated": self.generated,
+                "refill_per_minute": len(self._generated_at) * 60 / RATE_WINDOW_SECONDS,
+                "served_from_pool": self.hits,
+                "generated_inline": self.misses,
+                "errors": self.errors,
+            }
+
+
+rsa_key_pool = KeyPool(generate_rsa_key_pair)
+
+
+def take_key_pair(algorithm: str) -> dict:
+    # Only RSA is slow enough to be worth pooling; EC keys are generated on the spot
+    if algorithm == RSA_2048:
+        rsa_key_pool.start()  # no-op once running; the first RSA tenant starts the pool
+        return rsa_key_pool.take()
+    return generate_key_pair(algorithm)
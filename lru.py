@@ -0,0 +1,37 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Small thread-safe LRU for parsed keys and validated tokens; per process
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def pop_where(self, predicate):
+        # predicate(key, value) -> True drops the entry
+        with self._lock:
+            for key in [key for key, value in self._items.items() if predicate(key, value)]:
+                del self._items[key]
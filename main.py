@@ -1,16 +1,21 @@
 import asyncio
+import csv
+import itertools
 import json
-from typing import Union, Optional, List
+import re
+import string
+import threading
+from collections import deque
+from datetime import date, timedelta
+from typing import Literal, Union, Optional, List, Tuple
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sqlalchemy.orm import Session, joinedload
-from database import SessionLocal, engine
-from fastapi import FastAPI, WebSocket, File, UploadFile, Form
-from models import Base, Customer, MachineModel, SerialNumbers, CustomerUserModel, CustomerPrivilegeEnum, ManagementPrivilegeEnum, Management, ManagementUserModel, MachineDetails
+from pydantic import BaseModel, ValidationError, computed_field, field_validator
+from sqlalchemy.orm import Session, contains_eager
+from database import SessionLocal, engine, migration_connection
+from fastapi import FastAPI, WebSocket, WebSocketException, File, UploadFile, Form, Query, Header, Response, status
+from models import Base, Customer, MachineModel, SerialNumbers, CustomerUserModel, CustomerPrivilegeEnum, ManagementPrivilegeEnum, Management, ManagementUserModel, MachineDetails, SerialAllocator, SerialLookup
 from sqlalchemy.exc import IntegrityError
-from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import APIRouter, Depends, HTTPException
-from PIL import Image
 import io
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
@@ -18,19 +23,80 @@ from typing import Union, List, Dict, Any
 import uvicorn
 import os
 from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import inspect, update, func, insert, select, or_
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from warranty import sql_add_months, warranty_end_date
+from serial_filter import serial_filter
+from autocomplete import autocomplete_indexes
+import search
+import auth
+import geo
+import purge
+from idempotency import IdempotencyConflict, idempotency_cache
+from upserts import upsert
+from key_pool import rsa_key_pool, take_key_pair
+from encrypted_ingest import DecryptionError, decrypt_batcher, key_id, tenant_pems
+from passwords import DUMMY_HASH, needs_rehash, password_hasher
+from images import (ENABLED_FORMATS, IMAGE_UPLOAD_MAX_BYTES, RETRY_AFTER_SECONDS, VARIANT_FORMATS, ImageQueueFull,
+                    ImageTooLarge, InvalidImage, accepted_formats, compress_image, discard, image_processor,
+                    image_srcset, pick_variant, probe, render_image, render_source, spool_upload)
+from image_cache import image_cache, render_key
+import image_store
+from rbac import AUTH_REQUIRED, Permission, Principal, tenant_scope
+from tenant_keys import DEFAULT_KEY_ALGORITHM, INGEST_ALGORITHMS, KEY_ALGORITHMS, RSA_2048, check_algorithm
+from read_models import refresh_serial_lookup, sync_machine_model_lookup, sync_customer_lookup
 
 app = FastAPI()
+# Keep the full-text index in step with every ORM flush
+search.register(SessionLocal)
+geo.register(Customer, Management)
 # Base.metadata.create_all(bind=engine)
 
-# Mount static folder to serve images
+# Mount static folder to serve images; content-addressed images first, they never change
+os.makedirs(image_store.CAS_DIR, exist_ok=True)
+app.mount("/static/images/cas", image_store.ImmutableStaticFiles(directory=image_store.CAS_DIR), name="image_cas")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # --- Initialize DB for MySQL ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_REVISION = "0001_baseline"
+
+
+def run_migrations(bind=None):
+    alembic_cfg = AlembicConfig(os.path.join(BASE_DIR, "alembic.ini"))
+    alembic_cfg.set_main_option("script_location", os.path.join(BASE_DIR, "alembic"))
+    with migration_connection(bind) as connection, connection.begin():
+        alembic_cfg.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        # Databases built by the old create_all() already have the baseline tables
+        if "alembic_version" not in tables and "customers" in tables:
+            command.stamp(alembic_cfg, BASELINE_REVISION)
+        command.upgrade(alembic_cfg, "head")
 
 
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
+    run_migrations()
+    # Load the serial membership filter in the background; lookups use the DB until it is ready
+    threading.Thread(target=serial_filter.rebuild, args=(SessionLocal,), daemon=True).start()
+    threading.Thread(target=autocomplete_indexes.rebuild, args=(SessionLocal,), daemon=True).start()
+    if DEFAULT_KEY_ALGORITHM == RSA_2048:
+        rsa_key_pool.start()
+    decrypt_batcher.start()
+    password_hasher.start()
+    image_processor.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    rsa_key_pool.shutdown()
+    decrypt_batcher.shutdown()
+    password_hasher.shutdown()
+    image_processor.shutdown()
 
 
 # Allow all CORS for testing
@@ -48,6 +114,46 @@ app.add_middleware(
 # data_updated_event: A flag that gets "set" when new data is submitted. WebSocket clients wait for this to push updates.
 data_updated_event = asyncio.Event()
 
+# What changed, for /ws/machines/ clients: each one sends the records it has not seen yet.
+# Entries are (owner, change); see change_visible.
+MAX_RECENT_CHANGES = 1000
+recent_changes = deque(maxlen=MAX_RECENT_CHANGES)
+change_sequence = itertools.count(1)
+
+
+def notify_change(entity: str, entity_id: Optional[int], fields, count: Optional[int] = None,
+                  owner: Optional[Tuple[str, int]] = None):
+    # Bulk writes record one aggregated change: no id, just how many rows it touched.
+    # owner, (tenant kind, tenant id), decides which scoped clients see the change.
+    change = {"seq": next(change_sequence), "entity": entity, "id": entity_id, "fields": sorted(fields)}
+    if count is not None:
+        change["count"] = count
+    recent_changes.append((owner, change))
+    data_updated_event.set()
+
+
+# model -> (tenant kind, column holding the owning tenant's id)
+CHANGE_OWNERS = {
+    MachineModel: ("management", "make"),
+    SerialNumbers: ("customer", "customer_id"),
+    CustomerUserModel: ("customer", "customer_id"),
+    ManagementUserModel: ("management", "management_id"),
+}
+
+
+def change_owner(db: Session, model, entity_id: int) -> Optional[Tuple[str, int]]:
+    kind, column = CHANGE_OWNERS[model]
+    tenant_id = db.query(getattr(model, column)).filter(model.id == entity_id).scalar()
+    return (kind, tenant_id) if tenant_id is not None else None
+
+
+def change_visible(principal: Optional[Principal], owner: Optional[Tuple[str, int]]) -> bool:
+    if owner is None:
+        # Not tied to one tenant (bulk writes): only for callers with no tenant scope
+        return tenant_scope(principal, "customer") is None and tenant_scope(principal, "management") is None
+    kind, tenant_id = owner
+    return tenant_scope(principal, kind) in (None, tenant_id)
+
 # Store latest data globally if needed
 latest_data: Optional["SubmitRequest"] = None
 
@@ -62,6 +168,80 @@ def get_db():
         db.close()
 
 
+def get_claims(authorization: Optional[str] = Header(None)) -> dict:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return auth.verify_token(SessionLocal, token)
+    except auth.TokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def get_principal(authorization: Optional[str] = Header(None)) -> Optional[Principal]:
+    # None: anonymous caller while AUTH_REQUIRED is off (see rbac)
+    if not authorization and not AUTH_REQUIRED:
+        return None
+    return Principal.from_claims(get_claims(authorization))
+
+
+def requires(required: Permission):
+    def check_permission(principal: Optional[Principal] = Depends(get_principal)) -> Optional[Principal]:
+        if principal is not None and not principal.allows(required):
+            raise HTTPException(status_code=403, detail="Not permitted")
+        return principal
+    return check_permission
+
+
+WEBSOCKET_AUTH_SECONDS = 10
+
+
+async def websocket_token(websocket: WebSocket) -> Optional[str]:
+    # Browsers cannot set headers on a WebSocket: the token comes as ?token=..., or, when
+    # auth is required, as a first message {"token": "..."}
+    token = websocket.query_params.get("token")
+    if token is not None or not AUTH_REQUIRED:
+        return token
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), WEBSOCKET_AUTH_SECONDS)
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    return message.get("token") if isinstance(message, dict) else None
+
+
+async def websocket_principal(token: Optional[str], required: Permission) -> Optional[Principal]:
+    # WebSocket twin of requires(); closes with 1008 instead of answering 401/403
+    if token is None:
+        if AUTH_REQUIRED:
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+        return None
+    try:
+        claims = await run_in_threadpool(auth.verify_token, SessionLocal, token)
+    except auth.TokenError as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+    principal = Principal.from_claims(claims)
+    if not principal.allows(required):
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not permitted")
+    return principal
+
+
+def scoped_tenant_id(principal: Optional[Principal], kind: str, requested: Optional[int] = None) -> Optional[int]:
+    # List filter for rows owned by a `kind` tenant: the caller's own tenant when scoped
+    scope = tenant_scope(principal, kind)
+    if scope is None:
+        return requested
+    if requested is not None and requested != scope:
+        raise HTTPException(status_code=403, detail=f"Outside your {kind}")
+    return scope
+
+
+def check_tenant_row(principal: Optional[Principal], kind: str, tenant_id: Optional[int], not_found: str):
+    # Per-row variant: rows of another tenant look the same as missing ones
+    scope = tenant_scope(principal, kind)
+    if scope is not None and tenant_id != scope:
+        raise HTTPException(status_code=404, detail=not_found)
+
+
 @app.get("/management_privileges/", response_model=list[dict[str, str]])
 async def get_management_privileges() -> list[dict[str, str]]:
     return [
@@ -70,6 +250,11 @@ async def get_management_privileges() -> list[dict[str, str]]:
     ]
 
 
+@app.get("/key_algorithms/", response_model=list[dict[str, str]])
+async def get_key_algorithms() -> list[dict[str, str]]:
+    return [{"value": algorithm, "label": algorithm} for algorithm in KEY_ALGORITHMS]
+
+
 @app.get("/privileges/", response_model=list[dict[str, str]])
 async def get_privileges() -> list[dict[str, str]]:
     return [
@@ -78,30 +263,6 @@ async def get_privileges() -> list[dict[str, str]]:
     ]
 
 
-def generate_rsa_key_pair() -> dict:
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
-
-    private_pem = private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=serialization.NoEncryption()
-    ).decode()
-
-    public_key = private_key.public_key()
-    public_pem = public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
-    ).decode()
-
-    return {
-        "private_key": private_pem,
-        "public_key": public_pem
-    }
-
-
 class MachineData(BaseModel):
     customerID: Union[str, int]
     machineID: Union[str, int]
@@ -131,30 +292,97 @@ class ChemRecord(BaseModel):
     dispensed_datetime: str
 
 
-class CustomerCreate(BaseModel):
+class CoordinatesMixin(BaseModel):
+    @field_validator("latitude", "longitude", mode="before", check_fields=False)
+    @classmethod
+    def parse_coordinate_text(cls, value):
+        # Older clients send "" for unknown coordinates and "12.97 S" style text
+        return geo.parse_coordinate(value) if isinstance(value, str) else value
+
+    @field_validator("latitude", check_fields=False)
+    @classmethod
+    def check_latitude(cls, value):
+        if value is not None and not -90 <= value <= 90:
+            raise ValueError("latitude must be between -90 and 90")
+        return value
+
+    @field_validator("longitude", check_fields=False)
+    @classmethod
+    def check_longitude(cls, value):
+        if value is not None and not -180 <= value <= 180:
+            raise ValueError("longitude must be between -180 and 180")
+        return value
+
+
+class TenantKeyMixin(BaseModel):
+    @field_validator("key_algorithm", check_fields=False)
+    @classmethod
+    def check_key_algorithm(cls, value):
+        return None if value is None else check_algorithm(value)
+
+
+class CustomerUpdate(CoordinatesMixin):
+    # No key fields: the key pair is generated on create and only changes through /rotate_keys
     name: str
     phone: Optional[str] = None
     email: Optional[str] = None
     gst: Optional[str] = None
-    latitude: Optional[str] = None
-    longitude: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     address: Optional[str] = None
     key_name: Optional[str] = None
-    private_key: Optional[str] = None
-    public_key: Optional[str] = None
 
 
-class ManagementCreate(BaseModel):
+class CustomerCreate(CustomerUpdate, TenantKeyMixin):
+    # defaults to tenant_keys.DEFAULT_KEY_ALGORITHM
+    key_algorithm: Optional[str] = None
+
+
+class CustomerOut(BaseModel):
+    # Tenant rows as the API shows them: never the private key, which stays server-side
+    id: int
     name: str
     phone: Optional[str] = None
     email: Optional[str] = None
     gst: Optional[str] = None
-    latitude: Optional[str] = None
-    longitude: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     address: Optional[str] = None
     key_name: Optional[str] = None
-    private_key: Optional[str] = None
     public_key: Optional[str] = None
+    key_algorithm: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ManagementOut(CustomerOut):
+    pass
+
+
+class ManagementUpdate(CustomerUpdate):
+    pass
+
+
+class ManagementCreate(ManagementUpdate, TenantKeyMixin):
+    key_algorithm: Optional[str] = None
+
+
+# PATCH payloads: unset fields are left alone. NOT NULL columns are typed without
+# Optional, so an explicit null fails validation instead of reaching the DB.
+class CustomerPatch(CoordinatesMixin):
+    name: str = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    gst: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    address: Optional[str] = None
+    key_name: Optional[str] = None
+
+
+class ManagementPatch(CustomerPatch):
+    pass
 
 
 class MachineCreate(BaseModel):
@@ -187,7 +415,32 @@ class MachineModelUpdate(MachineModelBase):
     pass
 
 
-class MachineModelOut(MachineModelBase):
+class MachineModelPatch(BaseModel):
+    machineName: str = None
+    model_number: str = None
+    description: str = None
+    default_warranty_months: int = None
+    phase: str = None
+    volts: str = None
+    amps: str = None
+    frequency: str = None
+    sw_version: str = None
+    pcb_version: str = None
+    fw_version: str = None
+    design_version: str = None
+    make: int = None
+    image: str = None
+
+
+class ImageVariantsMixin(BaseModel):
+    @computed_field
+    @property
+    def image_srcset(self) -> Optional[Dict[str, str]]:
+        # Responsive variants per format (see images.py); None without an image
+        return image_srcset(self.image) if self.image else None
+
+
+class MachineModelOut(MachineModelBase, ImageVariantsMixin):
     id: int
 
     class Config:
@@ -196,9 +449,8 @@ class MachineModelOut(MachineModelBase):
 
 class SerialNumberBase(BaseModel):
     serial_number: str
-    date_of_manufacturing: str
-    additional_warranty_months: str
-    warranty_end_date: str
+    date_of_manufacturing: date
+    additional_warranty_months: int = 0
     product_warranty: str
     sw_version: str
     pcb_version: str
@@ -216,8 +468,24 @@ class SerialNumberUpdate(SerialNumberBase):
     pass
 
 
+class SerialNumberPatch(BaseModel):
+    serial_number: str = None
+    date_of_manufacturing: date = None
+    additional_warranty_months: int = None
+    product_warranty: str = None
+    sw_version: str = None
+    pcb_version: str = None
+    fw_version: str = None
+    design_version: str = None
+    model_number: int = None
+    customer_id: int = None
+
+
 class SerialNumberOut(SerialNumberBase):
     id: int
+    date_of_manufacturing: Optional[date]
+    # computed server-side from the machine model's default warranty
+    warranty_end_date: Optional[date]
 
     class Config:
         from_attributes = True
@@ -231,7 +499,7 @@ class MachineSerialNumberOut(BaseModel):
         from_attributes = True
 
 
-class MachineOut(BaseModel):
+class MachineOut(ImageVariantsMixin):
     id: int
     machineName: str
     model_number: str
@@ -271,48 +539,196 @@ class ManagementUserCreate(BaseModel):
     management_id: int
 
 
-router = APIRouter(prefix="/machines", tags=["Machines"])
+# Responses never carry the password hash
+class CustomerUserOut(BaseModel):
+    id: int
+    name: str
+    username: str
+    designation: str
+    privilege: str
+    customer_id: int
 
+    class Config:
+        from_attributes = True
 
-@app.post("/create_machines", response_model=MachineModelOut)
-def create_machine(machine: MachineModelCreate, db: Session = Depends(get_db)):
-    db_machine = MachineModel(**machine.dict())
-    db.add(db_machine)
-    db.commit()
-    db.refresh(db_machine)
-    return db_machine
+
+class ManagementUserOut(BaseModel):
+    id: int
+    name: str
+    username: str
+    designation: str
+    privilege: str
+    management_id: int
+
+    class Config:
+        from_attributes = True
 
 
-def compress_image(
-        upload_file: UploadFile,
-        model_number: str,
-        output_dir: str = "static/images",
-        max_size=(800, 800),
-        quality=75
-) -> str:
-    image_data = upload_file.file.read()
-    image = Image.open(io.BytesIO(image_data))
+class CustomerUserPatch(BaseModel):
+    name: str = None
+    username: str = None
+    password: str = None
+    designation: str = None
+    privilege: str = None
+    customer_id: int = None
 
-    # Convert to RGB (JPEG doesn't support alpha channels)
-    if image.mode in ("RGBA", "P"):
-        image = image.convert("RGB")
 
-    # Resize
-    image.thumbnail(max_size)
+class ManagementUserPatch(BaseModel):
+    name: str = None
+    username: str = None
+    password: str = None
+    designation: str = None
+    privilege: str = None
+    management_id: int = None
 
-    # Ensure directory exists
-    os.makedirs(output_dir, exist_ok=True)
 
-    # Sanitize and build filename
-    model_base = os.path.splitext(model_number)[0]  # Remove .png or .jpg etc.
-    ext = ".jpg"  # Force JPEG
-    filename = f"{model_base}{ext}"
-    output_path = os.path.join(output_dir, filename)
+router = APIRouter(prefix="/machines", tags=["Machines"])
+
 
-    # Save as compressed JPEG
-    image.save(output_path, format="JPEG", optimize=True, quality=quality)
+def update_by_id(db: Session, model, entity_id: int, values: dict, not_found: str):
+    # One set-based UPDATE instead of load + copy + refresh. The row count doubles as the
+    # existence check (the MySQL dialect connects with FOUND_ROWS, so unchanged rows count).
+    result = db.execute(
+        update(model).where(model.id == entity_id).values(**values).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=not_found)
+    search.index_row(db.connection(), model, entity_id, values)
+
+
+def patch_by_id(db: Session, model, entity_id: int, changes: dict, not_found: str) -> bool:
+    # UPDATE only the given columns, and only when one of them actually differs, so an
+    # unchanged row is not rewritten (and not written to the binlog). A zero row count
+    # then costs one primary-key probe to tell "unchanged" from "not found".
+    result = db.execute(
+        update(model)
+        .where(model.id == entity_id,
+               or_(*[getattr(model, name).is_distinct_from(value) for name, value in changes.items()]))
+        .values(**changes)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        if db.query(model.id).filter(model.id == entity_id).first() is None:
+            db.rollback()
+            raise HTTPException(status_code=404, detail=not_found)
+        return False
+    search.index_row(db.connection(), model, entity_id, changes)
+    return True
+
+
+def patch_result(entity_id: int, changed: bool, changes: dict) -> dict:
+    return {"id": entity_id, "changed": changed, "values": changes}
+
+
+def idempotent(idempotency_key: Optional[str], scope: str, principal: Optional[Principal], payload,
+               response: Response, produce):
+    # Without the header every call runs; with it, a retry replays the first result.
+    # Keys are per tenant, so one tenant's key never replays another tenant's response.
+    if not idempotency_key:
+        return produce()
+    tenant = (principal.kind, principal.tenant_id) if principal is not None else None
+    try:
+        result, replayed = idempotency_cache.run((scope, tenant, idempotency_key), payload, produce)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different payload")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+def upsert_machine_model(db: Session, values: dict, update_columns=None) -> int:
+    # Natural key model_number: re-posting a model updates it instead of failing on the unique index
+    previous_months = db.query(MachineModel.default_warranty_months) \
+        .filter(MachineModel.model_number == values["model_number"]).scalar()
+    try:
+        machine_id = upsert(db, MachineModel, values, "model_number", update_columns)
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    if previous_months is not None:
+        if previous_months != values["default_warranty_months"]:
+            recompute_warranty_end_dates(db, machine_id, values["default_warranty_months"])
+        sync_machine_model_lookup(db, machine_id, values)
+    search.index_row(db.connection(), MachineModel, machine_id, values)
+    db.commit()
+    autocomplete_indexes.model.add(machine_id, values["model_number"])
+    return machine_id
 
-    return f"/{output_path.replace(os.sep, '/')}"  # Return as web path
+
+def check_machine_scope(db: Session, principal: Optional[Principal], machine_id: int, new_make: Optional[int] = None):
+    # Management callers may only touch their own models (make), and may not hand them to another management
+    if tenant_scope(principal, "management") is None:
+        return
+    make = db.query(MachineModel.make).filter(MachineModel.id == machine_id).scalar()
+    check_tenant_row(principal, "management", make, "Machine not found")
+    if new_make is not None:
+        scoped_tenant_id(principal, "management", new_make)
+
+
+def check_machine_upsert_scope(db: Session, principal: Optional[Principal], model_number: str, make: int):
+    # Upserts go by model_number, so the row they would overwrite must be the caller's as well
+    if tenant_scope(principal, "management") is None:
+        return
+    scoped_tenant_id(principal, "management", make)
+    current_make = db.query(MachineModel.make).filter(MachineModel.model_number == model_number).scalar()
+    if current_make is not None:
+        scoped_tenant_id(principal, "management", current_make)
+
+
+@app.post("/create_machines", response_model=MachineModelOut)
+def create_machine(machine: MachineModelCreate, response: Response, idempotency_key: Optional[str] = Header(None),
+                   principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
+                   db: Session = Depends(get_db)):
+    check_machine_upsert_scope(db, principal, machine.model_number, machine.make)
+
+    def create():
+        values = machine.dict()
+        return MachineModelOut(id=upsert_machine_model(db, values), **values)
+    return idempotent(idempotency_key, "create_machines", principal, machine.dict(), response, create)
+
+
+def prepare_upload(upload: UploadFile):
+    # Blocking part of schedule_image: spool, check the header, look for a duplicate.
+    # Returns (content path, spooled file or None when the image is already stored).
+    if upload.size is not None and upload.size > IMAGE_UPLOAD_MAX_BYTES:
+        raise ImageTooLarge(f"image is larger than {IMAGE_UPLOAD_MAX_BYTES} bytes")
+    source, digest = spool_upload(upload.file)
+    try:
+        probe(source)
+        path = image_store.content_path(digest)
+        if image_store.claim(path):
+            discard(source)
+            return path, None
+    except BaseException:
+        discard(source)
+        raise
+    return path, source
+
+
+async def schedule_image(upload: UploadFile) -> str:
+    # Queues the resize in image_processor and returns the content-addressed web path
+    # the file will have; a duplicate of a stored image skips the job
+    try:
+        image_processor.reserve()
+        try:
+            path, source = await run_in_threadpool(prepare_upload, upload)
+        except BaseException:
+            image_processor.unreserve()
+            raise
+    except ImageQueueFull:
+        raise HTTPException(status_code=429, detail="Image processing is busy, retry shortly",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if source is None:
+        image_processor.unreserve()
+    else:
+        # The job owns the spooled file from here on and removes it whatever happens
+        image_processor.submit(compress_image, source, path, reserved=True)
+    return image_store.web_path(path)
 
 
 @app.post("/upload_machine_model/")
@@ -331,10 +747,12 @@ async def upload_machine_model(
         design_version: str = Form(...),
         make: int = Form(...),
         image: UploadFile = File(None),
+        principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
         db: Session = Depends(get_db)
 ):
     import os
     os.makedirs("static/images", exist_ok=True)
+    check_machine_upsert_scope(db, principal, model_number, make)
     image_path = None
     # if image:
     #     filename = f"{model_number}_{image.filename}"
@@ -343,13 +761,13 @@ async def upload_machine_model(
     #         f.write(await image.read())
     #     image_path = f"/static/images/{filename}"
 
+    previous_image = None
     if image:
-        filename = f"{model_number}_{image.filename}"
-        filepath = f"{filename}"
-        compress_image(image, filepath)  # Compress and save
-        image_path = f"/static/images/{filename}"
+        # Stored path is the .jpg the job writes; the file appears once the job finishes
+        image_path = await schedule_image(image)
+        previous_image = db.query(MachineModel.image).filter(MachineModel.model_number == model_number).scalar()
 
-    new_machine = MachineModel(
+    values = dict(
         machineName=machineName,
         model_number=model_number,
         description=description,
@@ -365,10 +783,12 @@ async def upload_machine_model(
         make=make,
         image=image_path
     )
-    db.add(new_machine)
-    db.commit()
-    db.refresh(new_machine)
-    return new_machine
+    # Re-uploading without an image keeps the stored one
+    update_columns = [column for column in values if column != "image" or image_path]
+    machine_id = upsert_machine_model(db, values, update_columns)
+    if previous_image != image_path:
+        image_store.release(db, previous_image)
+    return MachineModel(id=machine_id, **values)
 
 
 @app.put("/update_machine_model/{machine_id}/", response_model=MachineModelOut)
@@ -388,137 +808,915 @@ async def update_machine_model(
         design_version: str = Form(...),
         make: int = Form(...),
         image: UploadFile = File(None),
+        principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
         db: Session = Depends(get_db)
 ):
-    db_machine = db.query(MachineModel).filter(MachineModel.id == machine_id).first()
-    if not db_machine:
+    check_machine_scope(db, principal, machine_id, make)
+    current = db.query(MachineModel.image, MachineModel.default_warranty_months) \
+        .filter(MachineModel.id == machine_id).first()
+    if not current:
         raise HTTPException(status_code=404, detail="Machine not found")
 
+    image_path = current.image
     if image:
-        if db_machine.image:
-            # Convert image path to .jpg (regardless of what was stored)
-            old_path = db_machine.image.lstrip("/")
-            base, _ = os.path.splitext(old_path)
-            corrected_path = base + ".jpg"
-
-            old_full_path = os.path.join(os.getcwd(), corrected_path)
-
-            if os.path.isfile(old_full_path):
-                os.remove(old_full_path)
-
-        # 2. Save new image
-        os.makedirs("static/images", exist_ok=True)
-        filename = f"{model_number}_{image.filename}"
-        filepath = f"{filename}"
-        # with open(filepath, "wb") as f:
-        #     f.write(await image.read())
-        # db_machine.image = f"/static/images/{filename}"
-
-        compress_image(image, filepath)  # Compress and save
-        image_path = f"/static/images/{filename}"
-        db_machine.image = f"{image_path}"
-
-    db_machine.machineName = machineName
-    db_machine.model_number = model_number
-    db_machine.description = description
-    db_machine.default_warranty_months = default_warranty_months
-    db_machine.phase = phase
-    db_machine.volts = volts
-    db_machine.amps = amps
-    db_machine.frequency = frequency
-    db_machine.sw_version = sw_version
-    db_machine.pcb_version = pcb_version
-    db_machine.fw_version = fw_version
-    db_machine.design_version = design_version
-    db_machine.make = make
+        image_path = await schedule_image(image)
 
-    db.commit()
-    db.refresh(db_machine)
+    values = dict(
+        machineName=machineName,
+        model_number=model_number,
+        description=description,
+        default_warranty_months=default_warranty_months,
+        phase=phase,
+        volts=volts,
+        amps=amps,
+        frequency=frequency,
+        sw_version=sw_version,
+        pcb_version=pcb_version,
+        fw_version=fw_version,
+        design_version=design_version,
+        make=make,
+        image=image_path
+    )
+    try:
+        if current.default_warranty_months != default_warranty_months:
+            recompute_warranty_end_dates(db, machine_id, default_warranty_months)
+        update_by_id(db, MachineModel, machine_id, values, "Machine not found")
+        sync_machine_model_lookup(db, machine_id, values)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    # Never added to the session; only carries the response
+    db_machine = MachineModel(id=machine_id, **values)
+    if current.image != image_path:
+        # Other models may share the old file; release() keeps it while they do
+        image_store.release(db, current.image)
+    autocomplete_indexes.model.add(machine_id, model_number)
     return db_machine
 
 
+IMAGE_MAX_AGE_SECONDS = 86400
+
+
+@app.get("/machines/{machine_id}/image", dependencies=[Depends(requires(Permission.READ_CATALOG))])
+def machine_image(machine_id: int, w: Optional[int] = Query(None, ge=1, le=4096), accept: Optional[str] = Header(None),
+                  db: Session = Depends(get_db)):
+    # Smallest variant at least w pixels wide, as AVIF/WebP when Accept allows, else JPEG
+    image = db.query(MachineModel.image).filter(MachineModel.id == machine_id).scalar()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, media_type = pick_variant(os.path.splitext(image.lstrip("/"))[0] + ".jpg", w, accept)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=media_type,
+                        headers={"Vary": "Accept", "Cache-Control": f"public, max-age={IMAGE_MAX_AGE_SECONDS}"})
+
+
+RENDER_MAX_DIMENSION = 2048
+
+
+@app.get("/images/{machine_id}", dependencies=[Depends(requires(Permission.READ_CATALOG))])
+async def render_machine_image(machine_id: int, w: Optional[int] = Query(None, ge=1, le=RENDER_MAX_DIMENSION),
+                               h: Optional[int] = Query(None, ge=1, le=RENDER_MAX_DIMENSION),
+                               fmt: Optional[str] = Query(None, pattern="^(jpeg|webp|avif)$"),
+                               accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None),
+                               db: Session = Depends(get_db)):
+    # Any size, rendered from the kept original on first request and then served from image_cache
+    image = db.query(MachineModel.image).filter(MachineModel.id == machine_id).scalar()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if fmt is not None and fmt not in ENABLED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(ENABLED_FORMATS)}")
+    image_format = fmt or accepted_formats(accept)[0]
+    source = render_source(os.path.splitext(image.lstrip("/"))[0] + ".jpg")
+    if not os.path.isfile(source):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    key = render_key(source, w, h, image_format)
+    headers = {"ETag": f'"{key}"', "Cache-Control": f"public, max-age={IMAGE_MAX_AGE_SECONDS}"}
+    if fmt is None:
+        headers["Vary"] = "Accept"
+    if if_none_match and headers["ETag"] in if_none_match:
+        return Response(status_code=304, headers=headers)
+    try:
+        path = await image_cache.get_or_render(
+            key + VARIANT_FORMATS[image_format][1],
+            lambda dest: image_processor.submit(render_image, source, dest, w, h, image_format),
+        )
+    except ImageQueueFull:
+        raise HTTPException(status_code=429, detail="Image processing is busy, retry shortly",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    return FileResponse(path, media_type=VARIANT_FORMATS[image_format][2], headers=headers)
+
+
 @app.get("/machines/")
-def list_machines(db: Session = Depends(get_db)):
-    return db.query(MachineModel).all()
+def list_machines(principal: Optional[Principal] = Depends(requires(Permission.READ_CATALOG)),
+                  db: Session = Depends(get_db)):
+    query = db.query(MachineModel)
+    make = scoped_tenant_id(principal, "management")
+    if make is not None:
+        query = query.filter(MachineModel.make == make)
+    return query.all()
 
 
 @app.put("/machines/{machine_id}/", response_model=MachineModelOut)
-def update_machine(machine_id: int, machine: MachineModelUpdate, db: Session = Depends(get_db)):
-    db_machine = db.query(MachineModel).filter(MachineModel.id == machine_id).first()
-    if not db_machine:
+def update_machine(machine_id: int, machine: MachineModelUpdate,
+                   principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
+                   db: Session = Depends(get_db)):
+    check_machine_scope(db, principal, machine_id, machine.make)
+    default_months = db.query(MachineModel.default_warranty_months).filter(MachineModel.id == machine_id).scalar()
+    if default_months is None:
         raise HTTPException(status_code=404, detail="Machine not found")
-    for key, value in machine.dict().items():
-        setattr(db_machine, key, value)
-    db.commit()
-    db.refresh(db_machine)
-    return db_machine
+    values = machine.dict()
+    try:
+        if default_months != machine.default_warranty_months:
+            recompute_warranty_end_dates(db, machine_id, machine.default_warranty_months)
+        update_by_id(db, MachineModel, machine_id, values, "Machine not found")
+        sync_machine_model_lookup(db, machine_id, values)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    autocomplete_indexes.model.add(machine_id, machine.model_number)
+    return MachineModel(id=machine_id, **values)
+
+
+@app.patch("/machines/{machine_id}/")
+def patch_machine(machine_id: int, machine: MachineModelPatch,
+                  principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
+                  db: Session = Depends(get_db)):
+    changes = machine.dict(exclude_unset=True)
+    check_machine_scope(db, principal, machine_id, changes.get("make"))
+    if not changes:
+        return patch_result(machine_id, False, changes)
+    default_months = None
+    if "default_warranty_months" in changes:
+        default_months = db.query(MachineModel.default_warranty_months).filter(MachineModel.id == machine_id).scalar()
+        if default_months is None:
+            raise HTTPException(status_code=404, detail="Machine not found")
+    try:
+        changed = patch_by_id(db, MachineModel, machine_id, changes, "Machine not found")
+        if changed:
+            if default_months is not None and default_months != changes["default_warranty_months"]:
+                recompute_warranty_end_dates(db, machine_id, changes["default_warranty_months"])
+            sync_machine_model_lookup(db, machine_id, changes)
+            db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    if changed:
+        if "model_number" in changes:
+            autocomplete_indexes.model.add(machine_id, changes["model_number"])
+        notify_change("machine_model", machine_id, changes, owner=change_owner(db, MachineModel, machine_id))
+    return patch_result(machine_id, changed, changes)
+
+
+def purge_started(job: purge.PurgeJob) -> JSONResponse:
+    return JSONResponse(status_code=202, content=jsonable_encoder(job.to_dict()))
 
 
 @app.delete("/machines/{machine_id}/", status_code=204)
-def delete_machine(machine_id: int, db: Session = Depends(get_db)):
-    db_machine = db.query(MachineModel).filter(MachineModel.id == machine_id).first()
+def delete_machine(machine_id: int, background: bool = False,
+                   principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
+                   db: Session = Depends(get_db)):
+    check_machine_scope(db, principal, machine_id)
+    db_machine = db.query(MachineModel.image).filter(MachineModel.id == machine_id).first()
     if not db_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    # 🧹 Delete associated image file if it exists
-    if db_machine.image:
-        image_path = os.path.splitext(db_machine.image.lstrip("/"))[0] + ".jpg"
-        full_path = os.path.join(os.getcwd(), image_path)
-        if os.path.isfile(full_path):
-            os.remove(full_path)
-
-    db.delete(db_machine)
-    db.commit()
+    if background:
+        # The image is left to `python image_store.py gc` once the purge has removed the row
+        return purge_started(purge.purge_in_background(SessionLocal, MachineModel, "machine_model", machine_id))
+    purge.delete_entity(db, MachineModel, machine_id)
+    # 🧹 Delete the image file once no other model shares it
+    image_store.release(db, db_machine.image)
     return
 
 
-@app.get("/serial_exists/{serial_number}", response_model=bool)
+def remember_serial_numbers(serial_numbers: list[str]):
+    serial_filter.add_many(serial_numbers)
+    autocomplete_indexes.serial.add_many((serial_number, serial_number) for serial_number in serial_numbers)
+
+
+def forget_serial_numbers(serial_numbers: list[str]):
+    for serial_number in serial_numbers:
+        serial_filter.remove(serial_number)
+        autocomplete_indexes.serial.remove(serial_number)
+
+
+MAX_SERIAL_EXISTS_BATCH = 1000
+
+
+class SerialExistsBatch(BaseModel):
+    serial_numbers: List[str]
+
+
+@app.get("/serial_exists/{serial_number}", response_model=bool,
+         dependencies=[Depends(requires(Permission.READ_SERIALS))])
 def check_serial_exists(serial_number: str, db: Session = Depends(get_db)):
+    if not serial_filter.might_contain(serial_number):
+        return False
     return db.query(SerialNumbers).filter(SerialNumbers.serial_number == serial_number).first() is not None
 
 
-@app.post("/create_serial", response_model=SerialNumberOut)
-def create_serial(serial: SerialNumberCreate, db: Session = Depends(get_db)):
-    db_serial = SerialNumbers(**serial.dict())
-    db.add(db_serial)
+@app.post("/serial_exists/batch", dependencies=[Depends(requires(Permission.READ_SERIALS))])
+def check_serials_exist(payload: SerialExistsBatch, db: Session = Depends(get_db)):
+    if len(payload.serial_numbers) > MAX_SERIAL_EXISTS_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SERIAL_EXISTS_BATCH} serial numbers per request")
+    results = dict.fromkeys(payload.serial_numbers, False)
+    # Only filter hits go to the DB, all of them in one IN query
+    candidates = [serial_number for serial_number in results if serial_filter.might_contain(serial_number)]
+    if candidates:
+        for (serial_number,) in db.query(SerialNumbers.serial_number) \
+                .filter(SerialNumbers.serial_number.in_(candidates)).all():
+            results[serial_number] = True
+    return {"results": results, "db_checked": len(candidates)}
+
+
+def compute_warranty_end_date(db: Session, model_id: int, date_of_manufacturing: date,
+                              additional_warranty_months: int) -> date:
+    default_months = db.query(MachineModel.default_warranty_months).filter(MachineModel.id == model_id).scalar()
+    if default_months is None:
+        raise HTTPException(status_code=404, detail="Machine model not found")
+    return warranty_end_date(date_of_manufacturing, default_months, additional_warranty_months)
+
+
+def recompute_warranty_end_dates(db: Session, model_id: int, default_warranty_months: int):
+    # Called when a model's default warranty changes; one set-based UPDATE, no rows loaded
+    db.execute(
+        update(SerialNumbers)
+        .where(SerialNumbers.model_number == model_id)
+        .values(warranty_end_date=sql_add_months(
+            SerialNumbers.date_of_manufacturing,
+            default_warranty_months + func.coalesce(SerialNumbers.additional_warranty_months, 0),
+        ))
+    )
+    refresh_serial_lookup(db, SerialNumbers.model_number == model_id)
+
+
+def insert_serial(db: Session, serial: SerialNumberCreate) -> SerialNumberOut:
+    values = serial.dict()
+    values["warranty_end_date"] = compute_warranty_end_date(db, serial.model_number, serial.date_of_manufacturing,
+                                                            serial.additional_warranty_months)
+    try:
+        serial_id = db.execute(insert(SerialNumbers).values(**values)).inserted_primary_key[0]
+    except IntegrityError as e:
+        db.rollback()
+        # Natural key serial_number: a retry of the same create gets the stored row back, but a
+        # create that differs (another customer, model or dates) must not overwrite it
+        existing = db.query(SerialNumbers).filter(SerialNumbers.serial_number == serial.serial_number).first()
+        if existing is None:
+            raise HTTPException(status_code=400, detail=str(e.orig))
+        if any(getattr(existing, name) != value for name, value in values.items()):
+            raise HTTPException(status_code=409, detail="Serial number already exists")
+        return SerialNumberOut(id=existing.id, **values)
+    refresh_serial_lookup(db, SerialNumbers.id == serial_id)
+    search.index_serials(db.connection(), SerialNumbers.id == serial_id)
     db.commit()
-    db.refresh(db_serial)
+    remember_serial_numbers([serial.serial_number])
     data_updated_event.set()
-    return db_serial
+    return SerialNumberOut(id=serial_id, **values)
+
+
+@app.post("/create_serial", response_model=SerialNumberOut)
+def create_serial(serial: SerialNumberCreate, response: Response, idempotency_key: Optional[str] = Header(None),
+                  principal: Optional[Principal] = Depends(requires(Permission.WRITE_SERIALS)),
+                  db: Session = Depends(get_db)):
+    return idempotent(idempotency_key, "create_serial", principal, serial.dict(), response,
+                      lambda: insert_serial(db, serial))
 
 
 @app.get("/serial", response_model=list[SerialNumberOut])
-def get_all_serials(db: Session = Depends(get_db)):
-    return db.query(SerialNumbers).all()
+def get_all_serials(principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
+                    db: Session = Depends(get_db)):
+    query = db.query(SerialNumbers)
+    customer_id = scoped_tenant_id(principal, "customer")
+    if customer_id is not None:
+        query = query.filter(SerialNumbers.customer_id == customer_id)
+    return query.all()
+
+
+class SerialLookupOut(BaseModel):
+    serial_id: int
+    serial_number: str
+    date_of_manufacturing: Optional[date]
+    additional_warranty_months: Optional[int]
+    warranty_end_date: Optional[date]
+    product_warranty: Optional[str]
+    sw_version: Optional[str]
+    pcb_version: Optional[str]
+    fw_version: Optional[str]
+    design_version: Optional[str]
+    machine_model_id: int
+    model_number: Optional[str]
+    machineName: Optional[str]
+    image: Optional[str]
+    customer_id: int
+    customer_name: Optional[str]
+    warranty_status: str
+    warranty_days_remaining: Optional[int]
+
+
+@app.get("/serial/by_number/{serial_number}", response_model=SerialLookupOut)
+def get_serial_by_number(serial_number: str, principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
+                         db: Session = Depends(get_db)):
+    # Single primary-key-style lookup on the denormalized serial_lookup table
+    row = db.query(SerialLookup).filter(SerialLookup.serial_number == serial_number).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Serial number not found")
+    check_tenant_row(principal, "customer", row.customer_id, "Serial number not found")
+    days_remaining = (row.warranty_end_date - date.today()).days if row.warranty_end_date else None
+    if days_remaining is None:
+        status = "unknown"
+    else:
+        status = "active" if days_remaining >= 0 else "expired"
+    return SerialLookupOut(
+        **{column: getattr(row, column) for column in SerialLookupOut.model_fields
+           if column not in ("warranty_status", "warranty_days_remaining")},
+        warranty_status=status,
+        warranty_days_remaining=days_remaining,
+    )
+
+
+@app.get("/autocomplete", dependencies=[Depends(requires(Permission.SEARCH))])
+def autocomplete(q: str = Query(..., min_length=1), kind: Optional[str] = Query(None, pattern="^(serial|model|customer)$"),
+                 limit: int = Query(10, ge=1, le=50)):
+    # Served from the in-memory prefix indexes; no DB session needed
+    indexes = autocomplete_indexes.kinds()
+    if kind is not None:
+        indexes = {kind: indexes[kind]}
+    return {name: index.search(q, limit) for name, index in indexes.items()}
+
+
+@app.get("/search", dependencies=[Depends(requires(Permission.SEARCH))])
+def search_entities(q: str = Query(..., min_length=1), entity: Optional[List[str]] = Query(None),
+                    limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    unknown = set(entity or []) - set(search.ENTITY_CODES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown entity: {', '.join(sorted(unknown))}")
+    return search.search(db, q, entity, limit)
 
 
-@app.put("/serial/{serial_id}", response_model=SerialNumberOut)
+MAX_NEARBY_RADIUS_KM = 20000
+
+
+def scoped_customers(db: Session, principal: Optional[Principal]):
+    query = db.query(Customer)
+    customer_id = scoped_tenant_id(principal, "customer")
+    if customer_id is not None:
+        query = query.filter(Customer.id == customer_id)
+    return query
+
+
+def scoped_management(db: Session, principal: Optional[Principal]):
+    query = db.query(Management)
+    management_id = scoped_tenant_id(principal, "management")
+    if management_id is not None:
+        query = query.filter(Management.id == management_id)
+    return query
+
+
+def nearby_out(hits):
+    return [{"id": row.id, "name": row.name, "phone": row.phone, "address": row.address,
+             "latitude": row.latitude, "longitude": row.longitude, "distance_km": round(distance, 3)}
+            for distance, row in hits]
+
+
+@app.get("/customers/nearby")
+def customers_nearby(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                     radius: float = Query(50, gt=0, le=MAX_NEARBY_RADIUS_KM), limit: Optional[int] = Query(None, ge=1),
+                     principal: Optional[Principal] = Depends(requires(Permission.READ_CUSTOMERS)),
+                     db: Session = Depends(get_db)):
+    # radius in km; geohash prefix range scans, then exact distance
+    return nearby_out(geo.nearby(scoped_customers(db, principal), Customer, lat, lon, radius, limit))
+
+
+@app.get("/customers/nearest")
+def customers_nearest(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                      k: int = Query(5, ge=1, le=100),
+                      principal: Optional[Principal] = Depends(requires(Permission.READ_CUSTOMERS)),
+                      db: Session = Depends(get_db)):
+    return nearby_out(geo.nearest(scoped_customers(db, principal), Customer, lat, lon, k))
+
+
+@app.get("/management/nearby")
+def management_nearby(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                      radius: float = Query(50, gt=0, le=MAX_NEARBY_RADIUS_KM), limit: Optional[int] = Query(None, ge=1),
+                      principal: Optional[Principal] = Depends(requires(Permission.READ_MANAGEMENT)),
+                      db: Session = Depends(get_db)):
+    return nearby_out(geo.nearby(scoped_management(db, principal), Management, lat, lon, radius, limit))
+
+
+@app.get("/serial/expiring", response_model=list[SerialNumberOut])
+def list_expiring_serials(within_days: int = Query(30, ge=0), customer_id: Optional[int] = None,
+                          principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
+                          db: Session = Depends(get_db)):
+    today = date.today()
+    customer_id = scoped_tenant_id(principal, "customer", customer_id)
+    query = db.query(SerialNumbers).filter(
+        SerialNumbers.warranty_end_date >= today,
+        SerialNumbers.warranty_end_date <= today + timedelta(days=within_days),
+    )
+    if customer_id is not None:
+        query = query.filter(SerialNumbers.customer_id == customer_id)
+    return query.order_by(SerialNumbers.warranty_end_date).all()
+
+
+@app.get("/serial/expiring/by_customer")
+def expiring_serials_by_customer(within_days: int = Query(30, ge=0),
+                                 principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
+                                 db: Session = Depends(get_db)):
+    today = date.today()
+    query = (
+        db.query(SerialNumbers.customer_id, func.count(SerialNumbers.id), func.min(SerialNumbers.warranty_end_date))
+        .filter(SerialNumbers.warranty_end_date >= today,
+                SerialNumbers.warranty_end_date <= today + timedelta(days=within_days))
+    )
+    customer_id = scoped_tenant_id(principal, "customer")
+    if customer_id is not None:
+        query = query.filter(SerialNumbers.customer_id == customer_id)
+    rows = query.group_by(SerialNumbers.customer_id).all()
+    return [{"customer_id": customer_id, "expiring": count, "next_expiry": next_expiry}
+            for customer_id, count, next_expiry in rows]
+
+
+@app.get("/customers/{customer_id}/warranty_report")
+def customer_warranty_report(customer_id: int, within_days: int = Query(30, ge=0),
+                             principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
+                             db: Session = Depends(get_db)):
+    check_tenant_row(principal, "customer", customer_id, "Customer not found")
+    today = date.today()
+    serials = db.query(SerialNumbers).filter(SerialNumbers.customer_id == customer_id)
+    expired = serials.filter(SerialNumbers.warranty_end_date < today).count()
+    active = serials.filter(SerialNumbers.warranty_end_date >= today).count()
+    expiring = (
+        serials.filter(SerialNumbers.warranty_end_date >= today,
+                       SerialNumbers.warranty_end_date <= today + timedelta(days=within_days))
+        .order_by(SerialNumbers.warranty_end_date)
+        .all()
+    )
+    return {
+        "customer_id": customer_id,
+        "as_of": today,
+        "within_days": within_days,
+        "expired": expired,
+        "active": active,
+        "expiring": [SerialNumberOut.model_validate(serial) for serial in expiring],
+    }
+
+
+@app.put("/serial/{serial_id}", response_model=SerialNumberOut,
+         dependencies=[Depends(requires(Permission.WRITE_SERIALS))])
 def update_serial(serial_id: int, serial: SerialNumberUpdate, db: Session = Depends(get_db)):
-    db_serial = db.query(SerialNumbers).filter(SerialNumbers.id == serial_id).first()
-    if not db_serial:
+    # The old serial number (for the in-memory indexes) and the model's default warranty in one round trip
+    old_serial_number, default_months = db.execute(select(
+        select(SerialNumbers.serial_number).where(SerialNumbers.id == serial_id).scalar_subquery(),
+        select(MachineModel.default_warranty_months).where(MachineModel.id == serial.model_number).scalar_subquery(),
+    )).one()
+    if old_serial_number is None:
         raise HTTPException(status_code=404, detail="Serial number not found")
-    for key, value in serial.dict().items():
-        setattr(db_serial, key, value)
-    db.commit()
-    db.refresh(db_serial)
+    if default_months is None:
+        raise HTTPException(status_code=404, detail="Machine model not found")
+    values = serial.dict()
+    values["warranty_end_date"] = warranty_end_date(serial.date_of_manufacturing, default_months,
+                                                    serial.additional_warranty_months)
+    try:
+        update_by_id(db, SerialNumbers, serial_id, values, "Serial number not found")
+        refresh_serial_lookup(db, SerialNumbers.id == serial_id)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    if old_serial_number != serial.serial_number:
+        forget_serial_numbers([old_serial_number])
+        remember_serial_numbers([serial.serial_number])
     data_updated_event.set()
-    return db_serial
+    return SerialNumberOut(id=serial_id, **values)
+
+
+WARRANTY_INPUTS = {"date_of_manufacturing", "additional_warranty_months", "model_number"}
+
+
+@app.patch("/serial/{serial_id}", dependencies=[Depends(requires(Permission.WRITE_SERIALS))])
+def patch_serial(serial_id: int, serial: SerialNumberPatch, db: Session = Depends(get_db)):
+    changes = serial.dict(exclude_unset=True)
+    if not changes:
+        return patch_result(serial_id, False, changes)
+    current = None
+    if changes.keys() & (WARRANTY_INPUTS | {"serial_number"}):
+        # Needed to recompute the warranty and to update the in-memory indexes
+        current = db.query(SerialNumbers.serial_number, SerialNumbers.date_of_manufacturing,
+                           SerialNumbers.additional_warranty_months, SerialNumbers.model_number) \
+            .filter(SerialNumbers.id == serial_id).first()
+        if not current:
+            raise HTTPException(status_code=404, detail="Serial number not found")
+    values = dict(changes)
+    if changes.keys() & WARRANTY_INPUTS:
+        merged = {**current._asdict(), **changes}
+        values["warranty_end_date"] = compute_warranty_end_date(db, merged["model_number"],
+                                                                merged["date_of_manufacturing"],
+                                                                merged["additional_warranty_months"])
+    try:
+        changed = patch_by_id(db, SerialNumbers, serial_id, values, "Serial number not found")
+        if changed:
+            refresh_serial_lookup(db, SerialNumbers.id == serial_id)
+            db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    if changed:
+        if current is not None and current.serial_number != values.get("serial_number", current.serial_number):
+            forget_serial_numbers([current.serial_number])
+            remember_serial_numbers([values["serial_number"]])
+        notify_change("serial", serial_id, values, owner=change_owner(db, SerialNumbers, serial_id))
+    return patch_result(serial_id, changed, values)
 
 
-@app.delete("/serial/{serial_id}", status_code=204)
+@app.delete("/serial/{serial_id}", status_code=204, dependencies=[Depends(requires(Permission.WRITE_SERIALS))])
 def delete_serial(serial_id: int, db: Session = Depends(get_db)):
-    db_serial = db.query(SerialNumbers).filter(SerialNumbers.id == serial_id).first()
-    if not db_serial:
+    if not purge.delete_entity(db, SerialNumbers, serial_id):
         raise HTTPException(status_code=404, detail="Serial number not found")
-    db.delete(db_serial)
-    db.commit()
     data_updated_event.set()
     return {"message": "Serial number deleted"}
 
 
-@app.post("/customers/", status_code=201)
-def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
-    key_pair = generate_rsa_key_pair()
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_IMPORT_ERRORS = 1000
+
+
+def iter_import_rows(upload: UploadFile, fmt: str):
+    # Decodes the spooled upload lazily; only one line is held in memory at a time
+    # A UnicodeDecodeError ends the stream: it is yielded for the row after the last good one
+    stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    line_no = 0
+    try:
+        if fmt == "csv":
+            for line_no, row in enumerate(csv.DictReader(stream), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, e
+    except UnicodeDecodeError as e:
+        yield line_no + 1, e
+    finally:
+        stream.detach()
+
+
+def detect_import_format(upload: UploadFile, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    name = (upload.filename or "").lower()
+    content_type = upload.content_type or ""
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+@app.post("/serial/bulk_import", dependencies=[Depends(requires(Permission.WRITE_SERIALS))])
+def bulk_import_serials(
+        file: UploadFile = File(...),
+        fmt: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+        db: Session = Depends(get_db)
+):
+    fmt = detect_import_format(file, fmt)
+    warranty_months = dict(db.query(MachineModel.id, MachineModel.default_warranty_months).all())
+    customer_ids = {customer_id for (customer_id,) in db.query(Customer.id).all()}
+
+    inserted = 0
+    errors = []
+    seen = set()
+    batch = []
+
+    def report(line_no, serial_number, error):
+        if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+            errors.append({"row": line_no, "serial_number": serial_number, "error": error})
+        return 1
+
+    def flush(batch):
+        # One executemany INSERT per batch; existing serials are filtered out up front
+        numbers = [row["serial_number"] for _, row in batch]
+        existing = {number for (number,) in db.query(SerialNumbers.serial_number)
+                    .filter(SerialNumbers.serial_number.in_(numbers)).all()}
+        rows = []
+        failed = 0
+        for line_no, row in batch:
+            if row["serial_number"] in existing:
+                failed += report(line_no, row["serial_number"], "serial_number already exists")
+            else:
+                rows.append((line_no, row))
+        if not rows:
+            return 0, failed
+        try:
+            db.execute(insert(SerialNumbers), [row for _, row in rows])
+            inserted_condition = SerialNumbers.serial_number.in_([row["serial_number"] for _, row in rows])
+            refresh_serial_lookup(db, inserted_condition)
+            search.index_serials(db.connection(), inserted_condition)
+            db.commit()
+            remember_serial_numbers([row["serial_number"] for _, row in rows])
+            return len(rows), failed
+        except IntegrityError:
+            # Lost a race with a concurrent writer: retry the batch row by row
+            db.rollback()
+        done = []
+        for line_no, row in rows:
+            try:
+                db.execute(insert(SerialNumbers), [row])
+                refresh_serial_lookup(db, SerialNumbers.serial_number == row["serial_number"])
+                search.index_serials(db.connection(), SerialNumbers.serial_number == row["serial_number"])
+                db.commit()
+                done.append(row["serial_number"])
+            except IntegrityError as e:
+                db.rollback()
+                failed += report(line_no, row["serial_number"], str(e.orig))
+        remember_serial_numbers(done)
+        return len(done), failed
+
+    failed = 0
+    for line_no, raw in iter_import_rows(file, fmt):
+        if isinstance(raw, UnicodeDecodeError):
+            # Rows before this point are committed in earlier batches; the pending batch is dropped
+            raise HTTPException(status_code=400, detail={
+                "error": f"file is not valid UTF-8 at or after row {line_no} ({raw.reason})",
+                "row": line_no,
+                "inserted": inserted,
+            })
+        if isinstance(raw, Exception):
+            failed += report(line_no, None, f"invalid JSON: {raw}")
+            continue
+        if not isinstance(raw, dict):
+            failed += report(line_no, None, "expected an object")
+            continue
+        if None in raw:
+            # csv.DictReader files the fields beyond the header under the key None
+            failed += report(line_no, raw.get("serial_number"), "row has more fields than the header")
+            continue
+        try:
+            serial = SerialNumberCreate(**{key: value for key, value in raw.items() if value not in ("", None)})
+        except ValidationError as e:
+            failed += report(line_no, raw.get("serial_number"),
+                             "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        if serial.serial_number in seen:
+            failed += report(line_no, serial.serial_number, "duplicate serial_number in upload")
+            continue
+        if serial.model_number not in warranty_months:
+            failed += report(line_no, serial.serial_number, "Machine model not found")
+            continue
+        if serial.customer_id not in customer_ids:
+            failed += report(line_no, serial.serial_number, "Customer not found")
+            continue
+        seen.add(serial.serial_number)
+        row = serial.dict()
+        row["warranty_end_date"] = warranty_end_date(serial.date_of_manufacturing, warranty_months[serial.model_number],
+                                                     serial.additional_warranty_months)
+        batch.append((line_no, row))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            done, batch_failed = flush(batch)
+            inserted += done
+            failed += batch_failed
+            batch = []
+    if batch:
+        done, batch_failed = flush(batch)
+        inserted += done
+        failed += batch_failed
+
+    if inserted:
+        notify_change("serial", None, [*SerialNumberCreate.__fields__, "warranty_end_date"], count=inserted)
+    return {
+        "format": fmt,
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+    }
+
+
+BULK_UPDATE_CHUNK_SIZE = 1000
+MAX_BULK_UPDATE_SERIALS = 10000
+
+
+class SerialBulkFilter(BaseModel):
+    model_number: Optional[int] = None
+    customer_id: Optional[int] = None
+    serial_numbers: Optional[List[str]] = None
+    # current versions to upgrade from
+    fw_versions: Optional[List[str]] = None
+    sw_versions: Optional[List[str]] = None
+
+
+class SerialVersionValues(BaseModel):
+    sw_version: str = None
+    pcb_version: str = None
+    fw_version: str = None
+    design_version: str = None
+
+
+class SerialBulkUpdate(BaseModel):
+    filter: SerialBulkFilter
+    values: SerialVersionValues
+
+
+def bulk_filter_conditions(criteria: SerialBulkFilter) -> list:
+    conditions = []
+    if criteria.model_number is not None:
+        conditions.append(SerialNumbers.model_number == criteria.model_number)
+    if criteria.customer_id is not None:
+        conditions.append(SerialNumbers.customer_id == criteria.customer_id)
+    if criteria.serial_numbers is not None:
+        conditions.append(SerialNumbers.serial_number.in_(criteria.serial_numbers))
+    if criteria.fw_versions is not None:
+        conditions.append(SerialNumbers.fw_version.in_(criteria.fw_versions))
+    if criteria.sw_versions is not None:
+        conditions.append(SerialNumbers.sw_version.in_(criteria.sw_versions))
+    return conditions
+
+
+@app.post("/serial/bulk_update", dependencies=[Depends(requires(Permission.WRITE_SERIALS))])
+def bulk_update_serials(payload: SerialBulkUpdate, db: Session = Depends(get_db)):
+    values = payload.values.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No values to set")
+    conditions = bulk_filter_conditions(payload.filter)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="A filter is required; refusing to update every serial")
+    if payload.filter.serial_numbers is not None and len(payload.filter.serial_numbers) > MAX_BULK_UPDATE_SERIALS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_UPDATE_SERIALS} serial numbers per request")
+    # Rows already at the target values are skipped, so a retried rollout only touches what is left
+    conditions.append(or_(*[getattr(SerialNumbers, name).is_distinct_from(value) for name, value in values.items()]))
+
+    # Walk the matching rows in primary-key chunks; each chunk is one UPDATE in its own
+    # short transaction, so a large rollout never holds row locks on the whole model
+    updated = 0
+    chunks = 0
+    last_id = 0
+    while True:
+        ids = [serial_id for (serial_id,) in db.query(SerialNumbers.id)
+               .filter(*conditions, SerialNumbers.id > last_id)
+               .order_by(SerialNumbers.id).limit(BULK_UPDATE_CHUNK_SIZE).all()]
+        if not ids:
+            break
+        last_id = ids[-1]
+        chunk = SerialNumbers.id.in_(ids)
+        result = db.execute(
+            update(SerialNumbers).where(chunk, *conditions).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(update(SerialLookup).where(SerialLookup.serial_id.in_(ids)).values(**values))
+        search.index_serials(db.connection(), chunk)
+        db.commit()
+        updated += result.rowcount
+        chunks += 1
+
+    if updated:
+        notify_change("serial", None, values, count=updated)
+    return {"updated": updated, "chunks": chunks, "values": values}
+
+
+MAX_SERIAL_BLOCK = 10000
+
+
+class SerialAllocatorConfig(BaseModel):
+    pattern: Optional[str] = None
+    next_seq: Optional[int] = None
+
+
+class SerialAllocatorOut(BaseModel):
+    machine_model_id: int
+    pattern: str
+    next_seq: int
+
+    class Config:
+        from_attributes = True
+
+
+class SerialBlockRequest(BaseModel):
+    count: int
+    include_serials: bool = False
+
+
+def validate_serial_pattern(pattern: str) -> str:
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(pattern) if field is not None}
+        pattern.format(seq=1)
+    except (ValueError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid serial pattern: {e}")
+    if fields != {"seq"}:
+        raise HTTPException(status_code=400, detail="Serial pattern must contain exactly one {seq} field")
+    return pattern
+
+
+def highest_existing_seq(db: Session, pattern: str) -> int:
+    # Serials created before the allocator (or by hand) that already follow its pattern;
+    # the allocator starts above them so a block never repeats an existing serial_number
+    parts = list(string.Formatter().parse(pattern))
+    regex = re.compile("".join(re.escape(literal) + (r"\s*(\d+)" if field is not None else "")
+                               for literal, field, _, _ in parts) + "$")
+    highest = 0
+    numbers = db.query(SerialNumbers.serial_number) \
+        .filter(SerialNumbers.serial_number.startswith(parts[0][0], autoescape=True)).yield_per(IMPORT_BATCH_SIZE)
+    for (serial_number,) in numbers:
+        match = regex.match(serial_number)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+@app.put("/machines/{machine_id}/serial_allocator", response_model=SerialAllocatorOut)
+def configure_serial_allocator(machine_id: int, payload: SerialAllocatorConfig,
+                               principal: Optional[Principal] = Depends(requires(Permission.WRITE_CATALOG)),
+                               db: Session = Depends(get_db)):
+    check_machine_scope(db, principal, machine_id)
+    model_number = db.query(MachineModel.model_number).filter(MachineModel.id == machine_id).scalar()
+    if model_number is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    if payload.next_seq is not None and payload.next_seq < 0:
+        raise HTTPException(status_code=400, detail="next_seq must not be negative")
+
+    allocator = db.query(SerialAllocator).filter(SerialAllocator.machine_model_id == machine_id).first()
+    if allocator is None:
+        allocator = SerialAllocator(machine_model_id=machine_id,
+                                    pattern=validate_serial_pattern(payload.pattern or f"{model_number}-{{seq:06}}"),
+                                    next_seq=payload.next_seq if payload.next_seq is not None else 1)
+        db.add(allocator)
+    else:
+        if payload.pattern is not None:
+            allocator.pattern = validate_serial_pattern(payload.pattern)
+        if payload.next_seq is not None:
+            # Never rewind below numbers that were already handed out
+            if payload.next_seq < allocator.next_seq:
+                raise HTTPException(status_code=409, detail=f"next_seq is already at {allocator.next_seq}")
+            allocator.next_seq = payload.next_seq
+    if allocator.id is None or payload.pattern is not None:
+        allocator.next_seq = max(allocator.next_seq, highest_existing_seq(db, allocator.pattern) + 1)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e.orig))
+    return allocator
+
+
+@app.get("/machines/{machine_id}/serial_allocator", response_model=SerialAllocatorOut)
+def get_serial_allocator(machine_id: int, principal: Optional[Principal] = Depends(requires(Permission.READ_CATALOG)),
+                         db: Session = Depends(get_db)):
+    check_machine_scope(db, principal, machine_id)
+    allocator = db.query(SerialAllocator).filter(SerialAllocator.machine_model_id == machine_id).first()
+    if not allocator:
+        raise HTTPException(status_code=404, detail="Serial allocator not configured")
+    return allocator
+
+
+@app.post("/machines/{machine_id}/serial_blocks")
+def reserve_serial_block(machine_id: int, payload: SerialBlockRequest,
+                         principal: Optional[Principal] = Depends(requires(Permission.WRITE_SERIALS)),
+                         db: Session = Depends(get_db)):
+    check_machine_scope(db, principal, machine_id)
+    if not 0 < payload.count <= MAX_SERIAL_BLOCK:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {MAX_SERIAL_BLOCK}")
+    # The UPDATE takes the row lock, so concurrent stations serialize here and get disjoint ranges
+    result = db.execute(
+        update(SerialAllocator)
+        .where(SerialAllocator.machine_model_id == machine_id)
+        .values(next_seq=SerialAllocator.next_seq + payload.count)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Serial allocator not configured")
+    next_seq, pattern = db.query(SerialAllocator.next_seq, SerialAllocator.pattern) \
+        .filter(SerialAllocator.machine_model_id == machine_id).one()
+    db.commit()
+
+    first_seq = next_seq - payload.count
+    block = {
+        "machine_model_id": machine_id,
+        "pattern": pattern,
+        "first_seq": first_seq,
+        "last_seq": next_seq - 1,
+        "count": payload.count,
+    }
+    if payload.include_serials:
+        block["serials"] = [pattern.format(seq=seq) for seq in range(first_seq, next_seq)]
+    return block
+
+
+@app.post("/customers/", status_code=201, response_model=CustomerOut)
+def create_customer(payload: CustomerCreate, response: Response, idempotency_key: Optional[str] = Header(None),
+                    principal: Optional[Principal] = Depends(requires(Permission.WRITE_CUSTOMERS)),
+                    db: Session = Depends(get_db)):
+    # A replayed retry skips the key generation as well as the INSERT
+    return idempotent(idempotency_key, "customers", principal, payload.dict(), response,
+                      lambda: insert_customer(db, payload))
+
+
+def insert_customer(db: Session, payload: CustomerCreate) -> dict:
+    algorithm = payload.key_algorithm or DEFAULT_KEY_ALGORITHM
+    key_pair = take_key_pair(algorithm)
     customer = Customer(
         name=payload.name,
         phone=payload.phone,
@@ -530,10 +1728,11 @@ def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
         key_name=payload.key_name,
         private_key=key_pair["private_key"],
         public_key=key_pair["public_key"],
+        key_algorithm=algorithm,
     )
     db.add(customer)
     db.commit()
-    db.refresh(customer)
+    autocomplete_indexes.customer.add(customer.id, customer.name)
     return {
         "id": customer.id,
         "name": customer.name,
@@ -543,15 +1742,23 @@ def create_customer(payload: CustomerCreate, db: Session = Depends(get_db)):
         "latitude": customer.latitude,
         "longitude": customer.longitude,
         "address": customer.address,
-        "private_key": customer.private_key,
         "public_key": customer.public_key,
-        "key_name": customer.key_name
+        "key_name": customer.key_name,
+        "key_algorithm": customer.key_algorithm
     }
 
 
-@app.post("/management/", status_code=201)
-def create_management(payload: ManagementCreate, db: Session = Depends(get_db)):
-    key_pair = generate_rsa_key_pair()
+@app.post("/management/", status_code=201, response_model=ManagementOut)
+def create_management(payload: ManagementCreate, response: Response, idempotency_key: Optional[str] = Header(None),
+                      principal: Optional[Principal] = Depends(requires(Permission.WRITE_MANAGEMENT)),
+                      db: Session = Depends(get_db)):
+    return idempotent(idempotency_key, "management", principal, payload.dict(), response,
+                      lambda: insert_management(db, payload))
+
+
+def insert_management(db: Session, payload: ManagementCreate) -> dict:
+    algorithm = payload.key_algorithm or DEFAULT_KEY_ALGORITHM
+    key_pair = take_key_pair(algorithm)
     management = Management(
         name=payload.name,
         phone=payload.phone,
@@ -563,10 +1770,10 @@ def create_management(payload: ManagementCreate, db: Session = Depends(get_db)):
         key_name=payload.key_name,
         private_key=key_pair["private_key"],
         public_key=key_pair["public_key"],
+        key_algorithm=algorithm,
     )
     db.add(management)
     db.commit()
-    db.refresh(management)
     return {
         "id": management.id,
         "name": management.name,
@@ -576,44 +1783,50 @@ def create_management(payload: ManagementCreate, db: Session = Depends(get_db)):
         "latitude": management.latitude,
         "longitude": management.longitude,
         "address": management.address,
-        "private_key": management.private_key,
         "public_key": management.public_key,
-        "key_name": management.key_name
+        "key_name": management.key_name,
+        "key_algorithm": management.key_algorithm
     }
 
 
 @app.post("/customer_users/", status_code=201)
-def create_customer_user(payload: CustomerUserCreate, db: Session = Depends(get_db)):
-    customer_user = CustomerUserModel(name=payload.name, username=payload.username, password=payload.password,
+def create_customer_user(payload: CustomerUserCreate,
+                         principal: Optional[Principal] = Depends(requires(Permission.MANAGE_CUSTOMER_USERS)),
+                         db: Session = Depends(get_db)):
+    check_tenant_row(principal, "customer", payload.customer_id, "Customer not found")
+    customer_user = CustomerUserModel(name=payload.name, username=payload.username,
+                                      password=password_hasher.hash(payload.password),
                                       designation=payload.designation, privilege=payload.privilege, customer_id=payload.customer_id)
     try:
         db.add(customer_user)
         db.commit()
-        db.refresh(customer_user)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e.orig))
     # wake up any WebSocket dashboards if you need
-    return {"id": customer_user.id, "name": customer_user.name, "username": customer_user.username, "password": customer_user.password,
+    return {"id": customer_user.id, "name": customer_user.name, "username": customer_user.username,
             "designation": customer_user.designation, "privilege": customer_user.privilege, "customer_id": customer_user.customer_id}
 
 
 @app.post("/create_management_users/", status_code=201)
-def create_management_user(payload: ManagementUserCreate, db: Session = Depends(get_db)):
-    management_user = ManagementUserModel(name=payload.name, username=payload.username, password=payload.password,
+def create_management_user(payload: ManagementUserCreate,
+                           principal: Optional[Principal] = Depends(requires(Permission.MANAGE_MANAGEMENT_USERS)),
+                           db: Session = Depends(get_db)):
+    check_tenant_row(principal, "management", payload.management_id, "Management not found")
+    management_user = ManagementUserModel(name=payload.name, username=payload.username,
+                                          password=password_hasher.hash(payload.password),
                                           designation=payload.designation, privilege=payload.privilege, management_id=payload.management_id)
     try:
         db.add(management_user)
         db.commit()
-        db.refresh(management_user)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e.orig))
-    return {"id": management_user.id, "name": management_user.name, "username": management_user.username, "password": management_user.password,
+    return {"id": management_user.id, "name": management_user.name, "username": management_user.username,
             "designation": management_user.designation, "privilege": management_user.privilege, "management_id": management_user.management_id}
 
 
-@app.post("/machines/", status_code=201)
+@app.post("/machines/", status_code=201, dependencies=[Depends(requires(Permission.WRITE_CATALOG))])
 def create_machine(payload: MachineCreate, db: Session = Depends(get_db)):
     customer = db.query(Customer).filter(Customer.id == payload.customer_id).first()
     if not customer:
@@ -625,7 +1838,6 @@ def create_machine(payload: MachineCreate, db: Session = Depends(get_db)):
     )
     db.add(machine)
     db.commit()
-    db.refresh(machine)
     data_updated_event.set()
     return {
         "id": machine.id,
@@ -634,156 +1846,359 @@ def create_machine(payload: MachineCreate, db: Session = Depends(get_db)):
     }
 
 
-@app.put("/customers/{customer_id}/")
-def update_customer(customer_id: int, payload: CustomerCreate, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    customer.name = payload.name
-    customer.phone = payload.phone
-    customer.email = payload.email
-    customer.gst = payload.gst
-    customer.latitude = payload.latitude
-    customer.longitude = payload.longitude
-    customer.address = payload.address
-    customer.key_name = payload.key_name
-    customer.private_key = payload.private_key
-    customer.public_key = payload.public_key
+def coordinate_values(payload) -> dict:
+    values = payload.dict()
+    # The geohash listener only runs on ORM flushes
+    values["geohash"] = geo.geohash_for(payload.latitude, payload.longitude)
+    return values
+
+
+@app.put("/customers/{customer_id}/", dependencies=[Depends(requires(Permission.WRITE_CUSTOMERS))])
+def update_customer(customer_id: int, payload: CustomerUpdate, db: Session = Depends(get_db)):
+    values = coordinate_values(payload)
+    update_by_id(db, Customer, customer_id, values, "Customer not found")
+    sync_customer_lookup(db, customer_id, payload.name)
     db.commit()
-    db.refresh(customer)
-    return {"id": customer.id, "name": customer.name, "phone": customer.phone, "email": customer.email,
-            "gst": customer.gst, "latitude": customer.latitude, "longitude": customer.longitude,
-            "address": customer.address, "key_name": customer.key_name, "private_key": customer.private_key, "public_key": customer.public_key}
+    autocomplete_indexes.customer.add(customer_id, payload.name)
+    return {"id": customer_id, **payload.dict()}
 
 
 @app.put("/management/{management_id}/")
-def update_management(management_id: int, payload: ManagementCreate, db: Session = Depends(get_db)):
-    management = db.query(Management).filter(Management.id == management_id).first()
-    if not management:
-        raise HTTPException(status_code=404, detail="Management not found")
-    management.name = payload.name
-    management.phone = payload.phone
-    management.email = payload.email
-    management.gst = payload.gst
-    management.latitude = payload.latitude
-    management.longitude = payload.longitude
-    management.address = payload.address
-    management.key_name = payload.key_name
-    management.private_key = payload.private_key
-    management.public_key = payload.public_key
+def update_management(management_id: int, payload: ManagementUpdate,
+                      principal: Optional[Principal] = Depends(requires(Permission.WRITE_MANAGEMENT)),
+                      db: Session = Depends(get_db)):
+    check_tenant_row(principal, "management", management_id, "Management not found")
+    update_by_id(db, Management, management_id, coordinate_values(payload), "Management not found")
     db.commit()
-    db.refresh(management)
-    return {"id": management.id, "name": management.name, "phone": management.phone, "email": management.email,
-            "gst": management.gst, "latitude": management.latitude, "longitude": management.longitude,
-            "address": management.address, "key_name": management.key_name, "private_key": management.private_key, "public_key": management.public_key}
+    return {"id": management_id, **payload.dict()}
 
 
 @app.put("/customer_users/{user_id}/")
-def update_customer_users(user_id: int, payload: CustomerUserCreate, db: Session = Depends(get_db)):
-    customer_users = db.query(CustomerUserModel).filter(CustomerUserModel.id == user_id).first()
-    if not customer_users:
-        raise HTTPException(status_code=404, detail="User's not found")
-    customer_users.name = payload.name
-    customer_users.username = payload.username
-    customer_users.password = payload.password
-    customer_users.designation = payload.designation
-    customer_users.privilege = payload.privilege
-    customer_users.customer_id = payload.customer_id
-    db.commit()
-    db.refresh(customer_users)
-    return {"id": customer_users.id, "name": customer_users.name, "username": customer_users.username, "password": customer_users.password,
-            "designation": customer_users.designation, "privilege": customer_users.privilege, "customer_id": customer_users.customer_id}
+def update_customer_users(user_id: int, payload: CustomerUserCreate,
+                          principal: Optional[Principal] = Depends(requires(Permission.MANAGE_CUSTOMER_USERS)),
+                          db: Session = Depends(get_db)):
+    check_user_scope(db, principal, CustomerUserModel, user_id, payload.customer_id)
+    try:
+        # A PUT always rehashes the password, so it always revokes the user's tokens
+        values = {**payload.dict(), "password": password_hasher.hash(payload.password),
+                  "token_version": CustomerUserModel.token_version + 1}
+        update_by_id(db, CustomerUserModel, user_id, values, "User's not found")
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    auth.forget_user("customer", user_id)
+    return {"id": user_id, **payload.dict(exclude={"password"})}
 
 
 @app.put("/management_users/{user_id}/")
-def update_management_users(user_id: int, payload: ManagementUserCreate, db: Session = Depends(get_db)):
-    management_users = db.query(ManagementUserModel).filter(ManagementUserModel.id == user_id).first()
-    if not management_users:
-        raise HTTPException(status_code=404, detail="User's not found")
-    management_users.name = payload.name
-    management_users.username = payload.username
-    management_users.password = payload.password
-    management_users.designation = payload.designation
-    management_users.privilege = payload.privilege
-    management_users.management_id = payload.management_id
-    db.commit()
-    db.refresh(management_users)
-    return {"id": management_users.id, "name": management_users.name, "username": management_users.username, "password": management_users.password,
-            "designation": management_users.designation, "privilege": management_users.privilege, "management_id": management_users.management_id}
+def update_management_users(user_id: int, payload: ManagementUserCreate,
+                            principal: Optional[Principal] = Depends(requires(Permission.MANAGE_MANAGEMENT_USERS)),
+                            db: Session = Depends(get_db)):
+    check_user_scope(db, principal, ManagementUserModel, user_id, payload.management_id)
+    try:
+        # A PUT always rehashes the password, so it always revokes the user's tokens
+        values = {**payload.dict(), "password": password_hasher.hash(payload.password),
+                  "token_version": ManagementUserModel.token_version + 1}
+        update_by_id(db, ManagementUserModel, user_id, values, "User's not found")
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    auth.forget_user("management", user_id)
+    return {"id": user_id, **payload.dict(exclude={"password"})}
 
 
-@app.delete("/delete_customers/{customer_id}", status_code=204)
-def delete_customer(customer_id: int, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(customer)
+def coordinate_changes(db: Session, model, entity_id: int, changes: dict) -> dict:
+    # The geohash needs both coordinates; read the one the PATCH did not send
+    if not changes.keys() & {"latitude", "longitude"}:
+        return changes
+    coordinates = {}
+    if not changes.keys() >= {"latitude", "longitude"}:
+        current = db.query(model.latitude, model.longitude).filter(model.id == entity_id).first()
+        if not current:
+            raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+        coordinates = current._asdict()
+    coordinates.update(changes)
+    return {**changes, "geohash": geo.geohash_for(coordinates["latitude"], coordinates["longitude"])}
+
+
+class KeyRotation(TenantKeyMixin):
+    key_algorithm: Optional[str] = None
+
+
+def rotate_tenant_keys(db: Session, model, entity_id: int, algorithm: Optional[str]) -> dict:
+    # Also the way to move an existing RSA tenant onto an elliptic-curve key
+    algorithm = algorithm or DEFAULT_KEY_ALGORITHM
+    key_pair = take_key_pair(algorithm)
+    update_by_id(db, model, entity_id, {**key_pair, "key_algorithm": algorithm}, f"{model.__name__} not found")
     db.commit()
+    if model is Customer:
+        tenant_pems.pop(entity_id)
+    return {"id": entity_id, "key_algorithm": algorithm, "public_key": key_pair["public_key"]}
+
+
+@app.post("/customers/{customer_id}/rotate_keys", dependencies=[Depends(requires(Permission.MANAGE_KEYS))])
+def rotate_customer_keys(customer_id: int, payload: KeyRotation, db: Session = Depends(get_db)):
+    return rotate_tenant_keys(db, Customer, customer_id, payload.key_algorithm)
+
+
+@app.post("/management/{management_id}/rotate_keys")
+def rotate_management_keys(management_id: int, payload: KeyRotation,
+                           principal: Optional[Principal] = Depends(requires(Permission.MANAGE_KEYS)),
+                           db: Session = Depends(get_db)):
+    check_tenant_row(principal, "management", management_id, "Management not found")
+    return rotate_tenant_keys(db, Management, management_id, payload.key_algorithm)
+
+
+@app.patch("/customers/{customer_id}/", dependencies=[Depends(requires(Permission.WRITE_CUSTOMERS))])
+def patch_customer(customer_id: int, payload: CustomerPatch, db: Session = Depends(get_db)):
+    changes = payload.dict(exclude_unset=True)
+    if not changes:
+        return patch_result(customer_id, False, changes)
+    changed = patch_by_id(db, Customer, customer_id, coordinate_changes(db, Customer, customer_id, changes),
+                          "Customer not found")
+    if changed:
+        if "name" in changes:
+            sync_customer_lookup(db, customer_id, changes["name"])
+        db.commit()
+        if "name" in changes:
+            autocomplete_indexes.customer.add(customer_id, changes["name"])
+        notify_change("customer", customer_id, changes, owner=("customer", customer_id))
+    return patch_result(customer_id, changed, changes)
+
+
+@app.patch("/management/{management_id}/")
+def patch_management(management_id: int, payload: ManagementPatch,
+                     principal: Optional[Principal] = Depends(requires(Permission.WRITE_MANAGEMENT)),
+                     db: Session = Depends(get_db)):
+    check_tenant_row(principal, "management", management_id, "Management not found")
+    changes = payload.dict(exclude_unset=True)
+    if not changes:
+        return patch_result(management_id, False, changes)
+    changed = patch_by_id(db, Management, management_id, coordinate_changes(db, Management, management_id, changes),
+                          "Management not found")
+    if changed:
+        db.commit()
+        notify_change("management", management_id, changes, owner=("management", management_id))
+    return patch_result(management_id, changed, changes)
+
+
+def check_user_scope(db: Session, principal: Optional[Principal], model, user_id: int,
+                     new_tenant_id: Optional[int] = None):
+    # Scoped callers may only touch users of their own tenant, and may not move them out of it
+    kind = "customer" if model is CustomerUserModel else "management"
+    if tenant_scope(principal, kind) is None:
+        return
+    tenant_column = getattr(model, f"{kind}_id")
+    tenant_id = db.query(tenant_column).filter(model.id == user_id).scalar()
+    check_tenant_row(principal, kind, tenant_id, "User's not found")
+    if new_tenant_id is not None:
+        check_tenant_row(principal, kind, new_tenant_id, "User's not found")
+
+
+# Changing any of these revokes the user's tokens (see auth)
+TOKEN_FIELDS = {"username", "password", "privilege", "customer_id", "management_id"}
+
+
+def patch_user(db: Session, model, entity: str, user_id: int, changes: dict) -> dict:
+    if not changes:
+        return patch_result(user_id, False, changes)
+    values = dict(changes)
+    if "password" in changes:
+        # A fresh salt makes every password PATCH a change
+        values["password"] = password_hasher.hash(changes.pop("password"))
+    revokes = bool(values.keys() & TOKEN_FIELDS)
+    try:
+        changed = patch_by_id(db, model, user_id, values, "User's not found")
+        if changed and revokes:
+            db.execute(update(model).where(model.id == user_id).values(token_version=model.token_version + 1)
+                       .execution_options(synchronize_session=False))
+        if changed:
+            db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    if changed:
+        if revokes:
+            auth.forget_user("customer" if model is CustomerUserModel else "management", user_id)
+        notify_change(entity, user_id, changes, owner=change_owner(db, model, user_id))
+    return patch_result(user_id, changed, changes)
+
+
+@app.patch("/customer_users/{user_id}/")
+def patch_customer_user(user_id: int, payload: CustomerUserPatch,
+                        principal: Optional[Principal] = Depends(requires(Permission.MANAGE_CUSTOMER_USERS)),
+                        db: Session = Depends(get_db)):
+    check_user_scope(db, principal, CustomerUserModel, user_id, payload.customer_id)
+    return patch_user(db, CustomerUserModel, "customer_user", user_id, payload.dict(exclude_unset=True))
+
+
+@app.patch("/management_users/{user_id}/")
+def patch_management_user(user_id: int, payload: ManagementUserPatch,
+                          principal: Optional[Principal] = Depends(requires(Permission.MANAGE_MANAGEMENT_USERS)),
+                          db: Session = Depends(get_db)):
+    check_user_scope(db, principal, ManagementUserModel, user_id, payload.management_id)
+    return patch_user(db, ManagementUserModel, "management_user", user_id, payload.dict(exclude_unset=True))
+
+
+@app.delete("/delete_customers/{customer_id}", status_code=204,
+            dependencies=[Depends(requires(Permission.WRITE_CUSTOMERS))])
+def delete_customer(customer_id: int, background: bool = False, db: Session = Depends(get_db)):
+    # ?background=true: 202 with a purge job that deletes the tenant's rows in chunks
+    if background:
+        if db.query(Customer.id).filter(Customer.id == customer_id).first() is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return purge_started(purge.purge_in_background(SessionLocal, Customer, "customer", customer_id))
+    if not purge.delete_entity(db, Customer, customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    tenant_pems.pop(customer_id)
+    auth.forget_tenant("customer", customer_id)
     return
 
 
 @app.delete("/delete_management/{management_id}", status_code=204)
-def delete_management(management_id: int, db: Session = Depends(get_db)):
-    management = db.query(Management).filter(Management.id == management_id).first()
-    if not management:
+def delete_management(management_id: int, background: bool = False,
+                      principal: Optional[Principal] = Depends(requires(Permission.WRITE_MANAGEMENT)),
+                      db: Session = Depends(get_db)):
+    check_tenant_row(principal, "management", management_id, "Management not found")
+    if background:
+        if db.query(Management.id).filter(Management.id == management_id).first() is None:
+            raise HTTPException(status_code=404, detail="Management not found")
+        return purge_started(purge.purge_in_background(SessionLocal, Management, "management", management_id))
+    if not purge.delete_entity(db, Management, management_id):
         raise HTTPException(status_code=404, detail="Management not found")
-    db.delete(management)
-    db.commit()
+    auth.forget_tenant("management", management_id)
     return
 
 
 @app.delete("/customer_users/{user_id}", status_code=204)
-def delete_customer_users(user_id: int, db: Session = Depends(get_db)):
-    customer_users = db.query(CustomerUserModel).filter(CustomerUserModel.id == user_id).first()
-    if not customer_users:
+def delete_customer_users(user_id: int,
+                          principal: Optional[Principal] = Depends(requires(Permission.MANAGE_CUSTOMER_USERS)),
+                          db: Session = Depends(get_db)):
+    check_user_scope(db, principal, CustomerUserModel, user_id)
+    if not purge.delete_entity(db, CustomerUserModel, user_id):
         raise HTTPException(status_code=404, detail="User's not found")
-    db.delete(customer_users)
-    db.commit()
+    auth.forget_user("customer", user_id)
     return
 
 
 @app.delete("/management_users/{user_id}", status_code=204)
-def delete_management_users(user_id: int, db: Session = Depends(get_db)):
-    management_users = db.query(ManagementUserModel).filter(ManagementUserModel.id == user_id).first()
-    if not management_users:
+def delete_management_users(user_id: int,
+                            principal: Optional[Principal] = Depends(requires(Permission.MANAGE_MANAGEMENT_USERS)),
+                            db: Session = Depends(get_db)):
+    check_user_scope(db, principal, ManagementUserModel, user_id)
+    if not purge.delete_entity(db, ManagementUserModel, user_id):
         raise HTTPException(status_code=404, detail="User's not found")
-    db.delete(management_users)
-    db.commit()
+    auth.forget_user("management", user_id)
     return
 
 
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+    kind: Literal["customer", "management"] = "customer"
+
+
+@app.post("/login/")
+async def login(payload: LoginRequest):
+    # Hashing runs in password_hasher's process pool, DB work in the threadpool
+    user = await run_in_threadpool(auth.find_user, SessionLocal, payload.kind, payload.username)
+    stored = user.password if user is not None else DUMMY_HASH
+    if not await password_hasher.verify_async(payload.password, stored) or user is None:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    if needs_rehash(stored):
+        password_hash = await password_hasher.hash_async(payload.password)
+        await run_in_threadpool(auth.store_password_hash, SessionLocal, payload.kind, user.id, password_hash)
+    return auth.issue_token(payload.kind, user)
+
+
+@app.get("/auth/me")
+def whoami(claims: dict = Depends(get_claims)):
+    return {**claims, "permissions": Principal.from_claims(claims).to_dict()["permissions"]}
+
+
+@app.get("/key_pool/stats", dependencies=[Depends(requires(Permission.OPERATIONS))])
+def key_pool_stats():
+    return rsa_key_pool.stats()
+
+
+@app.get("/submit/encrypted/stats", dependencies=[Depends(requires(Permission.OPERATIONS))])
+def encrypted_ingest_stats():
+    return decrypt_batcher.stats()
+
+
+@app.get("/image_pool/stats", dependencies=[Depends(requires(Permission.OPERATIONS))])
+def image_pool_stats():
+    return {**image_processor.stats(), "cache": image_cache.stats()}
+
+
+@app.get("/purge_jobs/", dependencies=[Depends(requires(Permission.OPERATIONS))])
+def list_purge_jobs():
+    return [job.to_dict() for job in purge.list_jobs()]
+
+
+@app.get("/purge_jobs/{job_id}", dependencies=[Depends(requires(Permission.OPERATIONS))])
+def get_purge_job(job_id: str):
+    job = purge.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Purge job not found")
+    return job.to_dict()
+
+
 @app.websocket("/ws/machines/")
 async def websocket_machines(websocket: WebSocket):
     await websocket.accept()
+    token = await websocket_token(websocket)
+    principal = await websocket_principal(token, Permission.READ_CATALOG)
+    last_seq = recent_changes[-1][1]["seq"] if recent_changes else 0
     try:
         while True:
             await data_updated_event.wait()  # wait until something updates
-            await websocket.send_json({"event": "machine_data_updated"})
+            # A token revoked or expired since the last push ends the connection
+            principal = await websocket_principal(token, Permission.READ_CATALOG)
+            # Only the records this client has not seen, and only its own tenant's; writes that
+            # do not record a change (create, delete, PUT) still send the bare event
+            unseen = [(owner, change) for owner, change in list(recent_changes) if change["seq"] > last_seq]
+            if unseen:
+                last_seq = unseen[-1][1]["seq"]
+            changes = [change for owner, change in unseen if change_visible(principal, owner)]
+            await websocket.send_json({"event": "machine_data_updated", "changes": changes})
             data_updated_event.clear()  # reset the flag
+    except WebSocketException:
+        raise
     except Exception as e:
         print(f"WebSocket error: {e}")
 
 
-@app.get("/customers/")
-def list_customers(db: Session = Depends(get_db)):
-    return db.query(Customer).all()
+@app.get("/customers/", response_model=List[CustomerOut])
+def list_customers(principal: Optional[Principal] = Depends(requires(Permission.READ_CUSTOMERS)),
+                   db: Session = Depends(get_db)):
+    return scoped_customers(db, principal).all()
 
 
-@app.get("/management/")
-def list_management(db: Session = Depends(get_db)):
-    return db.query(Management).all()
+@app.get("/management/", response_model=List[ManagementOut])
+def list_management(principal: Optional[Principal] = Depends(requires(Permission.READ_MANAGEMENT)),
+                    db: Session = Depends(get_db)):
+    return scoped_management(db, principal).all()
 
 
-@app.get("/customer_users/")
-def list_customer_users(customer_id: int = None, db: Session = Depends(get_db)):
+@app.get("/customer_users/", response_model=List[CustomerUserOut])
+def list_customer_users(customer_id: int = None,
+                        principal: Optional[Principal] = Depends(requires(Permission.MANAGE_CUSTOMER_USERS)),
+                        db: Session = Depends(get_db)):
+    customer_id = scoped_tenant_id(principal, "customer", customer_id)
     query = db.query(CustomerUserModel)
     if customer_id is not None:
         query = query.filter(CustomerUserModel.customer_id == customer_id)
     return query.all()
 
 
-@app.get("/management_users/")
-def list_management_users(management_id: int = None, db: Session = Depends(get_db)):
+@app.get("/management_users/", response_model=List[ManagementUserOut])
+def list_management_users(management_id: int = None,
+                          principal: Optional[Principal] = Depends(requires(Permission.MANAGE_MANAGEMENT_USERS)),
+                          db: Session = Depends(get_db)):
+    management_id = scoped_tenant_id(principal, "management", management_id)
     query = db.query(ManagementUserModel)
     if management_id is not None:
         query = query.filter(ManagementUserModel.management_id == management_id)
@@ -793,17 +2208,19 @@ def list_management_users(management_id: int = None, db: Session = Depends(get_d
 @app.get("/get_machines/", response_model=List[MachineOut])
 def list_machines(
         customer_id: int | None = None,
+        principal: Optional[Principal] = Depends(requires(Permission.READ_SERIALS)),
         db: Session = Depends(get_db)
 ):
     query = db.query(MachineModel)
+    customer_id = scoped_tenant_id(principal, "customer", customer_id)
 
     if customer_id is not None:
+        # contains_eager: serial_numbers holds only this customer's serials, not every serial of the model
         query = (
             db.query(MachineModel)
             .join(MachineModel.serial_numbers)
             .filter(SerialNumbers.customer_id == customer_id)
-            .options(joinedload(MachineModel.serial_numbers))
-            .distinct()
+            .options(contains_eager(MachineModel.serial_numbers))
         )
     return query.all()
 
@@ -828,12 +2245,24 @@ def load_public_key_bytes(pem_str: str) -> bytes:
     )
 
 
-# store data per functionCode
-dashboard_store = {
-    "Running List": [],
-    "Waiting List": [],
-    "Flow details": {}
-}
+def empty_dashboard() -> dict:
+    return {
+        "Running List": [],
+        "Waiting List": [],
+        "Flow details": {}
+    }
+
+
+# store data per functionCode: everything submitted, plus each customer's own submissions
+dashboard_store = empty_dashboard()
+tenant_dashboards: Dict[int, dict] = {}
+
+
+def dashboard_for(principal: Optional[Principal]) -> dict:
+    customer_id = tenant_scope(principal, "customer")
+    if customer_id is None:
+        return dashboard_store
+    return tenant_dashboards.get(customer_id) or empty_dashboard()
 
 
 class SubmitPayload(BaseModel):
@@ -842,7 +2271,8 @@ class SubmitPayload(BaseModel):
 
 
 @app.post("/submit/")
-async def submit_data(payload: SubmitPayload):
+async def submit_data(payload: SubmitPayload,
+                      principal: Optional[Principal] = Depends(requires(Permission.SUBMIT_DATA))):
     global dashboard_store
 
     # ✅ Print incoming data in server logs
@@ -851,35 +2281,99 @@ async def submit_data(payload: SubmitPayload):
     print("Data:", payload.data)
     print("=========================\n")
 
+    store_submission(payload, tenant_scope(principal, "customer"))
+    return {"status": "success", "functionCode": payload.functionCode}
+
+
+def store_submission(payload: SubmitPayload, customer_id: Optional[int]):
     # store into correct section
     dashboard_store[payload.functionCode] = payload.data
+    if customer_id is not None:
+        tenant_dashboards.setdefault(customer_id, empty_dashboard())[payload.functionCode] = payload.data
 
     # trigger websocket update
     data_updated_event.set()
     data_updated_event.clear()
 
-    return {"status": "success", "functionCode": payload.functionCode}
+
+class EncryptedSubmit(EncryptedDataOnly):
+    # The controller's tenant; its key unwraps encrypted_key (see encrypted_ingest)
+    customer_id: int
+    oaep_hash: Literal["sha256", "sha1"] = "sha256"  # RSA tenants only
+
+
+def load_tenant_pem(customer_id: int):
+    db = SessionLocal()
+    try:
+        row = db.query(Customer.key_algorithm, Customer.private_key).filter(Customer.id == customer_id).first()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    private_pem = normalize_pem(row.private_key or "")
+    cached = (key_id(customer_id, private_pem), row.key_algorithm, private_pem)
+    tenant_pems.put(customer_id, cached)
+    return cached
+
+
+async def decrypt_submission(payload: EncryptedSubmit) -> bytes:
+    cached = tenant_pems.get(payload.customer_id)
+    tenant = cached or await run_in_threadpool(load_tenant_pem, payload.customer_id)
+    while True:
+        if tenant is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        tenant_key_id, algorithm, private_pem = tenant
+        if algorithm not in INGEST_ALGORITHMS:
+            raise HTTPException(status_code=400, detail=f"Customer key is {algorithm}; encrypted submit needs one of "
+                                                        f"{', '.join(INGEST_ALGORITHMS)} (rotate the keys)")
+        try:
+            return await decrypt_batcher.decrypt((tenant_key_id, algorithm, private_pem, payload.encrypted_key,
+                                                  payload.iv, payload.encrypted_data, payload.oaep_hash))
+        except DecryptionError as e:
+            if cached is None:
+                raise HTTPException(status_code=400, detail=f"Could not decrypt payload ({e})")
+        # The cached key may predate a rotation made through another worker; retry once from the DB
+        cached = None
+        tenant_pems.pop(payload.customer_id)
+        tenant = await run_in_threadpool(load_tenant_pem, payload.customer_id)
+
+
+@app.post("/submit/encrypted")
+async def submit_encrypted(payload: EncryptedSubmit,
+                           principal: Optional[Principal] = Depends(requires(Permission.SUBMIT_DATA))):
+    check_tenant_row(principal, "customer", payload.customer_id, "Customer not found")
+    plaintext = await decrypt_submission(payload)
+    try:
+        submission = SubmitPayload.model_validate_json(plaintext)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Decrypted payload is not a submission: {e.errors()}")
+    # Decrypted data is not printed like /submit/ does
+    store_submission(submission, payload.customer_id)
+    return {"status": "success", "functionCode": submission.functionCode}
 
 
 @app.websocket("/ws/dashboard")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    token = await websocket_token(websocket)
+    principal = await websocket_principal(token, Permission.VIEW_DASHBOARD)
 
     # Send initial snapshot
-    await websocket.send_text(json.dumps(dashboard_store))
+    await websocket.send_text(json.dumps(dashboard_for(principal)))
 
     while True:
         await data_updated_event.wait()
         data_updated_event.clear()
-        await websocket.send_text(json.dumps(dashboard_store))
+        principal = await websocket_principal(token, Permission.VIEW_DASHBOARD)
+        await websocket.send_text(json.dumps(dashboard_for(principal)))
 
 
 @app.get("/get_dashboard/")
-async def get_dashboard():
-    return dashboard_store
+async def get_dashboard(principal: Optional[Principal] = Depends(requires(Permission.VIEW_DASHBOARD))):
+    return dashboard_for(principal)
 
 
-@app.get("/response/")
+@app.get("/response/", dependencies=[Depends(requires(Permission.VIEW_DASHBOARD))])
 async def get_latest_response():
     if latest_data is None:
         return {"message": "No data received yet"}
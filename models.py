@@ -1,5 +1,5 @@
 from enum import Enum
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, JSON, Index, Date, DateTime, Boolean, Float
 from database import Base
 from sqlalchemy.orm import relationship
 
@@ -20,6 +20,10 @@ class CustomerPrivilegeEnum(str, Enum):
 
 class DataEntry(Base):
     __tablename__ = "data_entries"
+    __table_args__ = (
+        Index("ix_data_entries_customer_id", "customer_id"),
+        Index("ix_data_entries_machine_id", "machine_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     functionCode = Column(String(500))
@@ -36,6 +40,9 @@ class DataEntry(Base):
 
 class MachineDetails(Base):
     __tablename__ = "machine_details"
+    __table_args__ = (
+        Index("ix_machine_details_customer_id", "customer_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     batch_id = Column(Integer)
@@ -61,19 +68,25 @@ class Customer(Base):
     phone = Column(String(20))
     email = Column(String(255))
     gst = Column(String(50))
-    latitude = Column(String(500))
-    longitude = Column(String(500))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Pre-0008 text that could not be converted to degrees; NULL for every other row
+    latitude_raw = Column(String(500))
+    longitude_raw = Column(String(500))
+    geohash = Column(String(12), index=True)  # maintained by geo.register()
     address = Column(Text)
 
     private_key = Column(Text)
     public_key = Column(Text)
     key_name = Column(String(500))
+    key_algorithm = Column(String(32), nullable=False, server_default="rsa-2048")  # see tenant_keys
 
     # machines = relationship("MachineModel", back_populates="customer", cascade="all, delete")
-    customer_users = relationship("CustomerUserModel", back_populates="customer", cascade="all, delete")
-    customer_serial = relationship("SerialNumbers", back_populates="customer_serial", cascade="all, delete")
-    data_entry = relationship("DataEntry", back_populates="customer", cascade="all, delete")
-    client_data = relationship("MachineDetails", back_populates="Client", cascade="all, delete")
+    # passive_deletes: children go through the FKs' ON DELETE CASCADE instead of being loaded and deleted one by one
+    customer_users = relationship("CustomerUserModel", back_populates="customer", cascade="all, delete", passive_deletes=True)
+    customer_serial = relationship("SerialNumbers", back_populates="customer_serial", cascade="all, delete", passive_deletes=True)
+    data_entry = relationship("DataEntry", back_populates="customer", cascade="all, delete", passive_deletes=True)
+    client_data = relationship("MachineDetails", back_populates="Client", cascade="all, delete", passive_deletes=True)
 
 
 class Management(Base):
@@ -84,27 +97,36 @@ class Management(Base):
     phone = Column(String(20))
     email = Column(String(100))
     gst = Column(String(500))
-    latitude = Column(String(500))
-    longitude = Column(String(500))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Pre-0008 text that could not be converted to degrees; NULL for every other row
+    latitude_raw = Column(String(500))
+    longitude_raw = Column(String(500))
+    geohash = Column(String(12), index=True)  # maintained by geo.register()
     address = Column(Text)
 
     private_key = Column(Text)
     public_key = Column(Text)
     key_name = Column(String(500))
+    key_algorithm = Column(String(32), nullable=False, server_default="rsa-2048")  # see tenant_keys
 
-    machines = relationship("MachineModel", back_populates="machineMake", cascade="all, delete")
-    management_users = relationship("ManagementUserModel", back_populates="management", cascade="all, delete")
+    machines = relationship("MachineModel", back_populates="machineMake", cascade="all, delete", passive_deletes=True)
+    management_users = relationship("ManagementUserModel", back_populates="management", cascade="all, delete", passive_deletes=True)
     # data_entry = relationship("DataEntry", back_populates="customer", cascade="all, delete")
 
 
 class ManagementUserModel(Base):
     __tablename__ = "management_user_model"
+    __table_args__ = (
+        Index("ix_management_user_model_management_id", "management_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(500), nullable=False)
     username = Column(String(500), unique=True, nullable=False)
-    password = Column(String(500), unique=True, nullable=False)
+    password = Column(String(500), nullable=False)  # scrypt hash, see passwords
     designation = Column(String(800), nullable=False)
     privilege = Column(String(500), nullable=False)
+    token_version = Column(Integer, nullable=False, server_default="0")  # bumped to revoke tokens, see auth
 
     management_id = Column(Integer, ForeignKey("management.id", ondelete="CASCADE"), nullable=False)
     management = relationship("Management", back_populates="management_users")
@@ -112,12 +134,16 @@ class ManagementUserModel(Base):
 
 class CustomerUserModel(Base):
     __tablename__ = "customer_user_model"
+    __table_args__ = (
+        Index("ix_customer_user_model_customer_id", "customer_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(500), nullable=False)
     username = Column(String(500), unique=True, nullable=False)
-    password = Column(String(500), unique=True, nullable=False)
+    password = Column(String(500), nullable=False)  # scrypt hash, see passwords
     designation = Column(String(800), nullable=False)
     privilege = Column(String(500), nullable=False)
+    token_version = Column(Integer, nullable=False, server_default="0")  # bumped to revoke tokens, see auth
 
     customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
     customer = relationship("Customer", back_populates="customer_users")
@@ -125,6 +151,9 @@ class CustomerUserModel(Base):
 
 class MachineModel(Base):
     __tablename__ = "machine_model"
+    __table_args__ = (
+        Index("ix_machine_model_make", "make"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     machineName = Column(String(500), nullable=False)
     model_number = Column(String(500), unique=True, nullable=False)
@@ -143,19 +172,29 @@ class MachineModel(Base):
     make = Column(Integer, ForeignKey("management.id", ondelete="CASCADE"), nullable=False)
     machineMake = relationship("Management", back_populates="machines")
 
-    data_entry_machines = relationship("DataEntry", back_populates="machine", cascade="all, delete")
+    data_entry_machines = relationship("DataEntry", back_populates="machine", cascade="all, delete", passive_deletes=True)
 
     # Optional: Add reverse relation for serial numbers
-    serial_numbers = relationship("SerialNumbers", back_populates="machine_model", cascade="all, delete-orphan")
+    serial_numbers = relationship("SerialNumbers", back_populates="machine_model", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class SerialNumbers(Base):
     __tablename__ = "serial_numbers"
+    __table_args__ = (
+        # /get_machines/?customer_id= filters on customer and joins to the model
+        Index("ix_serial_numbers_customer_id_model_number", "customer_id", "model_number"),
+        Index("ix_serial_numbers_model_number", "model_number"),
+        # /serial/expiring and the per-customer warranty reports are range scans on these
+        Index("ix_serial_numbers_warranty_end_date", "warranty_end_date"),
+        Index("ix_serial_numbers_customer_id_warranty_end_date", "customer_id", "warranty_end_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     serial_number = Column(String(500), unique=True, nullable=False)
-    date_of_manufacturing = Column(String(500), nullable=False)
-    additional_warranty_months = Column(String(500), nullable=False)
-    warranty_end_date = Column(String(500), nullable=False)
+    # NULL only for legacy rows whose text dates could not be parsed by the migration
+    date_of_manufacturing = Column(Date)
+    additional_warranty_months = Column(Integer, nullable=False, default=0)
+    # date_of_manufacturing + MachineModel.default_warranty_months + additional_warranty_months
+    warranty_end_date = Column(Date)
     product_warranty = Column(String(500), nullable=False)
     sw_version = Column(String(500), nullable=False)
     pcb_version = Column(String(500), nullable=False)
@@ -167,3 +206,47 @@ class SerialNumbers(Base):
 
     customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
     customer_serial = relationship("Customer", back_populates="customer_serial")
+
+
+class SerialLookup(Base):
+    # Denormalized read model for field-service scans: one row per serial with its
+    # model and customer columns copied in. Maintained by read_models.py on writes.
+    __tablename__ = "serial_lookup"
+    serial_id = Column(Integer, ForeignKey("serial_numbers.id", ondelete="CASCADE"), primary_key=True)
+    serial_number = Column(String(500), unique=True, nullable=False)
+    date_of_manufacturing = Column(Date)
+    additional_warranty_months = Column(Integer)
+    warranty_end_date = Column(Date)
+    product_warranty = Column(String(500))
+    sw_version = Column(String(500))
+    pcb_version = Column(String(500))
+    fw_version = Column(String(500))
+    design_version = Column(String(500))
+
+    machine_model_id = Column(Integer, nullable=False, index=True)
+    model_number = Column(String(500))
+    machineName = Column(String(500))
+    image = Column(String(800))
+
+    customer_id = Column(Integer, nullable=False, index=True)
+    customer_name = Column(String(255))
+
+
+class SerialAllocator(Base):
+    # Per-model sequence for label printing; stations reserve blocks of next_seq atomically
+    __tablename__ = "serial_allocators"
+    id = Column(Integer, primary_key=True, index=True)
+    machine_model_id = Column(Integer, ForeignKey("machine_model.id", ondelete="CASCADE"), unique=True, nullable=False)
+    pattern = Column(String(200), nullable=False)  # str.format pattern, e.g. "SP-DD-80-{seq:06}"
+    next_seq = Column(Integer, nullable=False, default=1)
+
+
+class MigrationCheckpoint(Base):
+    # Progress of online_migrations.backfill_in_chunks(), one row per named backfill
+    __tablename__ = "migration_checkpoints"
+    name = Column(String(191), primary_key=True)
+    table_name = Column(String(191), nullable=False)
+    last_pk = Column(Integer, nullable=False, default=0)
+    rows_done = Column(Integer, nullable=False, default=0)
+    finished = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime)
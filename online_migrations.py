@@ -0,0 +1,219 @@
+"""Chunked, resumable backfills for schema changes on large tables.
+
+A type change on serial_numbers or machine_details is done as
+add column -> backfill -> swap, never as one blocking ALTER ... MODIFY:
+
+    def upgrade():
+        op.add_column("serial_numbers", sa.Column("fw_build", sa.Integer()))
+        with op.get_context().autocommit_block():
+            backfill_in_chunks(
+                op.get_bind(), "serial_numbers.fw_build", "serial_numbers",
+                columns=["fw_version"],
+                transform=lambda row: {"fw_build": parse_build(row.fw_version)},
+            )
+
+Every chunk is its own short transaction, ordered by primary key, and commits
+its checkpoint together with the rows it touched. An interrupted run (deploy
+killed, lock timeout, Ctrl-C) picks up after the last committed chunk when it
+is started again with the same name.
+
+    python online_migrations.py upgrade          # alembic upgrade head with short lock waits
+    python online_migrations.py status
+    python online_migrations.py reset <name>
+"""
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import bindparam, select, table, column, update, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from database import engine, migration_connection
+from models import MigrationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+checkpoints = MigrationCheckpoint.__table__
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_PAUSE = 0.05  # seconds between chunks, leaves room for API traffic
+MYSQL_LOCK_WAIT_TIMEOUT = 5  # seconds; a blocked DDL gives up instead of queueing every reader behind it
+
+
+@contextmanager
+def _chunk(bind):
+    # Engine: one transaction per chunk. Connection: the caller controls commits
+    # (inside Alembic use op.get_context().autocommit_block()).
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            yield connection
+    else:
+        yield bind
+
+
+def _load_checkpoint(connection: Connection, name: str, table_name: str):
+    row = connection.execute(select(checkpoints).where(checkpoints.c.name == name)).first()
+    if row is None:
+        connection.execute(checkpoints.insert().values(
+            name=name, table_name=table_name, last_pk=0, rows_done=0, finished=False, updated_at=datetime.utcnow()
+        ))
+        return 0, 0, False
+    return row.last_pk, row.rows_done, row.finished
+
+
+def _save_checkpoint(connection: Connection, name: str, last_pk: int, rows_done: int, finished: bool = False):
+    connection.execute(
+        checkpoints.update()
+        .where(checkpoints.c.name == name)
+        .values(last_pk=last_pk, rows_done=rows_done, finished=finished, updated_at=datetime.utcnow())
+    )
+
+
+def backfill_in_chunks(
+        bind,
+        name: str,
+        table_name: str,
+        columns: Iterable[str] = (),
+        transform: Optional[Callable] = None,
+        values: Optional[dict] = None,
+        where=None,
+        pk: str = "id",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        pause: float = DEFAULT_PAUSE,
+        max_rows_per_second: Optional[float] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Backfill ``table_name`` in primary-key order and return the rows processed.
+
+    Either ``transform`` (row with ``columns`` -> dict of new values, applied
+    per row with one executemany per chunk) or ``values`` (column -> SQL
+    expression, applied as one set-based UPDATE over the chunk's pk range).
+    """
+    if (transform is None) == (values is None):
+        raise ValueError("pass exactly one of transform or values")
+
+    columns = list(columns)
+    target = table(table_name, column(pk), *[column(name_) for name_ in columns])
+    pk_col = target.c[pk]
+
+    with _chunk(bind) as connection:
+        last_pk, rows_done, finished = _load_checkpoint(connection, name, table_name)
+    if finished:
+        logger.info("backfill %s already finished (%s rows)", name, rows_done)
+        return rows_done
+    if last_pk:
+        logger.info("backfill %s resuming after %s=%s (%s rows done)", name, pk, last_pk, rows_done)
+
+    while True:
+        started = time.monotonic()
+        with _chunk(bind) as connection:
+            query = select(pk_col, *[target.c[name_] for name_ in columns]).where(pk_col > last_pk)
+            if where is not None:
+                query = query.where(where)
+            rows = connection.execute(query.order_by(pk_col).limit(chunk_size)).all()
+            if not rows:
+                _save_checkpoint(connection, name, last_pk, rows_done, finished=True)
+                break
+
+            chunk_last_pk = rows[-1][0]
+            if transform is not None:
+                params = []
+                for row in rows:
+                    new_values = transform(row)
+                    if new_values:
+                        params.append({"b_pk": row[0], **new_values})
+                # One executemany per distinct set of returned keys; an UPDATE built from
+                # the first row's keys alone would fail on (or skip) the others
+                by_keys = {}
+                for row_params in params:
+                    by_keys.setdefault(tuple(key for key in row_params if key != "b_pk"), []).append(row_params)
+                for value_columns, group in by_keys.items():
+                    stmt = table(table_name, column(pk), *[column(key) for key in value_columns])
+                    connection.execute(
+                        update(stmt)
+                        .where(stmt.c[pk] == bindparam("b_pk"))
+                        .values({key: bindparam(key) for key in value_columns}),
+                        group,
+                    )
+            else:
+                stmt = table(table_name, column(pk), *[column(key) for key in values])
+                update_stmt = update(stmt).where(stmt.c[pk] > last_pk, stmt.c[pk] <= chunk_last_pk)
+                if where is not None:
+                    # Same filter as the SELECT, so rows between the matches keep their values
+                    update_stmt = update_stmt.where(where)
+                connection.execute(update_stmt.values(values))
+
+            last_pk = chunk_last_pk
+            rows_done += len(rows)
+            _save_checkpoint(connection, name, last_pk, rows_done)
+
+        if progress is not None:
+            progress(rows_done, last_pk)
+        logger.info("backfill %s: %s rows, %s=%s", name, rows_done, pk, last_pk)
+
+        delay = pause
+        if max_rows_per_second:
+            delay = max(delay, len(rows) / max_rows_per_second - (time.monotonic() - started))
+        if delay > 0:
+            time.sleep(delay)
+
+    logger.info("backfill %s finished: %s rows", name, rows_done)
+    return rows_done
+
+
+def reset_checkpoint(bind, name: str):
+    with _chunk(bind) as connection:
+        connection.execute(checkpoints.delete().where(checkpoints.c.name == name))
+
+
+def upgrade(revision: str = "head", retries: int = 5):
+    # Runs migrations with short lock waits so a DDL that cannot get its metadata
+    # lock backs off and retries instead of stalling every query on the table.
+    from alembic import command
+    from alembic.config import Config as AlembicConfig
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for attempt in range(1, retries + 1):
+        try:
+            alembic_cfg = AlembicConfig(os.path.join(base_dir, "alembic.ini"))
+            alembic_cfg.set_main_option("script_location", os.path.join(base_dir, "alembic"))
+            with migration_connection() as connection:
+                if connection.dialect.name == "mysql":
+                    connection.execute(text(f"SET SESSION lock_wait_timeout = {MYSQL_LOCK_WAIT_TIMEOUT}"))
+                connection.commit()
+                alembic_cfg.attributes["connection"] = connection
+                command.upgrade(alembic_cfg, revision)
+                connection.commit()
+            return
+        except OperationalError as e:
+            if attempt == retries:
+                raise
+            logger.warning("migration blocked (%s), retrying in %ss", e.orig, attempt * 2)
+            time.sleep(attempt * 2)
+
+
+def status(bind=engine):
+    with bind.connect() as connection:
+        return connection.execute(select(checkpoints).order_by(checkpoints.c.name)).all()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    action = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if action == "upgrade":
+        upgrade(sys.argv[2] if len(sys.argv) > 2 else "head")
+    elif action == "status":
+        for checkpoint in status():
+            state = "finished" if checkpoint.finished else "in progress"
+            print(f"{checkpoint.name:40} {checkpoint.table_name:20} last_pk={checkpoint.last_pk:<10} "
+                  f"rows={checkpoint.rows_done:<10} {state}  {checkpoint.updated_at}")
+    elif action == "reset" and len(sys.argv) > 2:
+        reset_checkpoint(engine, sys.argv[2])
+    else:
+        print(__doc__)
+        sys.exit(2)
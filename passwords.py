@@ -0,0 +1,104 @@
+"""scrypt password hashes for customer and management users.
+
+Stored form: ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` (base64). n=2**14, r=8 needs
+16 MiB of memory per attempt, which is what makes offline guessing expensive.
+It also costs roughly 50 ms of CPU. So hashing runs in a process pool
+(password_hasher), not on the event loop or a threadpool slot.
+
+Rows from before the 0010 migration may still hold the plaintext. They verify
+by constant-time comparison and report needs_rehash().
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+PREFIX = "scrypt$"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=2 * 128 * n * r * p,
+                          dklen=HASH_BYTES)
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PREFIX)
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f"{PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        n, r, p, salt, digest = stored[len(PREFIX):].split("$")
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+# Verified against when the username does not exist, so a miss costs as much as a wrong password
+DUMMY_HASH = f"{PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(bytes(SALT_BYTES))}${_b64(bytes(HASH_BYTES))}"
+
+
+class PasswordHasher:
+    # Without a started pool (scripts, migrations) hashing runs in the calling thread
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS):
+        self.workers = workers
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, fn, *args):
+        executor = self._executor
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+
+    def hash(self, password: str) -> str:
+        # For sync endpoints: the threadpool thread waits, the GIL is free meanwhile
+        return self._call(hash_password, password)
+
+    def verify(self, password: str, stored: str) -> bool:
+        return self._call(verify_password, password, stored)
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, hash_password, password)
+
+    async def verify_async(self, password: str, stored: str) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, verify_password, password, stored)
+
+
+password_hasher = PasswordHasher()
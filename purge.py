@@ -0,0 +1,193 @@
+"""Deletes of customers, management, machine models and their dependents.
+
+Every foreign key cascades in the database (ON DELETE CASCADE) and the ORM
+relationships are passive, so deleting a parent is a single DELETE. The
+database cascade does not reach search_documents or the per-process indexes
+(serial_filter, autocomplete), so those are cleaned up here.
+
+delete_entity() does this in the request. purge_in_background() is for very
+large tenants: it deletes the children in primary-key chunks, one short
+transaction each, then deletes the parent. Its progress can be polled through
+the job registry.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+import search
+from autocomplete import autocomplete_indexes
+from models import (Customer, CustomerUserModel, DataEntry, MachineDetails, MachineModel, Management,
+                    ManagementUserModel, SerialNumbers)
+from serial_filter import serial_filter
+
+logger = logging.getLogger(__name__)
+
+PURGE_CHUNK_SIZE = 1000
+PURGE_PAUSE = 0.05  # seconds between chunks, leaves room for API traffic
+MAX_FINISHED_JOBS = 100
+
+# model -> (key column, per-process indexes keyed by it)
+MEMORY_INDEXES = {
+    SerialNumbers: (SerialNumbers.serial_number, (serial_filter, autocomplete_indexes.serial)),
+    MachineModel: (MachineModel.id, (autocomplete_indexes.model,)),
+    Customer: (Customer.id, (autocomplete_indexes.customer,)),
+}
+
+
+def dependents(model, entity_id: int) -> list:
+    # (child model, condition) for every table the parent's delete cascades into,
+    # in an order where each chunked delete only cascades into small tables
+    if model is Customer:
+        return [
+            (SerialNumbers, SerialNumbers.customer_id == entity_id),
+            (DataEntry, DataEntry.customer_id == entity_id),
+            (MachineDetails, MachineDetails.customer_id == entity_id),
+            (CustomerUserModel, CustomerUserModel.customer_id == entity_id),
+        ]
+    if model is MachineModel:
+        return [
+            (SerialNumbers, SerialNumbers.model_number == entity_id),
+            (DataEntry, DataEntry.machine_id == entity_id),
+        ]
+    if model is Management:
+        machine_ids = select(MachineModel.id).where(MachineModel.make == entity_id)
+        return [
+            (SerialNumbers, SerialNumbers.model_number.in_(machine_ids)),
+            (DataEntry, DataEntry.machine_id.in_(machine_ids)),
+            (ManagementUserModel, ManagementUserModel.management_id == entity_id),
+            (MachineModel, MachineModel.make == entity_id),
+        ]
+    return []
+
+
+def _unindex(db: Session, model, condition) -> list:
+    # Search documents go in the caller's transaction; the in-memory entries are
+    # returned so they are only dropped once the delete has committed
+    if model in search.DOCUMENT_SOURCES:
+        search.delete_documents_where(db.connection(), model, condition)
+    if model not in MEMORY_INDEXES:
+        return []
+    key_column, indexes = MEMORY_INDEXES[model]
+    keys = [key for (key,) in db.query(key_column).filter(condition).all()]
+    return [(index, keys) for index in indexes] if keys else []
+
+
+def _forget(entries):
+    for index, keys in entries:
+        for key in keys:
+            index.remove(key)
+
+
+def delete_entity(db: Session, model, entity_id: int) -> bool:
+    """Delete one row and, through the DB cascade, everything under it. False if it does not exist."""
+    entries = []
+    for child, condition in dependents(model, entity_id):
+        entries += _unindex(db, child, condition)
+    entries += _unindex(db, model, model.id == entity_id)
+    result = db.execute(delete(model).where(model.id == entity_id).execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+    db.commit()
+    _forget(entries)
+    return True
+
+
+class PurgeJob:
+    def __init__(self, entity: str, entity_id: int):
+        self.id = uuid.uuid4().hex
+        self.entity = entity
+        self.entity_id = entity_id
+        self.status = "queued"
+        self.rows_deleted = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "entity": self.entity,
+            "entity_id": self.entity_id,
+            "status": self.status,
+            "rows_deleted": self.rows_deleted,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def get_job(job_id: str) -> Optional[PurgeJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs() -> list:
+    with _jobs_lock:
+        return list(_jobs.values())
+
+
+def _register(job: PurgeJob):
+    with _jobs_lock:
+        _jobs[job.id] = job
+        finished = [job_id for job_id, other in _jobs.items() if other.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+
+def _delete_in_chunks(session_factory, job: PurgeJob, model, condition, chunk_size: int, pause: float):
+    while True:
+        db = session_factory()
+        try:
+            ids = [row_id for (row_id,) in db.query(model.id).filter(condition)
+                   .order_by(model.id).limit(chunk_size).all()]
+            if not ids:
+                return
+            chunk = model.id.in_(ids)
+            entries = _unindex(db, model, chunk)
+            deleted = db.execute(delete(model).where(chunk).execution_options(synchronize_session=False)).rowcount
+            db.commit()
+        finally:
+            db.close()
+        _forget(entries)
+        job.rows_deleted += deleted
+        if pause > 0:
+            time.sleep(pause)
+
+
+def _run(session_factory, job: PurgeJob, model, chunk_size: int, pause: float):
+    job.status = "running"
+    try:
+        for child, condition in dependents(model, job.entity_id):
+            _delete_in_chunks(session_factory, job, child, condition, chunk_size, pause)
+        db = session_factory()
+        try:
+            if delete_entity(db, model, job.entity_id):
+                job.rows_deleted += 1
+        finally:
+            db.close()
+        job.status = "finished"
+    except Exception as e:
+        logger.exception("purge of %s %s failed", job.entity, job.entity_id)
+        job.status = "failed"
+        job.error = str(e)
+    job.finished_at = datetime.utcnow()
+
+
+def purge_in_background(session_factory, model, entity: str, entity_id: int,
+                        chunk_size: int = PURGE_CHUNK_SIZE, pause: float = PURGE_PAUSE) -> PurgeJob:
+    job = PurgeJob(entity, entity_id)
+    _register(job)
+    threading.Thread(target=_run, args=(session_factory, job, model, chunk_size, pause), daemon=True).start()
+    return job
@@ -0,0 +1,82 @@
+"""EXPLAIN the hot queries and fail when one of them falls back to a full table scan.
+
+    DATABASE_URL=sqlite:///./test.db python query_plans.py
+
+Works against SQLite (EXPLAIN QUERY PLAN) and MySQL (EXPLAIN). Exits non-zero
+when a plan regresses, so it can run as a deploy gate after migrations against
+the production engine; tests/test_query_plans.py asserts the same on SQLite.
+"""
+import sys
+from datetime import date
+
+from sqlalchemy import select, text
+
+from database import engine
+from geo import covering_prefixes, prefix_filter
+from models import Customer, CustomerUserModel, DataEntry, MachineDetails, MachineModel, ManagementUserModel, SerialLookup, SerialNumbers
+
+# name -> statement, mirroring what the endpoints in main.py issue
+HOT_QUERIES = {
+    "serial_exists": select(SerialNumbers.id).where(SerialNumbers.serial_number == "SN-1"),
+    "machines_for_customer": (
+        select(MachineModel.id)
+        .join(SerialNumbers, SerialNumbers.model_number == MachineModel.id)
+        .where(SerialNumbers.customer_id == 1)
+        .distinct()
+    ),
+    "serial_lookup_by_number": select(SerialLookup).where(SerialLookup.serial_number == "SN-1"),
+    "customers_nearby": select(Customer.id).where(prefix_filter(Customer.geohash, covering_prefixes(11.0, 77.0, 50))),
+    "serials_for_model": select(SerialNumbers.id).where(SerialNumbers.model_number == 1),
+    "serials_expiring": (
+        select(SerialNumbers.id)
+        .where(SerialNumbers.warranty_end_date.between(date(2026, 1, 1), date(2026, 2, 1)))
+        .order_by(SerialNumbers.warranty_end_date)
+    ),
+    "customer_serials_expiring": (
+        select(SerialNumbers.id)
+        .where(SerialNumbers.customer_id == 1,
+               SerialNumbers.warranty_end_date.between(date(2026, 1, 1), date(2026, 2, 1)))
+        .order_by(SerialNumbers.warranty_end_date)
+    ),
+    "customer_users_for_customer": select(CustomerUserModel.id).where(CustomerUserModel.customer_id == 1),
+    "management_users_for_management": select(ManagementUserModel.id).where(ManagementUserModel.management_id == 1),
+    "machine_details_for_customer": select(MachineDetails.id).where(MachineDetails.customer_id == 1),
+    "data_entries_for_customer": select(DataEntry.id).where(DataEntry.customer_id == 1),
+    "data_entries_for_machine": select(DataEntry.id).where(DataEntry.machine_id == 1),
+    "machine_models_for_make": select(MachineModel.id).where(MachineModel.make == 1),
+}
+
+
+def explain(connection, statement) -> list[str]:
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        return [row.detail for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    rows = connection.execute(text(f"EXPLAIN {sql}")).mappings()
+    return [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+
+
+def is_full_scan(plan_line: str) -> bool:
+    # SQLite reports every full table or full index walk as SCAN (lookups are SEARCH);
+    # MySQL uses access type ALL for table scans and "index" for full index scans
+    return plan_line.startswith("SCAN ") or "type=ALL" in plan_line or "type=index " in plan_line
+
+
+def find_full_scans(bind=engine) -> dict[str, list[str]]:
+    regressions = {}
+    with bind.connect() as connection:
+        for name, statement in HOT_QUERIES.items():
+            plan = explain(connection, statement)
+            if any(is_full_scan(line) for line in plan):
+                regressions[name] = plan
+    return regressions
+
+
+if __name__ == "__main__":
+    regressions = find_full_scans()
+    for name, plan in regressions.items():
+        print(f"FULL SCAN in {name}:")
+        for line in plan:
+            print(f"    {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"{len(HOT_QUERIES)} hot queries use indexes")
@@ -0,0 +1,118 @@
+"""Role-based access control compiled from the privilege enums.
+
+ROLE_PERMISSIONS grants each (user kind, privilege) a set of Permission flags.
+compile_role_masks() folds each set into one int at startup, keyed by the
+enum name and by its label, because the free-form privilege column holds
+whichever one the frontend sent. Checking a route is then a dict lookup and
+`mask & required == required`.
+
+Customer users only see their own customer's rows. Management users see every
+customer, but management-side rows only for their own management.
+tenant_scope() is the filter list endpoints apply.
+
+Most clients do not log in yet, so AUTH_REQUIRED is off by default. Then a
+request without a token runs unchecked and unscoped. A request that carries a
+token is always checked.
+"""
+import os
+from enum import IntFlag
+from functools import reduce
+from typing import Optional
+
+from models import CustomerPrivilegeEnum, ManagementPrivilegeEnum
+
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "false").lower() in ("1", "true", "yes")
+
+
+class Permission(IntFlag):
+    READ_CATALOG = 1 << 0  # machine models, serial allocators
+    WRITE_CATALOG = 1 << 1
+    READ_SERIALS = 1 << 2
+    WRITE_SERIALS = 1 << 3
+    READ_CUSTOMERS = 1 << 4
+    WRITE_CUSTOMERS = 1 << 5
+    MANAGE_CUSTOMER_USERS = 1 << 6
+    READ_MANAGEMENT = 1 << 7
+    WRITE_MANAGEMENT = 1 << 8
+    MANAGE_MANAGEMENT_USERS = 1 << 9
+    MANAGE_KEYS = 1 << 10
+    SEARCH = 1 << 11  # cross-tenant search and autocomplete
+    SUBMIT_DATA = 1 << 12
+    VIEW_DASHBOARD = 1 << 13
+    OPERATIONS = 1 << 14  # purge jobs, pool stats
+
+
+P = Permission
+ALL_PERMISSIONS = reduce(lambda mask, permission: mask | permission, Permission, Permission(0))
+
+ROLE_PERMISSIONS = {
+    ("management", ManagementPrivilegeEnum.Admin): ALL_PERMISSIONS,
+    ("management", ManagementPrivilegeEnum.Top_Manager):
+        ALL_PERMISSIONS & ~(P.WRITE_MANAGEMENT | P.MANAGE_MANAGEMENT_USERS | P.MANAGE_KEYS | P.OPERATIONS),
+    ("management", ManagementPrivilegeEnum.Manager_Production):
+        P.READ_CATALOG | P.WRITE_CATALOG | P.READ_SERIALS | P.WRITE_SERIALS | P.READ_CUSTOMERS
+        | P.READ_MANAGEMENT | P.SEARCH | P.VIEW_DASHBOARD,
+    ("management", ManagementPrivilegeEnum.Manager_Service):
+        P.READ_CATALOG | P.READ_SERIALS | P.READ_CUSTOMERS | P.WRITE_CUSTOMERS | P.MANAGE_CUSTOMER_USERS
+        | P.READ_MANAGEMENT | P.SEARCH | P.VIEW_DASHBOARD,
+    ("customer", CustomerPrivilegeEnum.Admin):
+        P.READ_CATALOG | P.READ_SERIALS | P.READ_CUSTOMERS | P.MANAGE_CUSTOMER_USERS | P.SUBMIT_DATA
+        | P.VIEW_DASHBOARD,
+    ("customer", CustomerPrivilegeEnum.Manager):
+        P.READ_CATALOG | P.READ_SERIALS | P.READ_CUSTOMERS | P.SUBMIT_DATA | P.VIEW_DASHBOARD,
+    ("customer", CustomerPrivilegeEnum.Engineer):
+        P.READ_CATALOG | P.READ_SERIALS | P.SUBMIT_DATA | P.VIEW_DASHBOARD,
+    ("customer", CustomerPrivilegeEnum.Lab_Incharge):
+        P.READ_CATALOG | P.READ_SERIALS | P.VIEW_DASHBOARD,
+}
+
+
+def compile_role_masks() -> dict:
+    masks = {}
+    for kind, privileges in (("management", ManagementPrivilegeEnum), ("customer", CustomerPrivilegeEnum)):
+        for privilege in privileges:
+            if (kind, privilege) not in ROLE_PERMISSIONS:
+                raise RuntimeError(f"no permissions defined for {kind} privilege {privilege.name}")
+            mask = int(ROLE_PERMISSIONS[(kind, privilege)])
+            masks[(kind, privilege.name)] = mask
+            masks[(kind, privilege.value)] = mask
+    return masks
+
+
+ROLE_MASKS = compile_role_masks()
+
+
+class Principal:
+    # The authenticated caller; built once per request from verified token claims
+    __slots__ = ("kind", "user_id", "tenant_id", "privilege", "permissions")
+
+    def __init__(self, kind: str, user_id: int, tenant_id: int, privilege: str):
+        self.kind = kind
+        self.user_id = user_id
+        self.tenant_id = tenant_id
+        self.privilege = privilege
+        # Unknown privilege strings get no permissions at all
+        self.permissions = ROLE_MASKS.get((kind, privilege), 0)
+
+    def allows(self, required: int) -> bool:
+        return self.permissions & required == required
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "Principal":
+        return cls(claims["kind"], claims["sub"], claims["tenant"], claims.get("privilege"))
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "tenant_id": self.tenant_id,
+            "privilege": self.privilege,
+            "permissions": [permission.name for permission in Permission if self.permissions & permission],
+        }
+
+
+def tenant_scope(principal: Optional[Principal], kind: str) -> Optional[int]:
+    # The tenant id that rows owned by a `kind` tenant are limited to, or None for no limit
+    if principal is None or principal.kind != kind:
+        return None
+    return principal.tenant_id
@@ -0,0 +1,60 @@
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Customer, MachineModel, SerialLookup, SerialNumbers
+
+LOOKUP_COLUMNS = [
+    "serial_id", "serial_number", "date_of_manufacturing", "additional_warranty_months", "warranty_end_date",
+    "product_warranty", "sw_version", "pcb_version", "fw_version", "design_version",
+    "machine_model_id", "model_number", "machineName", "image", "customer_id", "customer_name",
+]
+
+
+def lookup_source():
+    # Column order must match LOOKUP_COLUMNS
+    return (
+        select(
+            SerialNumbers.id, SerialNumbers.serial_number, SerialNumbers.date_of_manufacturing,
+            SerialNumbers.additional_warranty_months, SerialNumbers.warranty_end_date,
+            SerialNumbers.product_warranty, SerialNumbers.sw_version, SerialNumbers.pcb_version,
+            SerialNumbers.fw_version, SerialNumbers.design_version,
+            MachineModel.id, MachineModel.model_number, MachineModel.machineName, MachineModel.image,
+            Customer.id, Customer.name,
+        )
+        .join(MachineModel, MachineModel.id == SerialNumbers.model_number)
+        .join(Customer, Customer.id == SerialNumbers.customer_id)
+    )
+
+
+def refresh_serial_lookup(db: Session, condition):
+    # Rebuilds the lookup rows of the serials matching `condition` (a filter on
+    # SerialNumbers) with set-based statements in the caller's transaction, so
+    # the read model commits or rolls back together with the write.
+    db.flush()
+    db.execute(delete(SerialLookup).where(
+        SerialLookup.serial_id.in_(select(SerialNumbers.id).where(condition))
+    ))
+    db.execute(insert(SerialLookup).from_select(LOOKUP_COLUMNS, lookup_source().where(condition)))
+
+
+MODEL_LOOKUP_COLUMNS = ("model_number", "machineName", "image")
+
+
+def sync_machine_model_lookup(db: Session, machine_id: int, values: dict):
+    # `values` may be a partial update; only the denormalized columns are copied
+    lookup_values = {name: values[name] for name in MODEL_LOOKUP_COLUMNS if name in values}
+    if not lookup_values:
+        return
+    db.execute(
+        update(SerialLookup)
+        .where(SerialLookup.machine_model_id == machine_id)
+        .values(**lookup_values)
+    )
+
+
+def sync_customer_lookup(db: Session, customer_id: int, name: str):
+    db.execute(
+        update(SerialLookup)
+        .where(SerialLookup.customer_id == customer_id)
+        .values(customer_name=name)
+    )
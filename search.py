@@ -0,0 +1,275 @@
+"""Full-text search over customers, management, machine models, serials and users.
+
+One document per entity row lives in ``search_documents``: an FTS5 virtual table
+on SQLite, an InnoDB table with a FULLTEXT index on MySQL. Documents are keyed
+by ``entity code << 40 | entity id`` so every upsert/delete is a primary-key
+operation on both engines. The ORM hook below keeps the index current for every
+flush; statement-level writes (bulk import, DB cascades) call the helpers directly.
+"""
+import re
+from types import SimpleNamespace
+
+from sqlalchemy import column, delete, event, insert, literal, select, table, text
+from sqlalchemy.orm import Session
+
+from models import Customer, CustomerUserModel, MachineModel, Management, ManagementUserModel, SerialNumbers
+
+TABLE_NAME = "search_documents"
+
+ENTITY_CODES = {
+    "customer": 1,
+    "management": 2,
+    "machine_model": 3,
+    "serial": 4,
+    "customer_user": 5,
+    "management_user": 6,
+}
+ID_BITS = 40
+
+
+def document_id(entity: str, entity_id: int) -> int:
+    return ENTITY_CODES[entity] << ID_BITS | entity_id
+
+
+# model -> (entity, title columns, body columns); title carries the higher ranking weight
+DOCUMENT_SOURCES = {
+    Customer: ("customer", ("name",), ("address", "gst", "email", "phone", "key_name")),
+    Management: ("management", ("name",), ("address", "gst", "email", "phone", "key_name")),
+    MachineModel: ("machine_model", ("model_number", "machineName"),
+                   ("description", "sw_version", "fw_version", "pcb_version", "design_version")),
+    SerialNumbers: ("serial", ("serial_number",),
+                    ("product_warranty", "sw_version", "fw_version", "pcb_version", "design_version")),
+    CustomerUserModel: ("customer_user", ("name",), ("username", "designation", "privilege")),
+    ManagementUserModel: ("management_user", ("name",), ("username", "designation", "privilege")),
+}
+
+
+def _text(row, columns) -> str:
+    return " ".join(str(value) for value in (getattr(row, name) for name in columns) if value)
+
+
+def document_for(row, source):
+    entity, title_columns, body_columns = source
+    return entity, row.id, _text(row, title_columns), _text(row, body_columns)
+
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(q: str) -> list[str]:
+    # Users type free text; only word characters reach MATCH so operators cannot be injected
+    return TOKEN_RE.findall(q.lower())[:16]
+
+
+class SqliteFts5Backend:
+    key_column = "rowid"
+
+    def create(self, connection):
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_NAME} "
+            "USING fts5(entity UNINDEXED, entity_id UNINDEXED, title, body, tokenize='unicode61')"
+        ))
+
+    def drop(self, connection):
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE_NAME}"))
+
+    def match_expression(self, terms):
+        return " AND ".join(f'"{term}"*' for term in terms)
+
+    def search(self, connection, terms, entities, limit):
+        where = f"{TABLE_NAME} MATCH :match"
+        params = {"match": self.match_expression(terms), "limit": limit}
+        if entities:
+            where += " AND entity IN ({})".format(", ".join(f":e{i}" for i in range(len(entities))))
+            params.update({f"e{i}": entity for i, entity in enumerate(entities)})
+        # bm25() is lower-is-better; column weights follow the table definition
+        rows = connection.execute(text(
+            f"SELECT entity, entity_id, title, -bm25({TABLE_NAME}, 0, 0, 10.0, 1.0) AS score "
+            f"FROM {TABLE_NAME} WHERE {where} ORDER BY score DESC LIMIT :limit"
+        ), params).all()
+        facets = connection.execute(text(
+            f"SELECT entity, count(*) FROM {TABLE_NAME} WHERE {TABLE_NAME} MATCH :match GROUP BY entity"
+        ), {"match": params["match"]}).all()
+        return rows, facets
+
+
+class MySqlFulltextBackend:
+    key_column = "doc_id"
+
+    def create(self, connection):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+            "doc_id BIGINT NOT NULL PRIMARY KEY, "
+            "entity VARCHAR(32) NOT NULL, "
+            "entity_id INT NOT NULL, "
+            "title VARCHAR(1000), "
+            "body TEXT, "
+            "FULLTEXT KEY ft_search_documents (title, body)"
+            ") ENGINE=InnoDB"
+        ))
+
+    def drop(self, connection):
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE_NAME}"))
+
+    def match_expression(self, terms):
+        return " ".join(f"+{term}*" for term in terms)
+
+    def search(self, connection, terms, entities, limit):
+        match = "MATCH (title, body) AGAINST (:match IN BOOLEAN MODE)"
+        where = match
+        params = {"match": self.match_expression(terms), "limit": limit}
+        if entities:
+            where += " AND entity IN ({})".format(", ".join(f":e{i}" for i in range(len(entities))))
+            params.update({f"e{i}": entity for i, entity in enumerate(entities)})
+        rows = connection.execute(text(
+            f"SELECT entity, entity_id, title, {match} AS score "
+            f"FROM {TABLE_NAME} WHERE {where} ORDER BY score DESC LIMIT :limit"
+        ), params).all()
+        facets = connection.execute(text(
+            f"SELECT entity, count(*) FROM {TABLE_NAME} WHERE {match} GROUP BY entity"
+        ), {"match": params["match"]}).all()
+        return rows, facets
+
+
+def get_backend(dialect_name: str):
+    if dialect_name == "sqlite":
+        return SqliteFts5Backend()
+    if dialect_name == "mysql":
+        return MySqlFulltextBackend()
+    raise RuntimeError(f"full-text search is not supported on {dialect_name}")
+
+
+def documents_table(backend):
+    return table(TABLE_NAME, column(backend.key_column), column("entity"), column("entity_id"),
+                 column("title"), column("body"))
+
+
+def upsert_documents(connection, documents):
+    # documents: iterable of (entity, entity_id, title, body)
+    documents = list(documents)
+    if not documents:
+        return
+    backend = get_backend(connection.dialect.name)
+    docs = documents_table(backend)
+    delete_documents(connection, [(entity, entity_id) for entity, entity_id, _, _ in documents])
+    connection.execute(insert(docs), [
+        {backend.key_column: document_id(entity, entity_id), "entity": entity, "entity_id": entity_id,
+         "title": title or "", "body": body or ""}
+        for entity, entity_id, title, body in documents
+    ])
+
+
+def delete_documents(connection, keys):
+    # keys: iterable of (entity, entity_id)
+    ids = [document_id(entity, entity_id) for entity, entity_id in keys]
+    if not ids:
+        return
+    backend = get_backend(connection.dialect.name)
+    docs = documents_table(backend)
+    for start in range(0, len(ids), 1000):
+        connection.execute(delete(docs).where(docs.c[backend.key_column].in_(ids[start:start + 1000])))
+
+
+def index_row(connection, model, entity_id: int, values: dict):
+    # For statement-level UPDATEs, which the flush hook never sees. Reads the indexed
+    # columns back only when `values` does not already carry all of them.
+    source = DOCUMENT_SOURCES.get(model)
+    if source is None:
+        return
+    _, title_columns, body_columns = source
+    columns = title_columns + body_columns
+    if not any(name in values for name in columns):
+        return
+    if all(name in values for name in columns):
+        row = SimpleNamespace(id=entity_id, **{name: values[name] for name in columns})
+    else:
+        row = connection.execute(
+            select(model.id, *[getattr(model, name) for name in columns]).where(model.id == entity_id)
+        ).first()
+        if row is None:
+            return
+    upsert_documents(connection, [document_for(row, source)])
+
+
+def serial_documents_source(condition=None):
+    # SQL-side equivalent of DOCUMENT_SOURCES[SerialNumbers] (all NOT NULL), for set-based indexing
+    body = SerialNumbers.product_warranty + " " + SerialNumbers.sw_version + " " + SerialNumbers.fw_version \
+        + " " + SerialNumbers.pcb_version + " " + SerialNumbers.design_version
+    query = select(
+        literal(ENTITY_CODES["serial"] << ID_BITS) + SerialNumbers.id,
+        literal("serial"),
+        SerialNumbers.id,
+        SerialNumbers.serial_number,
+        body,
+    )
+    if condition is not None:
+        query = query.where(condition)
+    return query
+
+
+def delete_documents_where(connection, model, condition):
+    # Set-based delete for the rows of `model` matching `condition`; used before DB
+    # cascades, which never reach search_documents
+    entity = DOCUMENT_SOURCES[model][0]
+    backend = get_backend(connection.dialect.name)
+    docs = documents_table(backend)
+    connection.execute(delete(docs).where(docs.c[backend.key_column].in_(
+        select(literal(ENTITY_CODES[entity] << ID_BITS) + model.id).where(condition)
+    )))
+
+
+def index_serials(connection, condition):
+    backend = get_backend(connection.dialect.name)
+    docs = documents_table(backend)
+    delete_documents_where(connection, SerialNumbers, condition)
+    connection.execute(insert(docs).from_select(
+        [backend.key_column, "entity", "entity_id", "title", "body"], serial_documents_source(condition)
+    ))
+
+
+def rebuild_documents(connection):
+    # Full (re)index; selects only the indexed columns so it also runs from older migrations
+    for model, source in DOCUMENT_SOURCES.items():
+        if model is SerialNumbers:
+            continue
+        _, title_columns, body_columns = source
+        source_table = table(model.__tablename__, *[column(name) for name in ("id",) + title_columns + body_columns])
+        rows = connection.execute(select(source_table)).all()
+        upsert_documents(connection, [document_for(row, source) for row in rows])
+    index_serials(connection, SerialNumbers.id > 0)
+
+
+def search(db: Session, q: str, entities=None, limit: int = 20):
+    terms = query_terms(q)
+    if not terms:
+        return {"query": q, "results": [], "facets": {}}
+    connection = db.connection()
+    rows, facets = get_backend(connection.dialect.name).search(connection, terms, entities or [], limit)
+    return {
+        "query": q,
+        "results": [{"entity": entity, "id": int(entity_id), "title": title, "score": round(float(score), 4)}
+                    for entity, entity_id, title, score in rows],
+        "facets": {entity: count for entity, count in facets},
+    }
+
+
+def _after_flush(session, flush_context):
+    upserts = []
+    deletes = []
+    for obj in session.new.union(session.dirty):
+        source = DOCUMENT_SOURCES.get(type(obj))
+        if source is not None and obj.id is not None:
+            upserts.append(document_for(obj, source))
+    for obj in session.deleted:
+        source = DOCUMENT_SOURCES.get(type(obj))
+        if source is not None and obj.id is not None:
+            deletes.append((source[0], obj.id))
+    if not upserts and not deletes:
+        return
+    connection = session.connection()
+    delete_documents(connection, deletes)
+    upsert_documents(connection, upserts)
+
+
+def register(session_factory):
+    event.listen(session_factory, "after_flush", _after_flush)
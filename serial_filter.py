@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left
+
+from models import SerialNumbers
+
+LOAD_CHUNK_SIZE = 10000
+
+
+def serial_hash(serial_number: str) -> int:
+    return int.from_bytes(hashlib.blake2b(serial_number.encode(), digest_size=8).digest(), "little")
+
+
+class SerialMembershipFilter:
+    # Sorted array of 64-bit hashes of every serial_number (8 bytes per serial).
+    # A miss means the serial definitely does not exist; a hit still has to be
+    # confirmed in the DB (hash collision or a row deleted by a cascade).
+    # The filter is per process, like data_updated_event and dashboard_store.
+
+    def __init__(self):
+        self._hashes = array("Q")
+        self._lock = threading.Lock()
+        self._loading = False
+        self._pending = {}  # hash -> True (added) / False (removed) while a rebuild runs
+        self.ready = False
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _contains(self, value: int) -> bool:
+        index = bisect_left(self._hashes, value)
+        return index < len(self._hashes) and self._hashes[index] == value
+
+    def might_contain(self, serial_number: str) -> bool:
+        if not self.ready:
+            return True
+        value = serial_hash(serial_number)
+        with self._lock:
+            return self._contains(value)
+
+    def add(self, serial_number: str):
+        value = serial_hash(serial_number)
+        with self._lock:
+            if self._loading:
+                self._pending[value] = True
+            if not self._contains(value):
+                self._hashes.insert(bisect_left(self._hashes, value), value)
+
+    def add_many(self, serial_numbers):
+        # Bulk imports: one merge of the sorted batch instead of an O(n) insert per serial
+        values = {serial_hash(serial_number) for serial_number in serial_numbers}
+        if not values:
+            return
+        with self._lock:
+            if self._loading:
+                self._pending.update(dict.fromkeys(values, True))
+            merged = array("Q")
+            start = 0
+            for value in sorted(values):
+                index = bisect_left(self._hashes, value, start)
+                if index < len(self._hashes) and self._hashes[index] == value:
+                    continue
+                merged += self._hashes[start:index]  # C-level copies of the runs between new values
+                merged.append(value)
+                start = index
+            if merged:
+                merged += self._hashes[start:]
+                self._hashes = merged
+
+    def remove(self, serial_number: str):
+        value = serial_hash(serial_number)
+        with self._lock:
+            if self._loading:
+                self._pending[value] = False
+            index = bisect_left(self._hashes, value)
+            if index < len(self._hashes) and self._hashes[index] == value:
+                del self._hashes[index]
+
+    def rebuild(self, session_factory, chunk_size: int = LOAD_CHUNK_SIZE):
+        # Reads serial_numbers in primary-key chunks so startup never holds a long
+        # query open; writes that happen meanwhile are replayed at the end.
+        with self._lock:
+            self._loading = True
+            self._pending = {}
+        loaded = set()
+        db = session_factory()
+        try:
+            last_id = 0
+            while True:
+                rows = db.query(SerialNumbers.id, SerialNumbers.serial_number) \
+                    .filter(SerialNumbers.id > last_id).order_by(SerialNumbers.id).limit(chunk_size).all()
+                if not rows:
+                    break
+                loaded.update(serial_hash(serial_number) for _, serial_number in rows)
+                last_id = rows[-1][0]
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            for value, present in self._pending.items():
+                if present:
+                    loaded.add(value)
+                else:
+                    loaded.discard(value)
+            self._hashes = array("Q", sorted(loaded))
+            self._pending = {}
+            self._loading = False
+            self.ready = True
+
+
+serial_filter = SerialMembershipFilter()
@@ -0,0 +1,89 @@
+"""Tenant key pairs in several algorithms.
+
+Each customer/management row stores its algorithm in ``key_algorithm`` next to
+the PEMs. Rows created before the column existed are "rsa-2048". New tenants
+get DEFAULT_KEY_ALGORITHM. Elliptic-curve keys generate in microseconds rather
+than hundreds of milliseconds and have much shorter PEMs.
+
+/submit/encrypted needs a key that can receive an AES key (INGEST_ALGORITHMS):
+RSA tenants get it OAEP-wrapped; P-256 and x25519 tenants get the
+controller's ephemeral public key instead, and both sides derive the AES key
+with ECDH and HKDF-SHA256 (ingest_key). Ed25519 tenants cannot receive one.
+"""
+import os
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa, x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+RSA_2048 = "rsa-2048"
+ECDSA_P256 = "ecdsa-p256"
+ED25519 = "ed25519"
+X25519 = "x25519"
+
+KEY_ALGORITHMS = (RSA_2048, ECDSA_P256, ED25519, X25519)
+INGEST_ALGORITHMS = (RSA_2048, ECDSA_P256, X25519)
+INGEST_KEY_INFO = b"submit/encrypted aes-256 key"
+# existing rows were all RSA; see the 0009 migration
+LEGACY_KEY_ALGORITHM = RSA_2048
+DEFAULT_KEY_ALGORITHM = os.getenv("DEFAULT_KEY_ALGORITHM", ECDSA_P256)
+
+
+def _pem_pair(private_key, private_format=serialization.PrivateFormat.PKCS8) -> dict:
+    return {
+        "private_key": private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=private_format,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode(),
+        "public_key": private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode(),
+    }
+
+
+def generate_rsa_key_pair() -> dict:
+    # TraditionalOpenSSL keeps the "BEGIN RSA PRIVATE KEY" PEMs existing clients parse
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return _pem_pair(private_key, serialization.PrivateFormat.TraditionalOpenSSL)
+
+
+def generate_key_pair(algorithm: str) -> dict:
+    if algorithm == RSA_2048:
+        return generate_rsa_key_pair()
+    if algorithm == ECDSA_P256:
+        return _pem_pair(ec.generate_private_key(ec.SECP256R1()))
+    if algorithm == ED25519:
+        return _pem_pair(ed25519.Ed25519PrivateKey.generate())
+    if algorithm == X25519:
+        return _pem_pair(x25519.X25519PrivateKey.generate())
+    raise ValueError(f"unknown key algorithm {algorithm!r}")
+
+
+def check_algorithm(algorithm: str) -> str:
+    if algorithm not in KEY_ALGORITHMS:
+        raise ValueError(f"key algorithm must be one of {', '.join(KEY_ALGORITHMS)}")
+    return algorithm
+
+
+def load_private_key(private_pem: str):
+    return serialization.load_pem_private_key(private_pem.encode(), password=None)
+
+
+def ingest_key(shared_secret: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=INGEST_KEY_INFO).derive(shared_secret)
+
+
+def unwrap_key(private_key, algorithm: str, encrypted_key: bytes, oaep_hash=hashes.SHA256) -> bytes:
+    # The AES key of an encrypted submission; encrypted_key is the RSA-OAEP ciphertext, or
+    # the ephemeral public key (uncompressed P-256 point, raw x25519 bytes) for EC tenants
+    if algorithm == RSA_2048:
+        return private_key.decrypt(
+            encrypted_key, padding.OAEP(mgf=padding.MGF1(algorithm=oaep_hash()), algorithm=oaep_hash(), label=None))
+    if algorithm == ECDSA_P256:
+        peer = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), encrypted_key)
+        return ingest_key(private_key.exchange(ec.ECDH(), peer))
+    if algorithm == X25519:
+        return ingest_key(private_key.exchange(x25519.X25519PublicKey.from_public_bytes(encrypted_key)))
+    raise ValueError(f"{algorithm} keys cannot receive encrypted submissions")
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# database.py builds its engine at import time; point it at a scratch SQLite file first
+TEST_DIR = tempfile.mkdtemp(prefix="fastapi_app_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'app.db')}"
+# Image uploads, kept originals and rendered images go under the working directory
+os.chdir(TEST_DIR)
+
+
+@pytest.fixture(scope="session")
+def migrated_engine():
+    import main
+
+    main.run_migrations()
+    return main.engine
+
+
+@pytest.fixture(scope="session")
+def client(migrated_engine):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def management_admin(client):
+    # A management with one Admin user; returns (management id, auth headers)
+    def create(privilege="Admin"):
+        management_id = client.post("/management/", json={"name": "Scoped"}).json()["id"]
+        username = f"admin-{uuid.uuid4().hex}"
+        response = client.post("/create_management_users/", json={
+            "name": "n", "designation": "d", "password": "p", "username": username,
+            "privilege": privilege, "management_id": management_id})
+        assert response.status_code == 201, response.text
+        token = client.post("/login/", json={"username": username, "password": "p", "kind": "management"}) \
+            .json()["access_token"]
+        return management_id, {"Authorization": f"Bearer {token}"}
+    return create
+
+
+@pytest.fixture
+def serial_payload(client):
+    # A /create_serial body for a fresh management, machine model and customer
+    def create(**overrides):
+        management_id = client.post("/management/", json={"name": "Maker"}).json()["id"]
+        model_number = f"MODEL-{uuid.uuid4().hex[:8]}"
+        machine_id = client.post("/create_machines", json=dict(
+            machineName="n", model_number=model_number, description="d", default_warranty_months=12, phase="1",
+            volts="1", amps="1", frequency="1", sw_version="1", pcb_version="1", fw_version="1",
+            design_version="1", image="/static/images/none.jpg", make=management_id)).json()["id"]
+        customer_id = client.post("/customers/", json={"name": "Owner"}).json()["id"]
+        body = dict(serial_number=f"{model_number}-000001", date_of_manufacturing="2026-01-01", product_warranty="x",
+                    sw_version="1", pcb_version="1", fw_version="1", design_version="1", model_number=machine_id,
+                    customer_id=customer_id)
+        return {**body, **overrides}
+    return create
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+import auth
+from models import Customer, CustomerUserModel
+
+
+@pytest.fixture
+def session_factory(migrated_engine):
+    from database import SessionLocal
+
+    return SessionLocal
+
+
+@pytest.fixture
+def user(session_factory):
+    db = session_factory()
+    customer = Customer(name="Token Tenant")
+    db.add(customer)
+    db.flush()
+    row = CustomerUserModel(name="n", username=f"token-user-{customer.id}", password="x", designation="d",
+                            privilege="Engineer", customer_id=customer.id)
+    db.add(row)
+    db.commit()
+    user_id = row.id
+    db.close()
+    yield auth.find_user(session_factory, "customer", f"token-user-{customer.id}")
+    db = session_factory()
+    db.query(CustomerUserModel).filter(CustomerUserModel.id == user_id).delete()
+    db.commit()
+    db.close()
+
+
+def bump_token_version(session_factory, user_id):
+    db = session_factory()
+    db.execute(update(CustomerUserModel).where(CustomerUserModel.id == user_id)
+               .values(token_version=CustomerUserModel.token_version + 1))
+    db.commit()
+    db.close()
+
+
+def test_token_round_trip(session_factory, user):
+    token = auth.issue_token("customer", user)["access_token"]
+    claims = auth.verify_token(session_factory, token)
+    assert (claims["sub"], claims["tenant"], claims["ver"]) == (user.id, user.tenant_id, 0)
+
+
+def test_tampered_claims_fail_the_signature(session_factory, user):
+    header, _, signature = auth.issue_token("customer", user)["access_token"].split(".")
+    admin = SimpleNamespace(**{**user._mapping, "privilege": "Admin"})
+    other = auth.issue_token("customer", admin)["access_token"].split(".")[1]
+    with pytest.raises(auth.TokenError, match="invalid signature"):
+        auth.verify_token(session_factory, f"{header}.{other}.{signature}")
+
+
+def test_bumped_token_version_revokes_tokens(session_factory, user):
+    token = auth.issue_token("customer", user)["access_token"]
+    auth.verify_token(session_factory, token)
+    bump_token_version(session_factory, user.id)
+    # Still cached in this process until forget_user evicts it
+    assert auth.verify_token(session_factory, token)["sub"] == user.id
+    auth.forget_user("customer", user.id)
+    with pytest.raises(auth.TokenError, match="revoked"):
+        auth.verify_token(session_factory, token)
+    fresh = auth.find_user(session_factory, "customer", user.username)
+    assert auth.verify_token(session_factory, auth.issue_token("customer", fresh)["access_token"])["ver"] == 1
@@ -0,0 +1,16 @@
+from autocomplete import PrefixIndex
+
+
+def test_add_many_matches_one_by_one_adds():
+    labels = [(i, f"Customer {i} Textiles Ltd") for i in range(0, 300, 3)]
+    one_by_one = PrefixIndex(word_prefixes=True)
+    batched = PrefixIndex(word_prefixes=True)
+    for item_id, label in labels[:50]:
+        one_by_one.add(item_id, label)
+        batched.add(item_id, label)
+    for item_id, label in labels[50:] + [(0, "Renamed Mills")]:
+        one_by_one.add(item_id, label)
+    batched.add_many(labels[50:] + [(0, "Renamed Mills")])
+    assert batched._entries == one_by_one._entries
+    assert batched.search("ltd", limit=500) == one_by_one.search("ltd", limit=500)
+    assert batched.search("renamed") == [{"id": 0, "label": "Renamed Mills"}]
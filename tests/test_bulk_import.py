@@ -0,0 +1,19 @@
+import json
+
+import main
+
+
+def test_bulk_import_records_one_change(client, serial_payload):
+    first = serial_payload()
+    rows = [first, {**first, "serial_number": first["serial_number"].replace("000001", "000002")}]
+    upload = "\n".join(json.dumps(row) for row in rows)
+    last_seq = main.recent_changes[-1][1]["seq"] if main.recent_changes else 0
+    response = client.post("/serial/bulk_import", files={"file": ("serials.ndjson", upload)})
+    assert response.json()["inserted"] == 2
+
+    changes = [(owner, change) for owner, change in main.recent_changes if change["seq"] > last_seq]
+    assert len(changes) == 1
+    owner, change = changes[0]
+    assert owner is None
+    assert (change["entity"], change["id"], change["count"]) == ("serial", None, 2)
+    assert {"serial_number", "warranty_end_date"} <= set(change["fields"])
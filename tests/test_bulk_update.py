@@ -0,0 +1,32 @@
+import main
+
+
+def test_bulk_update_runs_in_chunks_and_records_one_change(client, serial_payload, monkeypatch):
+    monkeypatch.setattr(main, "BULK_UPDATE_CHUNK_SIZE", 2)
+    body = serial_payload()
+    numbers = [body["serial_number"].replace("000001", f"00000{n}") for n in range(1, 5)]
+    for number in numbers:
+        client.post("/create_serial", json={**body, "serial_number": number})
+    # One serial already runs other firmware and stays out of the rollout
+    last = client.get(f"/serial/by_number/{numbers[3]}").json()["serial_id"]
+    client.patch(f"/serial/{last}", json={"fw_version": "0.9"})
+    seq = main.recent_changes[-1][1]["seq"]
+
+    rollout = {"filter": {"model_number": body["model_number"], "fw_versions": ["1"]}, "values": {"fw_version": "2"}}
+    assert client.post("/serial/bulk_update", json=rollout).json() == \
+        {"updated": 3, "chunks": 2, "values": {"fw_version": "2"}}
+    changes = [change for _, change in main.recent_changes if change["seq"] > seq]
+    assert [(change["entity"], change["id"], change["count"], change["fields"]) for change in changes] == \
+        [("serial", None, 3, ["fw_version"])]
+    assert [client.get(f"/serial/by_number/{number}").json()["fw_version"] for number in numbers] == \
+        ["2", "2", "2", "0.9"]
+
+    # A retried rollout finds nothing left to do; widening the filter only touches the straggler
+    assert client.post("/serial/bulk_update", json=rollout).json()["updated"] == 0
+    assert client.post("/serial/bulk_update", json={**rollout, "filter": {"model_number": body["model_number"]}}) \
+        .json()["updated"] == 1
+
+
+def test_bulk_update_needs_a_filter_and_values(client):
+    assert client.post("/serial/bulk_update", json={"filter": {}, "values": {"fw_version": "2"}}).status_code == 400
+    assert client.post("/serial/bulk_update", json={"filter": {"model_number": 1}, "values": {}}).status_code == 400
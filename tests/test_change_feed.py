@@ -0,0 +1,57 @@
+import uuid
+
+import main
+
+
+def new_machine(client, make):
+    return client.post("/create_machines", json=dict(
+        machineName="n", model_number=f"MODEL-{uuid.uuid4().hex[:8]}", description="d", default_warranty_months=12,
+        phase="1", volts="1", amps="1", frequency="1", sw_version="1", pcb_version="1", fw_version="1",
+        design_version="1", image="/static/images/none.jpg", make=make)).json()["id"]
+
+
+def changes_after(seq):
+    return [change for _, change in main.recent_changes if change["seq"] > seq]
+
+
+def last_seq():
+    return main.recent_changes[-1][1]["seq"] if main.recent_changes else 0
+
+
+def next_changes(websocket):
+    # Writes that record no change still wake the feed; skip those empty pushes
+    while True:
+        message = websocket.receive_json()
+        assert message["event"] == "machine_data_updated"
+        if message["changes"]:
+            return message["changes"]
+
+
+def test_patch_touches_only_the_sent_columns(client, serial_payload):
+    body = serial_payload()
+    serial_id = client.post("/create_serial", json=body).json()["id"]
+    seq = last_seq()
+    unchanged = client.patch(f"/serial/{serial_id}", json={"sw_version": body["sw_version"]}).json()
+    assert unchanged["changed"] is False and changes_after(seq) == []
+    assert client.patch(f"/serial/{serial_id}", json={}).json()["changed"] is False
+
+    patched = client.patch(f"/serial/{serial_id}", json={"sw_version": "2.0"}).json()
+    assert (patched["changed"], patched["values"]) == (True, {"sw_version": "2.0"})
+    [change] = changes_after(seq)
+    assert (change["entity"], change["id"], change["fields"]) == ("serial", serial_id, ["sw_version"])
+    # Warranty inputs bring the recomputed end date along
+    patched = client.patch(f"/serial/{serial_id}", json={"additional_warranty_months": 6}).json()
+    assert set(patched["values"]) == {"additional_warranty_months", "warranty_end_date"}
+    assert client.patch("/serial/999999999", json={"sw_version": "3"}).status_code == 404
+
+
+def test_websocket_pushes_only_the_callers_changes(client, management_admin):
+    own_make, headers = management_admin()
+    other_make, _ = management_admin()
+    own_machine, other_machine = new_machine(client, own_make), new_machine(client, other_make)
+    token = headers["Authorization"].split()[1]
+    with client.websocket_connect(f"/ws/machines/?token={token}") as websocket:
+        client.patch(f"/machines/{other_machine}/", json={"description": "theirs"})
+        client.patch(f"/machines/{own_machine}/", json={"description": "ours"})
+        [change] = next_changes(websocket)
+    assert (change["entity"], change["id"], change["fields"]) == ("machine_model", own_machine, ["description"])
@@ -0,0 +1,85 @@
+import asyncio
+import base64
+import json
+import os
+
+import pytest
+from cryptography.hazmat.primitives import hashes, padding as sym_padding, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, x25519
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from encrypted_ingest import DecryptBatcher, DecryptionError
+from tenant_keys import ECDSA_P256, ED25519, RSA_2048, X25519, generate_key_pair, ingest_key
+
+SUBMISSION = json.dumps({"functionCode": "Running List", "data": [{"id": 1}]}).encode()
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def wrap_key(algorithm: str, public_pem: str):
+    # What a controller does: returns (AES key, encrypted_key field)
+    public_key = serialization.load_pem_public_key(public_pem.encode())
+    if algorithm == RSA_2048:
+        aes_key = os.urandom(32)
+        return aes_key, public_key.encrypt(aes_key, padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                                                                 algorithm=hashes.SHA256(), label=None))
+    if algorithm == ECDSA_P256:
+        ephemeral = ec.generate_private_key(ec.SECP256R1())
+        return ingest_key(ephemeral.exchange(ec.ECDH(), public_key)), ephemeral.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    ephemeral = x25519.X25519PrivateKey.generate()
+    return ingest_key(ephemeral.exchange(public_key)), ephemeral.public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+
+def encrypt(aes_key: bytes, mode: str):
+    if mode == "gcm":
+        nonce = os.urandom(12)
+        return nonce, AESGCM(aes_key).encrypt(nonce, SUBMISSION, None)
+    iv = os.urandom(16)
+    padder = sym_padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv)).encryptor()
+    return iv, encryptor.update(padder.update(SUBMISSION) + padder.finalize()) + encryptor.finalize()
+
+
+def encrypted_item(algorithm: str, mode: str, key_pair: dict) -> tuple:
+    aes_key, encrypted_key = wrap_key(algorithm, key_pair["public_key"])
+    iv, ciphertext = encrypt(aes_key, mode)
+    return (f"test:{algorithm}", algorithm, key_pair["private_key"], b64(encrypted_key), b64(iv), b64(ciphertext))
+
+
+@pytest.mark.parametrize("algorithm", [RSA_2048, ECDSA_P256, X25519])
+def test_batcher_round_trip(algorithm):
+    key_pair = generate_key_pair(algorithm)
+
+    async def run():
+        # No started pool: batches run on the default executor, through the same decrypt_batch
+        batcher = DecryptBatcher()
+        items = [encrypted_item(algorithm, mode, key_pair) for mode in ("gcm", "cbc")]
+        return await asyncio.gather(*(batcher.decrypt(item) for item in items)), batcher.batches
+
+    results, batches = asyncio.run(run())
+    assert results == [SUBMISSION, SUBMISSION]
+    assert batches == 1
+
+
+def test_batcher_rejects_keys_that_cannot_unwrap():
+    key_pair = generate_key_pair(ED25519)
+    item = ("test:ed25519", ED25519, key_pair["private_key"], b64(b"x" * 32), b64(b"n" * 12), b64(b"c" * 32))
+    with pytest.raises(DecryptionError, match="cannot receive"):
+        asyncio.run(DecryptBatcher().decrypt(item))
+
+
+def test_submit_encrypted_for_a_default_tenant(client):
+    customer = client.post("/customers/", json={"name": "Encrypted"}).json()
+    assert customer["key_algorithm"] == ECDSA_P256
+    aes_key, encrypted_key = wrap_key(customer["key_algorithm"], customer["public_key"])
+    iv, ciphertext = encrypt(aes_key, "gcm")
+    response = client.post("/submit/encrypted", json={
+        "customer_id": customer["id"], "encrypted_key": b64(encrypted_key), "iv": b64(iv),
+        "encrypted_data": b64(ciphertext)})
+    assert response.status_code == 200, response.text
+    assert response.json()["functionCode"] == "Running List"
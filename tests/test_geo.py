@@ -0,0 +1,50 @@
+import math
+
+import pytest
+
+from geo import EARTH_RADIUS_KM, bounding_box, covering_prefixes, encode, haversine_km, parse_coordinate
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12.97", 12.97),
+    ("-12.97", -12.97),
+    ("12.6548 S", -12.6548),
+    ("S 12.6548", -12.6548),
+    ("98.0214 N", 98.0214),
+    ("77.59°E", 77.59),
+    (".5w", -0.5),
+    ("", None),
+    (None, None),
+    (7, 7.0),
+])
+def test_parse_coordinate(value, expected):
+    assert parse_coordinate(value) == expected
+
+
+@pytest.mark.parametrize("value", ["abc", "N 12 S", "-3 S", "1e5"])
+def test_parse_coordinate_rejects(value):
+    with pytest.raises(ValueError):
+        parse_coordinate(value)
+
+
+def destination(latitude, longitude, bearing_degrees, distance_km):
+    angular = distance_km / EARTH_RADIUS_KM
+    phi, lam, theta = math.radians(latitude), math.radians(longitude), math.radians(bearing_degrees)
+    phi2 = math.asin(math.sin(phi) * math.cos(angular) + math.cos(phi) * math.sin(angular) * math.cos(theta))
+    lam2 = lam + math.atan2(math.sin(theta) * math.sin(angular) * math.cos(phi),
+                            math.cos(angular) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), (math.degrees(lam2) + 540) % 360 - 180
+
+
+@pytest.mark.parametrize("latitude, longitude, radius_km", [
+    (11.0, 77.0, 50), (60.0, 10.0, 500), (-45.0, 179.9, 200), (0.0, 0.0, 1), (85.0, -30.0, 300),
+])
+def test_points_on_the_radius_fall_inside_the_prefilter(latitude, longitude, radius_km):
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    for bearing in range(0, 360, 5):
+        point_lat, point_lon = destination(latitude, longitude, bearing, radius_km * 0.99999)
+        assert haversine_km(latitude, longitude, point_lat, point_lon) <= radius_km
+        unwrapped_lon = point_lon + 360 * round((longitude - point_lon) / 360)
+        assert min_lat <= point_lat <= max_lat and min_lon <= unwrapped_lon <= max_lon, (bearing, point_lat, point_lon)
+        assert encode(point_lat, point_lon).startswith(tuple(prefixes)), (bearing, point_lat, point_lon)
@@ -0,0 +1,36 @@
+import uuid
+
+from database import SessionLocal
+from models import SerialNumbers
+
+
+def test_repeated_create_serial_is_idempotent_only_for_the_same_row(client, serial_payload):
+    body = serial_payload()
+    first = client.post("/create_serial", json=body)
+    assert first.status_code == 200
+    assert client.post("/create_serial", json=body).json()["id"] == first.json()["id"]
+
+    other_customer = client.post("/customers/", json={"name": "Someone else"}).json()["id"]
+    for changed in ({"customer_id": other_customer}, {"date_of_manufacturing": "2025-01-01"}):
+        assert client.post("/create_serial", json={**body, **changed}).status_code == 409
+    db = SessionLocal()
+    try:
+        stored = db.query(SerialNumbers).filter(SerialNumbers.id == first.json()["id"]).one()
+        assert (stored.customer_id, stored.date_of_manufacturing.isoformat()) == \
+            (body["customer_id"], body["date_of_manufacturing"])
+    finally:
+        db.close()
+
+
+def test_idempotency_keys_are_per_tenant(client, management_admin):
+    _, first_admin = management_admin()
+    _, second_admin = management_admin()
+    key = {"Idempotency-Key": uuid.uuid4().hex}
+    created = client.post("/customers/", json={"name": "Keyed"}, headers={**first_admin, **key})
+    replayed = client.post("/customers/", json={"name": "Keyed"}, headers={**first_admin, **key})
+    assert replayed.headers.get("Idempotent-Replayed") == "true"
+    assert replayed.json()["id"] == created.json()["id"]
+
+    elsewhere = client.post("/customers/", json={"name": "Keyed"}, headers={**second_admin, **key})
+    assert "Idempotent-Replayed" not in elsewhere.headers
+    assert elsewhere.json()["id"] != created.json()["id"]
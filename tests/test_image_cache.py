@@ -0,0 +1,76 @@
+import asyncio
+import io
+import os
+
+from PIL import Image
+
+import image_store
+import main
+from image_cache import DiskCache, render_key
+from test_images import photo, upload, wait_for_file
+
+
+def writer(size, calls):
+    async def render(dest):
+        calls.append(dest)
+        await asyncio.sleep(0.01)
+        with open(dest, "wb") as f:
+            f.write(b"x" * size)
+    return render
+
+
+def test_concurrent_requests_share_one_render(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_render("a.webp", writer(10, calls)) for _ in range(3)))
+
+    assert asyncio.run(run()) == [cache.path("a.webp")] * 3
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["entries"], stats["bytes"]) == (1, 2, 1, 10)
+
+
+def test_evicts_least_recently_used_past_the_byte_budget(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    calls = []
+
+    async def run():
+        for name in ("a", "b", "a", "c"):
+            await cache.get_or_render(name, writer(100, calls))
+
+    asyncio.run(run())
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert (cache.stats()["hits"], cache.stats()["evictions"]) == (1, 1)
+
+    # A restarted process rebuilds the order from mtimes and enforces a smaller budget
+    os.utime(cache.path("a"), (1, 1))
+    reloaded = DiskCache(str(tmp_path), max_bytes=150)
+    reloaded.load()
+    assert os.listdir(tmp_path) == ["c"]
+
+
+def test_render_key_follows_the_source(tmp_path):
+    source = tmp_path / "original"
+    source.write_bytes(b"one")
+    key = render_key(str(source), 100, None, "webp")
+    assert key != render_key(str(source), 200, None, "webp") != render_key(str(source), 100, None, "jpeg")
+    source.write_bytes(b"second")
+    assert render_key(str(source), 100, None, "webp") != key
+
+
+def test_render_endpoint_caches_and_revalidates(client):
+    response = upload(client, photo())
+    machine_id = response.json()["id"]
+    wait_for_file(image_store.disk_path(response.json()["image"]))
+    rendered = client.get(f"/images/{machine_id}", params={"w": 120, "h": 60, "fmt": "webp"})
+    assert rendered.status_code == 200 and rendered.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(rendered.content)).height == 60
+    assert rendered.headers["cache-control"] == f"public, max-age={main.IMAGE_MAX_AGE_SECONDS}"
+    etag = rendered.headers["etag"]
+    assert client.get(f"/images/{machine_id}", params={"w": 120, "h": 60, "fmt": "webp"}).content == rendered.content
+    revalidated = client.get(f"/images/{machine_id}", params={"w": 120, "h": 60, "fmt": "webp"},
+                             headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.headers["etag"] == etag
+    assert client.get(f"/images/{machine_id}", params={"w": 5000}).status_code == 422
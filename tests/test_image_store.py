@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import image_store
+import images
+from database import SessionLocal
+from test_images import machine_form, photo, upload, wait_for_file
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def stored(client, data: bytes) -> dict:
+    response = upload(client, data)
+    assert response.status_code == 200, response.text
+    wait_for_file(images.variant_path(image_store.disk_path(response.json()["image"]), 800, "jpeg"))
+    return response.json()
+
+
+def test_identical_uploads_share_one_file_and_one_job(client):
+    data = photo()
+    first = stored(client, data)
+    assert first["image"] == image_store.web_path(image_store.content_path(image_store.content_digest(data)))
+    completed = images.image_processor.stats()["completed"]
+    second = stored(client, data)
+    assert second["image"] == first["image"] and second["id"] != first["id"]
+    assert images.image_processor.stats()["completed"] == completed
+
+
+def test_content_addressed_images_are_served_immutable(client):
+    image = stored(client, photo())["image"]
+    response = client.get(image)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == image_store.IMMUTABLE_CACHE_CONTROL
+    # Legacy paths can be overwritten in place, so the rest of /static keeps the default headers
+    with open(os.path.join(images.IMAGE_DIR, "legacy.jpg"), "wb") as f:
+        f.write(photo((10, 10)))
+    legacy = client.get("/static/images/legacy.jpg")
+    assert legacy.status_code == 200 and "immutable" not in legacy.headers.get("cache-control", "")
+
+
+def test_release_waits_for_the_last_reference_and_the_grace_period(client, db, monkeypatch):
+    shared = stored(client, photo())
+    make = client.post("/management/", json={"name": "Maker"}).json()["id"]
+    other = client.post("/create_machines", json={**machine_form(make), "default_warranty_months": 12,
+                                                  "make": make, "image": shared["image"]}).json()
+    path = image_store.disk_path(shared["image"])
+    files = [name for name in image_store.derived_files(path) if os.path.isfile(name)]
+    assert image_store.original_path(path) in files and len(files) > 2
+
+    # Still referenced by `other`
+    assert client.put(f"/machines/{shared['id']}/", json={**shared, "image": "/static/images/none.jpg"}).status_code == 200
+    assert all(os.path.isfile(name) for name in files)
+    assert image_store.release(db, shared["image"]) is False
+
+    # Unreferenced, but written moments ago: a concurrent upload may be about to claim it
+    assert client.put(f"/machines/{other['id']}/", json={**other, "image": "/static/images/none.jpg"}).status_code == 200
+    assert image_store.release(db, shared["image"]) is False and os.path.isfile(path)
+
+    monkeypatch.setattr(image_store, "RELEASE_GRACE_SECONDS", 0)
+    assert image_store.release(db, shared["image"]) is True
+    assert not any(os.path.isfile(name) for name in files)
+
+
+def test_replacing_an_image_releases_the_old_files(client, monkeypatch):
+    monkeypatch.setattr(image_store, "RELEASE_GRACE_SECONDS", 0)
+    machine = stored(client, photo())
+    old_path = image_store.disk_path(machine["image"])
+    form = {key: str(value) for key, value in machine.items()
+            if key not in ("id", "image", "image_srcset") and value is not None}
+    response = client.put(f"/update_machine_model/{machine['id']}/", data=form,
+                          files={"image": ("new.jpg", photo(), "image/jpeg")})
+    assert response.status_code == 200, response.text
+    assert response.json()["image"] != machine["image"]
+    assert not os.path.isfile(old_path)
@@ -0,0 +1,183 @@
+import io
+import os
+import time
+import uuid
+
+import pytest
+from PIL import Image
+
+import image_store
+import images
+from images import ImageProcessor, ImageQueueFull
+
+
+def photo(size=(1200, 900), image_format="JPEG") -> bytes:
+    # Noise, so no two test uploads share a content hash
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def machine_form(make, **overrides):
+    form = dict(machineName="n", model_number=f"MODEL-{uuid.uuid4().hex[:8]}", description="d",
+                default_warranty_months="12", phase="1", volts="1", amps="1", frequency="1", sw_version="1",
+                pcb_version="1", fw_version="1", design_version="1", make=str(make))
+    return {**form, **overrides}
+
+
+def upload(client, data: bytes, **form):
+    make = client.post("/management/", json={"name": "Maker"}).json()["id"]
+    return client.post("/upload_machine_model/", data=machine_form(make, **form),
+                       files={"image": ("photo.jpg", data, "image/jpeg")})
+
+
+def wait_for_file(path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.isfile(path):
+        assert time.monotonic() < deadline, f"{path} was never written"
+        time.sleep(0.05)
+
+
+def test_processor_queue_limit_counts_reservations():
+    processor = ImageProcessor(queue_limit=1)
+    processor.reserve()
+    with pytest.raises(ImageQueueFull):
+        processor.reserve()
+    processor.unreserve()
+    processor.reserve()
+    assert (processor.stats()["pending"], processor.stats()["rejected"]) == (1, 1)
+
+
+def test_upload_answers_before_the_image_is_processed(client):
+    response = upload(client, photo())
+    assert response.status_code == 200, response.text
+    path = image_store.disk_path(response.json()["image"])
+    wait_for_file(path)
+    with Image.open(path) as stored:
+        assert stored.format == "JPEG" and max(stored.size) == max(images.MAX_SIZE)
+
+
+def test_saturated_pool_answers_429(client, monkeypatch):
+    monkeypatch.setattr(images.image_processor, "queue_limit", 0)
+    form_model = f"MODEL-{uuid.uuid4().hex[:8]}"
+    response = upload(client, photo(), model_number=form_model)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(images.RETRY_AFTER_SECONDS)
+    assert form_model not in {row["model_number"] for row in client.get("/machines/").json()}
+
+
+@pytest.fixture
+def stored_jpeg(tmp_path, monkeypatch):
+    # A processed upload under tmp_path: (stored JPEG path, spooled source it came from)
+    monkeypatch.setattr(images, "ORIGINALS_DIR", str(tmp_path / "originals"))
+    source = tmp_path / "upload"
+    source.write_bytes(photo())
+    return images.compress_image(str(source), str(tmp_path / "images" / "model.jpg"))
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, ["jpeg"]),
+    ("*/*", ["jpeg"]),
+    ("image/webp,*/*;q=0.8", ["webp", "jpeg"]),
+    ("image/avif;q=0.9, image/webp", ["avif", "webp", "jpeg"]),
+    ("image/webp;q=0", ["jpeg"]),
+])
+def test_accepted_formats(accept, expected, monkeypatch):
+    monkeypatch.setattr(images, "ENABLED_FORMATS", ("avif", "webp", "jpeg"))
+    assert images.accepted_formats(accept) == expected
+
+
+def test_compress_image_writes_every_variant(stored_jpeg):
+    for width in images.VARIANT_WIDTHS:
+        for name in images.ENABLED_FORMATS:
+            with Image.open(images.variant_path(stored_jpeg, width, name)) as variant:
+                assert variant.width == width
+    srcset = images.image_srcset("/static/images/model.jpg")
+    assert set(srcset) == set(images.ENABLED_FORMATS)
+    assert srcset["jpeg"].startswith("/static/images/model_160w.jpg 160w, /static/images/model_320w.jpg 320w")
+
+
+def test_pick_variant_takes_the_smallest_wide_enough_in_the_best_format(stored_jpeg):
+    assert images.pick_variant(stored_jpeg, 200, "image/webp") == \
+        (images.variant_path(stored_jpeg, 320, "webp"), "image/webp")
+    assert images.pick_variant(stored_jpeg, 5000, "text/html") == \
+        (images.variant_path(stored_jpeg, 800, "jpeg"), "image/jpeg")
+    os.remove(images.variant_path(stored_jpeg, 320, "webp"))
+    assert images.pick_variant(stored_jpeg, 200, "image/webp")[1] == "image/jpeg"
+
+
+def test_backfill_writes_only_missing_variants(stored_jpeg):
+    assert images.backfill_variants(stored_jpeg) is False
+    os.remove(images.variant_path(stored_jpeg, 160, "jpeg"))
+    assert images.backfill_variants(stored_jpeg) is True
+    assert os.path.isfile(images.variant_path(stored_jpeg, 160, "jpeg"))
+    assert images.stored_images(os.path.dirname(stored_jpeg)) == [stored_jpeg]
+
+
+def test_machine_image_negotiates_on_accept(client):
+    response = upload(client, photo())
+    machine_id = response.json()["id"]
+    # The 800w JPEG is the job's last variant
+    wait_for_file(images.variant_path(image_store.disk_path(response.json()["image"]), 800, "jpeg"))
+    webp = client.get(f"/machines/{machine_id}/image", params={"w": 100}, headers={"Accept": "image/webp"})
+    assert webp.headers["content-type"] == "image/webp" and "Accept" in webp.headers["vary"]
+    assert Image.open(io.BytesIO(webp.content)).width == 160
+    assert client.get(f"/machines/{machine_id}/image").headers["content-type"] == "image/jpeg"
+
+
+def incoming_files():
+    return os.listdir(images.INCOMING_DIR) if os.path.isdir(images.INCOMING_DIR) else []
+
+
+def test_spool_upload_hashes_in_chunks_and_enforces_the_cap(monkeypatch):
+    monkeypatch.setattr(images, "UPLOAD_CHUNK_BYTES", 1000)
+    data = photo((64, 64))
+    path, digest = images.spool_upload(io.BytesIO(data))
+    try:
+        assert (open(path, "rb").read(), digest) == (data, image_store.content_digest(data))
+    finally:
+        images.discard(path)
+    before = incoming_files()
+    with pytest.raises(images.ImageTooLarge):
+        images.spool_upload(io.BytesIO(data), max_bytes=len(data) - 1)
+    assert incoming_files() == before
+
+
+def test_probe_refuses_bombs_before_decoding(tmp_path, monkeypatch):
+    path = tmp_path / "big.png"
+    Image.new("RGB", (200, 100)).save(path)
+    assert images.probe(str(path)) == ("PNG", (200, 100))
+    monkeypatch.setattr(images, "IMAGE_MAX_PIXELS", 10_000)
+    with pytest.raises(images.ImageTooLarge, match="200x100"):
+        images.probe(str(path))
+    (tmp_path / "text.jpg").write_text("not an image")
+    with pytest.raises(images.InvalidImage):
+        images.probe(str(tmp_path / "text.jpg"))
+
+
+def test_jpegs_decode_in_draft_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "ORIGINALS_DIR", str(tmp_path / "originals"))
+    monkeypatch.setattr(images, "write_variants", lambda image, path: None)
+    decoded = []
+    thumbnail = Image.Image.thumbnail
+
+    def recording_thumbnail(image, *args, **kwargs):
+        decoded.append(image.size)
+        return thumbnail(image, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "thumbnail", recording_thumbnail)
+    source = tmp_path / "upload"
+    Image.new("RGB", (6400, 6400), "red").save(source, format="JPEG")
+    path = images.compress_image(str(source), str(tmp_path / "model.jpg"))
+    # 1/4 scale still leaves thumbnail() twice MAX_SIZE to resample from
+    assert decoded == [(1600, 1600)]
+    assert Image.open(path).size == (800, 800)
+    assert not source.exists() and os.path.isfile(images.original_path(path))
+
+
+def test_oversized_and_invalid_uploads_are_refused(client, monkeypatch):
+    monkeypatch.setattr("main.IMAGE_UPLOAD_MAX_BYTES", 100)
+    assert upload(client, photo()).status_code == 413
+    monkeypatch.undo()
+    assert upload(client, b"not an image").status_code == 400
+    assert images.image_processor.stats()["pending"] == 0
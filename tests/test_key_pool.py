@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from key_pool import KeyPool, rsa_key_pool, take_key_pair
+from tenant_keys import ECDSA_P256, load_private_key
+
+def worker_pair():
+    # Runs in a pool process: the pid tells pooled pairs from inline ones
+    return {"pid": os.getpid()}
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_pool_that_never_started_generates_inline():
+    pool = KeyPool(worker_pair, low=1, high=2)
+    assert pool.take()["pid"] == os.getpid()
+    assert (pool.stats()["running"], pool.stats()["generated_inline"], len(pool)) == (False, 1, 0)
+
+
+@pytest.fixture
+def pool():
+    pool = KeyPool(worker_pair, low=1, high=3, workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_refills_to_the_high_watermark(pool):
+    pool.start()
+    wait_for(lambda: len(pool) == 3)
+    assert pool.take()["pid"] != os.getpid()
+    # Above the low watermark: no refill yet
+    assert pool.stats()["in_flight"] == 0 and len(pool) == 2
+    pool.take()
+    wait_for(lambda: len(pool) == 3)
+    stats = pool.stats()
+    assert (stats["generated"], stats["served_from_pool"], stats["generated_inline"]) == (5, 2, 0)
+
+
+def test_non_rsa_pairs_bypass_the_pool():
+    before = rsa_key_pool.stats()
+    key_pair = take_key_pair(ECDSA_P256)
+    assert isinstance(load_private_key(key_pair["private_key"]), ec.EllipticCurvePrivateKey)
+    after = rsa_key_pool.stats()
+    assert (after["served_from_pool"], after["generated_inline"]) == \
+        (before["served_from_pool"], before["generated_inline"])
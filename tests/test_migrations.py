@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from database import enable_sqlite_foreign_keys
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test.db")
+CHILD_TABLES = ("serial_numbers", "machine_model", "customer_user_model", "management_user_model",
+                "machine_details", "data_entries")
+
+
+def row_counts(engine, tables):
+    with engine.connect() as connection:
+        return {name: connection.execute(text(f"SELECT count(*) FROM {name}")).scalar() for name in tables}
+
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    # A database from before Alembic, on an engine that enforces foreign keys like the app's
+    path = tmp_path / "baseline.db"
+    shutil.copy(BASELINE_DB, path)
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_sqlite_foreign_keys)
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_keeps_child_rows(baseline_engine):
+    import main
+
+    before = row_counts(baseline_engine, CHILD_TABLES + ("customers", "management"))
+    main.run_migrations(baseline_engine)
+    assert row_counts(baseline_engine, CHILD_TABLES + ("customers", "management")) == before
+    assert row_counts(baseline_engine, ("serial_lookup",)) == {"serial_lookup": before["serial_numbers"]}
+    with baseline_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA foreign_key_check")).all() == []
+        # The pooled connection goes back to the app with enforcement on
+        assert connection.execute(text("PRAGMA foreign_keys")).scalar() == 1
+
+
+def test_upgrade_converts_hemisphere_coordinates_and_keeps_what_it_cannot(baseline_engine):
+    import main
+
+    main.run_migrations(baseline_engine)
+    with baseline_engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT id, latitude, longitude, latitude_raw, longitude_raw FROM customers ORDER BY id"
+        )).all()
+    # test.db holds "98.0214 N" / "12.6548 S": the longitude converts, the latitude is out of range
+    assert [tuple(row) for row in rows] == [
+        (1, None, -12.6548, "98.0214 N", None),
+        (2, 65.3245, -23.1548, None, None),
+    ]
@@ -0,0 +1,37 @@
+import sqlalchemy as sa
+
+from models import MigrationCheckpoint
+from online_migrations import backfill_in_chunks
+
+
+def make_engine():
+    engine = sa.create_engine("sqlite://")
+    metadata = sa.MetaData()
+    sa.Table("items", metadata, sa.Column("id", sa.Integer, primary_key=True), sa.Column("kind", sa.String(10)),
+             sa.Column("a", sa.Integer), sa.Column("b", sa.Integer))
+    metadata.create_all(engine)
+    MigrationCheckpoint.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO items (id, kind, a, b) VALUES (:id, :kind, 0, 0)"),
+                           [{"id": i, "kind": "x" if i % 2 else "y"} for i in range(1, 11)])
+    return engine
+
+
+def items(engine):
+    with engine.connect() as connection:
+        return connection.execute(sa.text("SELECT id, kind, a, b FROM items ORDER BY id")).all()
+
+
+def test_values_mode_updates_only_rows_matching_where():
+    engine = make_engine()
+    done = backfill_in_chunks(engine, "t.values", "items", values={"a": sa.literal(1)},
+                              where=sa.column("kind") == "x", chunk_size=3, pause=0)
+    assert done == 5
+    assert [(row.kind, row.a) for row in items(engine)] == [("x" if i % 2 else "y", i % 2) for i in range(1, 11)]
+
+
+def test_transform_rows_may_return_different_columns():
+    engine = make_engine()
+    backfill_in_chunks(engine, "t.transform", "items", columns=["kind"], chunk_size=4, pause=0,
+                       transform=lambda row: {"a": row.id} if row.kind == "x" else {"b": row.id})
+    assert [(row.a, row.b) for row in items(engine)] == [(i, 0) if i % 2 else (0, i) for i in range(1, 11)]
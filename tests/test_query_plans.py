@@ -0,0 +1,10 @@
+import pytest
+
+from query_plans import HOT_QUERIES, explain, is_full_scan
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(migrated_engine, name):
+    with migrated_engine.connect() as connection:
+        plan = explain(connection, HOT_QUERIES[name])
+    assert not any(is_full_scan(line) for line in plan), f"{name}: {plan}"
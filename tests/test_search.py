@@ -0,0 +1,32 @@
+import uuid
+
+
+def hits(client, q, **params):
+    return {(hit["entity"], hit["id"]) for hit in client.get("/search", params={"q": q, **params}).json()["results"]}
+
+
+def test_search_follows_writes(client, serial_payload):
+    word = f"zq{uuid.uuid4().hex[:10]}"
+    customer_id = client.post("/customers/", json={"name": "Searchable", "address": f"12 {word} road"}).json()["id"]
+    body = serial_payload(product_warranty=f"{word} cover")
+    serial_id = client.post("/create_serial", json=body).json()["id"]
+    # Prefix match, across entities, with per-entity facets
+    response = client.get("/search", params={"q": word[:8]}).json()
+    assert {(hit["entity"], hit["id"]) for hit in response["results"]} == {("customer", customer_id),
+                                                                           ("serial", serial_id)}
+    assert response["facets"] == {"customer": 1, "serial": 1}
+    assert hits(client, word, entity="serial") == {("serial", serial_id)}
+    assert hits(client, f"{word} road") == {("customer", customer_id)}
+
+    client.patch(f"/customers/{customer_id}/", json={"address": "elsewhere"})
+    client.delete(f"/serial/{serial_id}")
+    assert hits(client, word) == set()
+
+
+def test_search_terms_cannot_carry_fts_syntax(client):
+    word = f"zq{uuid.uuid4().hex[:10]}"
+    customer_id = client.post("/customers/", json={"name": word}).json()["id"]
+    assert hits(client, f'{word} OR "NEAR(') == set()
+    assert hits(client, f'"{word}"*') == {("customer", customer_id)}
+    assert client.get("/search", params={"q": "--"}).json()["results"] == []
+    assert client.get("/search", params={"q": word, "entity": "nope"}).status_code == 400
@@ -0,0 +1,19 @@
+from serial_filter import SerialMembershipFilter
+
+
+def test_add_many_merges_into_sorted_hashes():
+    serial_filter = SerialMembershipFilter()
+    serial_filter.ready = True
+    serial_filter.add("SN-0")
+    serial_filter.add_many([f"SN-{i}" for i in range(1000)] + ["SN-5"])
+    assert len(serial_filter) == 1000
+    assert list(serial_filter._hashes) == sorted(serial_filter._hashes)
+    assert all(serial_filter.might_contain(f"SN-{i}") for i in range(1000))
+    assert not serial_filter.might_contain("SN-1000")
+
+
+def test_add_many_during_rebuild_is_replayed():
+    serial_filter = SerialMembershipFilter()
+    serial_filter._loading = True
+    serial_filter.add_many(["SN-1", "SN-2"])
+    assert serial_filter._pending and all(serial_filter._pending.values())
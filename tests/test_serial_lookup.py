@@ -0,0 +1,44 @@
+import uuid
+
+
+def test_lookup_follows_serial_model_and_customer_writes(client, serial_payload):
+    body = serial_payload(date_of_manufacturing="2020-01-01")
+    serial_id = client.post("/create_serial", json=body).json()["id"]
+    lookup = client.get(f"/serial/by_number/{body['serial_number']}").json()
+    assert (lookup["serial_id"], lookup["machine_model_id"], lookup["customer_id"], lookup["customer_name"]) == \
+        (serial_id, body["model_number"], body["customer_id"], "Owner")
+    assert (lookup["warranty_end_date"], lookup["warranty_status"]) == ("2021-01-01", "expired")
+    assert lookup["warranty_days_remaining"] < 0
+
+    client.patch(f"/customers/{body['customer_id']}/", json={"name": "Renamed owner"})
+    client.patch(f"/machines/{body['model_number']}/", json={"machineName": "Renamed model"})
+    client.patch(f"/serial/{serial_id}", json={"additional_warranty_months": 1200})
+    lookup = client.get(f"/serial/by_number/{body['serial_number']}").json()
+    assert (lookup["customer_name"], lookup["machineName"], lookup["warranty_status"]) == \
+        ("Renamed owner", "Renamed model", "active")
+
+    renamed = body["serial_number"] + "-R"
+    client.put(f"/serial/{serial_id}", json={**body, "serial_number": renamed})
+    assert client.get(f"/serial/by_number/{body['serial_number']}").status_code == 404
+    assert client.get(f"/serial/by_number/{renamed}").json()["serial_id"] == serial_id
+
+    client.delete(f"/serial/{serial_id}")
+    assert client.get(f"/serial/by_number/{renamed}").status_code == 404
+
+
+def customer_engineer(client, customer_id):
+    username = f"engineer-{uuid.uuid4().hex}"
+    client.post("/customer_users/", json={"name": "n", "designation": "d", "password": "p", "username": username,
+                                          "privilege": "Engineer", "customer_id": customer_id})
+    token = client.post("/login/", json={"username": username, "password": "p", "kind": "customer"}) \
+        .json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_lookup_is_scoped_to_the_callers_customer(client, serial_payload):
+    body = serial_payload()
+    client.post("/create_serial", json=body)
+    url = f"/serial/by_number/{body['serial_number']}"
+    assert client.get(url, headers=customer_engineer(client, body["customer_id"])).status_code == 200
+    other_customer = client.post("/customers/", json={"name": "Other"}).json()["id"]
+    assert client.get(url, headers=customer_engineer(client, other_customer)).status_code == 404
@@ -0,0 +1,19 @@
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from tenant_keys import KEY_ALGORITHMS, check_algorithm, generate_key_pair, load_private_key
+
+
+@pytest.mark.parametrize("algorithm", KEY_ALGORITHMS)
+def test_generated_pairs_match(algorithm):
+    key_pair = generate_key_pair(algorithm)
+    public_pem = load_private_key(key_pair["private_key"]).public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    assert public_pem == key_pair["public_key"]
+
+
+def test_unknown_algorithms_are_refused():
+    with pytest.raises(ValueError):
+        check_algorithm("dsa-1024")
+    with pytest.raises(ValueError):
+        generate_key_pair("dsa-1024")
@@ -0,0 +1,63 @@
+import pytest
+
+
+@pytest.fixture
+def two_managements(management_admin):
+    own, headers = management_admin()
+    other, _ = management_admin()
+    return own, other, headers
+
+
+def test_management_admin_cannot_touch_another_management(client, two_managements):
+    own, other, headers = two_managements
+    body = {"name": "Renamed"}
+    assert client.put(f"/management/{other}/", headers=headers, json=body).status_code == 404
+    assert client.patch(f"/management/{other}/", headers=headers, json=body).status_code == 404
+    assert client.post(f"/management/{other}/rotate_keys", headers=headers, json={}).status_code == 404
+    assert client.delete(f"/delete_management/{other}", headers=headers).status_code == 404
+    assert client.delete(f"/delete_management/{other}?background=true", headers=headers).status_code == 404
+    assert any(row["id"] == other for row in client.get("/management/").json())
+
+    assert client.put(f"/management/{own}/", headers=headers, json=body).status_code == 200
+    assert client.patch(f"/management/{own}/", headers=headers, json={"phone": "1"}).status_code == 200
+    assert client.post(f"/management/{own}/rotate_keys", headers=headers, json={}).status_code == 200
+
+
+def machine_body(model_number, make):
+    return dict(machineName="n", model_number=model_number, description="d", default_warranty_months=12, phase="1",
+                volts="1", amps="1", frequency="1", sw_version="1", pcb_version="1", fw_version="1",
+                design_version="1", image="/static/images/none.jpg", make=make)
+
+
+def test_machine_models_are_scoped_to_their_make(client, two_managements):
+    own, other, headers = two_managements
+    mine = client.post("/create_machines", json=machine_body(f"SCOPE-{own}", own)).json()["id"]
+    theirs = client.post("/create_machines", json=machine_body(f"SCOPE-{other}", other)).json()["id"]
+
+    assert [row["id"] for row in client.get("/machines/", headers=headers).json()] == [mine]
+    assert client.patch(f"/machines/{theirs}/", headers=headers, json={"description": "x"}).status_code == 404
+    assert client.put(f"/machines/{theirs}/", headers=headers,
+                      json=machine_body(f"SCOPE-{other}", own)).status_code == 404
+    assert client.put(f"/machines/{theirs}/serial_allocator", headers=headers, json={}).status_code == 404
+    assert client.delete(f"/machines/{theirs}/", headers=headers).status_code == 404
+    # Handing a model to another make, or upserting over another make's model_number
+    assert client.patch(f"/machines/{mine}/", headers=headers, json={"make": other}).status_code == 403
+    assert client.post("/create_machines", headers=headers,
+                       json=machine_body(f"SCOPE-{other}", own)).status_code == 403
+    assert client.post("/create_machines", headers=headers,
+                       json=machine_body(f"SCOPE-NEW-{own}", other)).status_code == 403
+
+    assert client.patch(f"/machines/{mine}/", headers=headers, json={"description": "x"}).status_code == 200
+
+
+def test_serial_blocks_only_from_own_models(client, two_managements):
+    own, other, headers = two_managements
+    mine = client.post("/create_machines", json=machine_body(f"BLOCK-{own}", own)).json()["id"]
+    theirs = client.post("/create_machines", json=machine_body(f"BLOCK-{other}", other)).json()["id"]
+    for machine_id in (mine, theirs):
+        assert client.put(f"/machines/{machine_id}/serial_allocator", json={}).status_code == 200
+
+    assert client.post(f"/machines/{theirs}/serial_blocks", headers=headers, json={"count": 5}).status_code == 404
+    assert client.get(f"/machines/{theirs}/serial_allocator").json()["next_seq"] == 1
+    block = client.post(f"/machines/{mine}/serial_blocks", headers=headers, json={"count": 5}).json()
+    assert (block["first_seq"], block["last_seq"]) == (1, 5)
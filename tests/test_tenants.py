@@ -0,0 +1,23 @@
+from database import SessionLocal
+from models import Customer
+
+
+def stored_keys(customer_id):
+    db = SessionLocal()
+    try:
+        return db.query(Customer.private_key, Customer.public_key, Customer.key_algorithm) \
+            .filter(Customer.id == customer_id).one()
+    finally:
+        db.close()
+
+
+def test_put_round_trip_keeps_the_key_pair(client):
+    customer_id = client.post("/customers/", json={"name": "Round Trip"}).json()["id"]
+    before = stored_keys(customer_id)
+    listed = next(row for row in client.get("/customers/").json() if row["id"] == customer_id)
+    assert "private_key" not in listed
+    # A client echoing (or planting) key fields cannot change the pair outside /rotate_keys
+    listed.update(name="Round Trip 2", private_key="planted", public_key="planted", key_algorithm="rsa-2048")
+    assert client.put(f"/customers/{customer_id}/", json=listed).status_code == 200
+    assert client.patch(f"/customers/{customer_id}/", json={"private_key": "planted"}).json()["changed"] is False
+    assert before.private_key and stored_keys(customer_id) == before
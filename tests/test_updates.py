@@ -0,0 +1,28 @@
+import uuid
+
+
+def machine_body(make, **overrides):
+    body = dict(machineName="n", model_number=f"MODEL-{uuid.uuid4().hex[:8]}", description="d",
+                default_warranty_months=12, phase="1", volts="1", amps="1", frequency="1", sw_version="1",
+                pcb_version="1", fw_version="1", design_version="1", image="/static/images/none.jpg", make=make)
+    return {**body, **overrides}
+
+
+def test_put_serial_onto_an_existing_serial_number_is_a_400(client, serial_payload):
+    first, second = serial_payload(), serial_payload()
+    client.post("/create_serial", json=first)
+    second_id = client.post("/create_serial", json=second).json()["id"]
+    response = client.put(f"/serial/{second_id}", json={**second, "serial_number": first["serial_number"]})
+    assert response.status_code == 400
+    # The session was rolled back: the next write on the same row still goes through
+    assert client.put(f"/serial/{second_id}", json={**second, "product_warranty": "y"}).status_code == 200
+
+
+def test_put_machine_onto_an_existing_model_number_is_a_400(client):
+    make = client.post("/management/", json={"name": "Maker"}).json()["id"]
+    first, second = machine_body(make), machine_body(make)
+    client.post("/create_machines", json=first)
+    second_id = client.post("/create_machines", json=second).json()["id"]
+    response = client.put(f"/machines/{second_id}/", json={**second, "model_number": first["model_number"]})
+    assert response.status_code == 400
+    assert client.put(f"/machines/{second_id}/", json={**second, "description": "e"}).status_code == 200
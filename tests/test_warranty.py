@@ -0,0 +1,26 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import Date, create_engine, literal, select
+
+from warranty import add_months, sql_add_months
+
+
+@pytest.mark.parametrize("start, months", [
+    (date(2024, 1, 31), 1),   # leap February
+    (date(2023, 1, 31), 1),
+    (date(2024, 3, 31), 1),
+    (date(2024, 12, 15), 1),  # year rollover
+    (date(2024, 8, 31), 18),
+    (date(2024, 2, 29), 12),
+    (date(2024, 5, 1), 0),
+])
+def test_sql_add_months_matches_python(start, months):
+    with create_engine("sqlite://").connect() as connection:
+        assert connection.execute(select(sql_add_months(literal(start, Date), months))).scalar() \
+            == add_months(start, months)
+
+
+def test_sql_add_months_keeps_null():
+    with create_engine("sqlite://").connect() as connection:
+        assert connection.execute(select(sql_add_months(literal(None, Date), 12))).scalar() is None
@@ -0,0 +1,28 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+
+def upsert(db: Session, model, values: dict, key: str, update_columns: Optional[Iterable[str]] = None) -> int:
+    """INSERT a row, or UPDATE the existing row with the same unique `key`; returns its id.
+
+    One statement either way, so a retried create never fails on the unique
+    index and never needs a read-before-write.
+    """
+    table = model.__table__
+    columns = [name for name in (update_columns if update_columns is not None else values) if name != key]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(table).values(**values)
+        # LAST_INSERT_ID(id) makes lastrowid report the existing row on the UPDATE branch too
+        stmt = stmt.on_duplicate_key_update(id=func.last_insert_id(table.c.id),
+                                            **{name: stmt.inserted[name] for name in columns})
+        return db.execute(stmt).lastrowid
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[key], set_={name: stmt.excluded[name] for name in columns})
+        return db.execute(stmt.returning(table.c.id)).scalar_one()
+    raise RuntimeError(f"upserts are not supported on {dialect}")
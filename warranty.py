@@ -0,0 +1,73 @@
+import calendar
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Date, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Formats seen in serial_numbers rows written before the DATE migration
+LEGACY_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d", "%m/%d/%Y")
+
+
+def add_months(start: date, months: int) -> date:
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    # 31 Jan + 1 month -> 28/29 Feb
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+class sql_add_months(FunctionElement):
+    # add_months() as a SQL expression: sql_add_months(date column, months expression)
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(sql_add_months, "mysql")
+def _add_months_mysql(element, compiler, **kw):
+    start, months = list(element.clauses)
+    # DATE_ADD clamps to the end of the month like add_months()
+    return f"DATE_ADD({compiler.process(start, **kw)}, INTERVAL ({compiler.process(months, **kw)}) MONTH)"
+
+
+@compiles(sql_add_months, "sqlite")
+def _add_months_sqlite(element, compiler, **kw):
+    start, months = list(element.clauses)
+    # date(d, '+N months') rolls 31 Jan + 1 month over to 3 Mar; shift the first of the
+    # month instead and cap the day at the last day of the target month
+    first = func.date(start, "start of month", func.printf("%+d months", months))
+    day = func.date(first, func.printf("+%d days", func.strftime("%d", start) - 1))
+    last = func.date(first, "+1 month", "-1 day")
+    return compiler.process(func.min(day, last), **kw)
+
+
+def warranty_end_date(date_of_manufacturing: Optional[date], default_warranty_months: int,
+                      additional_warranty_months: int = 0) -> Optional[date]:
+    if date_of_manufacturing is None:
+        return None
+    return add_months(date_of_manufacturing, (default_warranty_months or 0) + (additional_warranty_months or 0))
+
+
+def parse_legacy_date(value) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    # ISO timestamps ("2024-03-01T10:00:00") keep only the date part
+    value = value.split("T")[0].split(" ")[0]
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_legacy_int(value) -> int:
+    try:
+        return int(str(value).strip() or 0)
+    except (TypeError, ValueError):
+        return 0